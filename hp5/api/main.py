@@ -4,8 +4,9 @@ import time
 
 from api.routes import camera, gps, logs, compass, telemetry
 from api.utils.logger import logger
-
-from api.utils.pixhawk_port_detector import find_pixhawk_port
+from api.utils.camera_broker import camera_broker
+from api.utils import io_executor
+from api.utils.mavlink_manager import mavlink_manager
 
 app = FastAPI()
 
@@ -23,18 +24,21 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-#глобальная переменная с портом Pixhawk
-PIXHAWK_PORT = None
-
 #событие старта приложения
 @app.on_event("startup")
 async def startup_event():
-    global PIXHAWK_PORT
-    try:
-        PIXHAWK_PORT = find_pixhawk_port()
-        print(f"✅ Pixhawk найден на порту: {PIXHAWK_PORT}")
-    except Exception as e:
-        print(f"❌ Ошибка при поиске Pixhawk: {e}")
+    #менеджер ищет Pixhawk и переподключается в фоне, старт не ждет поиска
+    mavlink_manager.start()
+
+    #брокер камеры ищет устройство один раз, открывает его при первом подписчике
+    camera_broker.start()
+
+#событие остановки приложения
+@app.on_event("shutdown")
+async def shutdown_event():
+    camera_broker.shutdown()
+    mavlink_manager.stop()
+    io_executor.shutdown()
 
 #логирование запросов
 @app.middleware("http")
@@ -1,6 +1,7 @@
 from fastapi import APIRouter, Response, Query, Request, BackgroundTasks
 from fastapi.responses import StreamingResponse
-from modules.camera import Camera
+from api.utils.camera_broker import JPEG_QUALITY, camera_broker
+from api.utils.io_executor import run_io
 import time
 import cv2
 import asyncio
@@ -17,9 +18,11 @@ router = APIRouter(prefix="/camera", tags=["Camera"])
 
 
 #глобальные переменные для хранения состояния камеры
-cap = None
-streaming = False
+#номер поколения стримов, /stop увеличивает его и открытые стримы завершаются
+stream_generation = 0
 stress_test_running = False
+#сколько ждать новый кадр от брокера, с
+FRAME_TIMEOUT = 3.0
 
 class CommandRequest(BaseModel):
     command: str
@@ -40,7 +43,7 @@ async def handle_command(request: CommandRequest,background_tasks: BackgroundTas
         elif command == "start_stream":
             width = 640
             height = 480
-            return await camera_stream(request, width=width, height=height)
+            return await camera_stream(request, width=width, height=height, quality=JPEG_QUALITY)
 
         #обработка команды для остановки стрима
         elif command == "stop_stream":
@@ -52,7 +55,7 @@ async def handle_command(request: CommandRequest,background_tasks: BackgroundTas
 
         #обработка команды для получения трех кадров разного разрешения
         elif command == "combined-multi-capture":
-            return get_real_combined_resolutions()
+            return await get_real_combined_resolutions()
 
         #обработка команды для старта стресс теста
         elif command == "start_stress_test":
@@ -71,63 +74,40 @@ async def handle_command(request: CommandRequest,background_tasks: BackgroundTas
         return {"status": "error", "message": f"Ошибка: {str(e)}"}
 
 
-@router.get("/status")
-def camera_status():
+async def camera_call(func, timeout=None):
+    """Блокирующий обработчик в пуле камеры, по таймауту - ответ с ошибкой."""
     try:
-        cam = Camera()
-        cap = cv2.VideoCapture(cam.id)
+        return await run_io("camera", func, timeout=timeout)
+    except asyncio.TimeoutError:
+        logger.error(f"Камера не ответила: {func.__name__}")
+        return {"status": "error", "message": "Ошибка: камера не ответила вовремя"}
+
+
+@router.get("/status")
+async def camera_status():
+    return await camera_call(read_camera_status)
 
-        #проверка открытия камеры
-        if not cap.isOpened():
-            logger.error(f"Камера {cam.id} не доступна")
-            return {
-                "status": "fail",
-                "reason": "Камера не открывается"
-            }
 
-        #пытаемся захватить кадр с камеры
-        ret, frame = cap.read()
-        if not ret:
-            logger.error(f"Не удалось получить кадр с камеры {cam.id}")
+def read_camera_status():
+    try:
+        #кадр из общего буфера брокера, камера открывается только если еще закрыта
+        _, frame = camera_broker.snapshot()
+        if frame is None:
+            logger.error(f"Не удалось получить кадр с камеры {camera_broker.cap_id}")
             return {
                 "status": "fail",
                 "reason": "Не удалось получить кадр"
             }
 
-        #получаем параметры камеры
-        width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-        height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-        fps = cap.get(cv2.CAP_PROP_FPS)
-
-        #получаем кодек
-        codec = cap.get(cv2.CAP_PROP_FOURCC)
-
-        #проверка на фокус
-        try:
-            focus = cap.get(cv2.CAP_PROP_FOCUS)
-        except cv2.error:
-            focus = "Не поддерживается"
+        #параметры камеры брокер читает при открытии устройства
+        available_modes = dict(camera_broker.info)
 
-        if codec != 0:
-            codec_str = chr(int(codec) & 0xFF) + chr((int(codec) >> 8) & 0xFF) + chr((int(codec) >> 16) & 0xFF) + chr((int(codec) >> 24) & 0xFF)
-        else:
-            codec_str = "Не определен"
-
-        available_modes = {
-            "fps": fps,
-            "resolution": f"{width}x{height}",
-            "codec": codec_str,
-            "focus": focus
-        }
-
-        cap.release()  #освобождаем камеру
-
-        logger.info(f"Камера {cam.id} успешно инициализирована и прошла тест")
+        logger.info(f"Камера {camera_broker.cap_id} успешно инициализирована и прошла тест")
 
         return {
             "status": "ok",
             "message": "Камера успешно инициализирована и прошла тест",
-            "camera_id": cam.id,
+            "camera_id": camera_broker.cap_id,
             "modes": available_modes
         }
 
@@ -140,127 +120,114 @@ def camera_status():
 
 
 @router.get("/frame")
-def get_camera_frame():
+async def get_camera_frame():
+    return await camera_call(read_camera_frame)
+
+
+def read_camera_frame():
     try:
-        cam = Camera()
-        cap = cv2.VideoCapture(cam.id)
-        ret, frame = cap.read()
-        cap.release()
+        seq, frame = camera_broker.snapshot()
 
-        if not ret:
-            logger.error(f"Не удалось получить кадр с камеры {cam.id}")
+        if frame is None:
+            logger.error(f"Не удалось получить кадр с камеры {camera_broker.cap_id}")
             return {"status": "error", "message": "Не удалось получить кадр"}
 
-        #кодируем изображение в JPEG
-        ret, jpeg = cv2.imencode(".jpg", frame)
-        if not ret:
-            logger.error(f"Ошибка кодирования кадра с камеры {cam.id} в JPEG")
+        #кодируем изображение в JPEG, если стрим уже закодировал этот кадр - берем из кэша
+        _, jpeg = camera_broker.encode(seq, frame)
+        if jpeg is None:
+            logger.error(f"Ошибка кодирования кадра с камеры {camera_broker.cap_id} в JPEG")
             return {"status": "error", "message": "Ошибка кодирования JPEG"}
 
-        logger.info(f"Кадр с камеры {cam.id} успешно получен")
-        return Response(content=jpeg.tobytes(), media_type="image/jpeg")
+        logger.info(f"Кадр с камеры {camera_broker.cap_id} успешно получен")
+        return Response(content=jpeg, media_type="image/jpeg")
 
     except Exception as e:
         logger.error(f"Ошибка при получении кадра: {str(e)}")
         return {"status": "error", "message": f"Ошибка: {str(e)}"}
 
 
+async def next_frame(seq: int, fps: float):
+    """Ждет у брокера кадр новее seq, не блокируя event loop."""
+    deadline = time.monotonic() + FRAME_TIMEOUT
+    while time.monotonic() < deadline:
+        new_seq, frame, _ = camera_broker.latest()
+        if frame is not None and new_seq > seq:
+            return new_seq, frame
+        await asyncio.sleep(1 / fps / 2)
+    return seq, None
+
+
 @router.get("/stream")
 async def camera_stream(
     request: Request,
     width: int = Query(640, ge=160, le=1920),
-    height: int = Query(480, ge=120, le=1080)
+    height: int = Query(480, ge=120, le=1080),
+    quality: int = Query(JPEG_QUALITY, ge=10, le=100)
 ):
-    global cap, streaming
-    if streaming:
-        logger.info("Стрим уже запущен")
-        return {"message": "Stream already running"}
-
-    #устанавливаем флаг стрима в True
-    streaming = True
-    logger.info("Запуск стрима")
+    logger.info(f"Запуск стрима, зрителей: {camera_broker.subscribers + 1}")
 
     async def generate():
-        global cap, streaming
-        cam = Camera()
-        cap = cv2.VideoCapture(cam.id)
-
-        if not cap.isOpened():
-            logger.error(f"Не удалось открыть камеру {cam.id}")
-            yield (
-                b"--frame\r\n"
-                b"Content-Type: text/plain\r\n\r\n"
-                b"error: Camera not available\r\n"
-                b"\r\n"
-            )
-            return
-
-        cap.set(cv2.CAP_PROP_FRAME_WIDTH, width)
-        cap.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
-
-        try:
-            while streaming:
-                if await request.is_disconnected():
-                    logger.info("Клиент отключился от стрима")
-                    break
-
-                ret, frame = cap.read()
-                if not ret:
-                    logger.error(f"Не удалось получить кадр с камеры {cam.id}")
-                    yield (
-                        b"--frame\r\n"
-                        b"Content-Type: text/plain\r\n\r\n"
-                        b"error: No frame received\r\n"
-                        b"\r\n"
-                    )
-                    continue
+        generation = stream_generation
+        seq = 0
+        with camera_broker.subscribe():
+            try:
+                #все зрители читают один кадр из брокера, стрим останавливает /stop
+                while generation == stream_generation:
+                    if await request.is_disconnected():
+                        logger.info("Клиент отключился от стрима")
+                        break
+
+                    seq, frame = await next_frame(seq, camera_broker.fps)
+                    if frame is None:
+                        logger.error(f"Не удалось получить кадр с камеры {camera_broker.cap_id}")
+                        yield (
+                            b"--frame\r\n"
+                            b"Content-Type: text/plain\r\n\r\n"
+                            b"error: No frame received\r\n"
+                            b"\r\n"
+                        )
+                        continue
+
+                    #кадр кодируется один раз на уровень качества/разрешения для всех зрителей, вне event loop
+                    seq, jpeg = await run_io("camera", camera_broker.encode, seq, frame, quality, width, height)
+                    if jpeg is None:
+                        logger.error(f"Ошибка кодирования кадра с камеры {camera_broker.cap_id} в JPEG")
+                        yield (
+                            b"--frame\r\n"
+                            b"Content-Type: text/plain\r\n\r\n"
+                            b"error: JPEG encoding failed\r\n"
+                            b"\r\n"
+                        )
+                        continue
 
-                ret, jpeg = cv2.imencode(".jpg", frame)
-                if not ret:
-                    logger.error(f"Ошибка кодирования кадра с камеры {cam.id} в JPEG")
                     yield (
                         b"--frame\r\n"
-                        b"Content-Type: text/plain\r\n\r\n"
-                        b"error: JPEG encoding failed\r\n"
+                        b"Content-Type: image/jpeg\r\n\r\n" +
+                        jpeg +
                         b"\r\n"
                     )
-                    continue
 
+            except Exception as e:
+                logger.error(f"Ошибка при передаче фрейма: {str(e)}")
                 yield (
                     b"--frame\r\n"
-                    b"Content-Type: image/jpeg\r\n\r\n" +
-                    jpeg.tobytes() +
+                    b"Content-Type: text/plain\r\n\r\n" +
+                    b"error: " + str(e).encode() + b"\r\n"
                     b"\r\n"
                 )
 
-                logger.info(f"Кадр с камеры {cam.id} успешно передан")
-                await asyncio.sleep(1 / cam.fps_cam)
-
-        except Exception as e:
-            logger.error(f"Ошибка при передаче фрейма: {str(e)}")
-            yield (
-                b"--frame\r\n"
-                b"Content-Type: text/plain\r\n\r\n" +
-                b"error: " + str(e).encode() + b"\r\n"
-                b"\r\n"
-            )
-
-        finally:
-            cap.release()
-            cap = None
-            streaming = False
-            logger.info("Стрим остановлен")
+            finally:
+                logger.info("Стрим остановлен")
 
     return StreamingResponse(generate(), media_type="multipart/x-mixed-replace; boundary=frame")
 
 
 @router.get("/stop")
 def stop_stream():
-    global cap, streaming
-    if cap and cap.isOpened():
-        cap.release()
-        cap = None
-        streaming = False
+    global stream_generation
+    if camera_broker.subscribers:
+        #открытые стримы завершаются, камеру брокер закроет сам после ухода подписчиков
+        stream_generation += 1
         logger.info("Стрим остановлен и камера освобождена")
         return {"message": "Stream stopped and camera released"}
     else:
@@ -269,15 +236,16 @@ def stop_stream():
 
 
 @router.get("/save")
-def save_camera_frame():
+async def save_camera_frame():
+    return await camera_call(write_camera_frame)
+
+
+def write_camera_frame():
     try:
-        cam = Camera()
-        cap = cv2.VideoCapture(cam.id)
-        ret, frame = cap.read()
-        cap.release()
+        _, frame = camera_broker.snapshot()
 
-        if not ret:
-            logger.error(f"Не удалось получить кадр с камеры {cam.id}")
+        if frame is None:
+            logger.error(f"Не удалось получить кадр с камеры {camera_broker.cap_id}")
             return {"status": "error", "message": "Не удалось получить кадр"}
 
         #папка для сохранения снимков
@@ -291,7 +259,7 @@ def save_camera_frame():
 
         #сохраняем кадр
         cv2.imwrite(filepath, frame)
-        logger.info(f"Кадр с камеры {cam.id} сохранен как {filepath}")
+        logger.info(f"Кадр с камеры {camera_broker.cap_id} сохранен как {filepath}")
 
         return {
             "status": "ok",
@@ -304,61 +272,71 @@ def save_camera_frame():
         return {"status": "error", "message": f"Ошибка: {str(e)}"}
 
 #WebSocket для стрима с камеры
+#binary=true - JPEG бинарными сообщениями, иначе base64 текстом как раньше
 @router.websocket("/ws/stream")
-async def camera_websocket_stream(websocket: WebSocket):
+async def camera_websocket_stream(
+    websocket: WebSocket,
+    binary: bool = Query(False),
+    quality: int = Query(JPEG_QUALITY, ge=10, le=100),
+    width: int | None = Query(None, ge=160, le=1920),
+    height: int | None = Query(None, ge=120, le=1080),
+    fps: float = Query(10, gt=0, le=60)
+):
     await websocket.accept()
-    cam = Camera()
-    cap = cv2.VideoCapture(cam.id)
-
-    if not cap.isOpened():
-        await websocket.send_text("error: Camera not available")
-        await websocket.close()
-        return
+    generation = stream_generation
+    seq = 0
 
     try:
-        while True:
-            ret, frame = cap.read()
-            if not ret:
-                await websocket.send_text("error: No frame received")
-                continue
+        with camera_broker.subscribe():
+            #как и HTTP стримы, завершается по /stop
+            while generation == stream_generation:
+                seq, frame = await next_frame(seq, camera_broker.fps)
+                if frame is None:
+                    await websocket.send_text("error: No frame received")
+                    continue
 
-            ret, jpeg = cv2.imencode(".jpg", frame)
-            if not ret:
-                await websocket.send_text("error: JPEG encoding failed")
-                continue
+                seq, data = await run_io("camera", camera_broker.encode, seq, frame, quality, width, height, b64=not binary)
+                if data is None:
+                    await websocket.send_text("error: JPEG encoding failed")
+                    continue
 
-            frame_base64 = base64.b64encode(jpeg.tobytes()).decode('utf-8')
-            await websocket.send_text(frame_base64)  
+                if binary:
+                    await websocket.send_bytes(data)
+                else:
+                    await websocket.send_text(data)
+
+                await asyncio.sleep(1 / fps)
 
-            await asyncio.sleep(0.1)  
+        await websocket.close()
 
     except WebSocketDisconnect:
         print("Client disconnected")
 
+    except RuntimeError as e:
+        await websocket.send_text(f"error: {e}")
+        await websocket.close()
+
     finally:
-        cap.release()
-        cap = None
         print("WebSocket connection closed")
 
 
 @router.get("/combined-multi-capture")
-def get_real_combined_resolutions():
+async def get_real_combined_resolutions():
+    #три переключения разрешения, каждое ждет до двух кадров
+    return await camera_call(capture_combined_resolutions, timeout=30)
+
+
+def capture_combined_resolutions():
     try:
-        cam = Camera()
         resolutions = [(1920, 1080), (1280, 720), (640, 480)]
         captured_frames = []
 
         for width, height in resolutions:
-            cap = cv2.VideoCapture(cam.id)
-            cap.set(cv2.CAP_PROP_FRAME_WIDTH, width)
-            cap.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+            #без других зрителей брокер переключает разрешение на один кадр,
+            #иначе уменьшает кадр потока
+            frame = camera_broker.capture_at(width, height)
 
-            time.sleep(0.1)
-
-            ret, frame = cap.read()
-            cap.release()
-
-            if not ret:
+            if frame is None:
                 logger.warning(f"Не удалось получить кадр в разрешении {width}x{height}")
                 continue
 
@@ -395,28 +373,24 @@ def stop_stress_test():
 
 def run_camera_stress_test():
     global stress_test_running
-    cam = Camera()
 
     while stress_test_running:
         logger.info("Начинаем новый цикл стресс-теста камеры")
 
         try:
-            cap = cv2.VideoCapture(cam.id)
-            if not cap.isOpened():
-                logger.error("Ошибка: камера не открылась")
-                continue
-
-            successful_reads = 0
-            for i in range(10):
-                ret, frame = cap.read()
-                if not ret:
-                    logger.warning(f"Кадр {i+1}/10 не считался")
-                else:
-                    successful_reads += 1
-
-                time.sleep(0.5)  
+            with camera_broker.subscribe():
+                successful_reads = 0
+                seq = camera_broker.latest()[0]
+                for i in range(10):
+                    result = camera_broker.wait_next(seq)
+                    if result is None:
+                        logger.warning(f"Кадр {i+1}/10 не считался")
+                    else:
+                        seq = result[0]
+                        successful_reads += 1
+
+                    time.sleep(0.5)
 
-            cap.release()
             logger.info(f"Успешно считано {successful_reads}/10 кадров")
 
             if successful_reads < 10:
@@ -425,6 +399,6 @@ def run_camera_stress_test():
         except Exception as e:
             logger.error(f"Ошибка в цикле стресс-теста: {str(e)}")
 
-        time.sleep(10)  
+        time.sleep(10)
 
-    logger.info("Стресс-тест камеры остановлен")
\ No newline at end of file
+    logger.info("Стресс-тест камеры остановлен")
@@ -6,9 +6,11 @@ from api.utils.compass import (
 )
 from pydantic import BaseModel
 import logging
-from fastapi.concurrency import run_in_threadpool
+from api.utils.io_executor import run_io
+from api.utils.mavlink_manager import mavlink_manager
 from datetime import datetime
 import asyncio
+from functools import partial
 from pymavlink import mavutil
 
 # Настройка логгера
@@ -22,6 +24,11 @@ logger.addHandler(console_handler)
 
 router = APIRouter(prefix="/compass", tags=["compass"])
 
+# Тест вращения ждет ручных поворотов дрона, с
+ROTATION_TIMEOUT = 300
+# Ожидание ответа Pixhawk в live-тесте, с
+ATTITUDE_TIMEOUT = 3
+
 # Модель для POST-запроса
 class CompassCommandRequest(BaseModel):
     command: str
@@ -52,7 +59,7 @@ async def get_compass_status():
     Проверка подключения компаса с базовыми данными.
     """
     try:
-        status_data = await run_in_threadpool(get_basic_compass_status)
+        status_data = await run_io("mavlink", get_basic_compass_status)
         
         if status_data["connected"]:
             return {
@@ -82,7 +89,7 @@ async def test_rotation():
     Тест поворота компаса на 90° 4 раза.
     """
     try:
-        success, results = await run_in_threadpool(test_compass_rotation)
+        success, results = await run_io("mavlink", test_compass_rotation, timeout=ROTATION_TIMEOUT)
 
         if success:
             return {
@@ -116,7 +123,7 @@ async def handle_compass_command(request: CompassCommandRequest):
     command = request.command.lower()
 
     if command == "status":
-        status_data = await run_in_threadpool(get_basic_compass_status)
+        status_data = await run_io("mavlink", get_basic_compass_status)
 
         if status_data["connected"]:
             return {
@@ -133,7 +140,7 @@ async def handle_compass_command(request: CompassCommandRequest):
             }
 
     elif command == "test-rotation":
-        result, data = await run_in_threadpool(test_compass_rotation)
+        result, data = await run_io("mavlink", test_compass_rotation, timeout=ROTATION_TIMEOUT)
         
         if result:
             return {
@@ -150,7 +157,7 @@ async def handle_compass_command(request: CompassCommandRequest):
 
     elif command == "yaw":
         try:
-            yaw_value = await run_in_threadpool(get_compass_yaw)
+            yaw_value = await run_io("mavlink", get_compass_yaw)
             return {
                 "status": "ok",
                 "yaw": yaw_value,
@@ -178,20 +185,19 @@ async def live_test_rotation(websocket: WebSocket):
         # сообщение клиенту, что подключение установлено
         await websocket.send_text("Подключение установлено, начинаем тестирование поворота компаса...")
 
-        port = find_pixhawk_port()
+        # общий менеджер MAVLink уже держит соединение, ждем его в пуле mavlink
+        port = await run_io("mavlink", find_pixhawk_port)
         if not port:
             await websocket.send_text("Ошибка: не удалось найти порт для Pixhawk.")
             return
-        connection = mavutil.mavlink_connection(port)
-        connection.wait_heartbeat()
 
         # повороты на 90 (4 раза)
         for i in range(1, 5):
             await websocket.send_text(f"Поворот {i*90}° в процессе...")
             # отправляем команду на поворот
-            connection.mav.command_long_send(
-                connection.target_system, 
-                connection.target_component,
+            mavlink_manager.mav.command_long_send(
+                mavlink_manager.target_system,
+                mavlink_manager.target_component,
                 mavutil.mavlink.MAV_CMD_CONDITION_YAW,
                 0,  # confirmation
                 i*90,  # угол поворота
@@ -203,7 +209,13 @@ async def live_test_rotation(websocket: WebSocket):
             await asyncio.sleep(5) 
 
             # получаем текущий угол компаса
-            current_yaw = connection.recv_match(type='ATTITUDE', blocking=True).yaw
+            attitude = await run_io(
+                "mavlink", partial(mavlink_manager.wait_for, 'ATTITUDE', timeout=ATTITUDE_TIMEOUT)
+            )
+            if attitude is None:
+                await websocket.send_text(f"Поворот {i*90}°: нет данных ATTITUDE")
+                continue
+            current_yaw = attitude.yaw
             await websocket.send_text(f"Поворот {i*90}° завершен. Текущий угол компаса: {current_yaw * 180 / 3.14159:.2f}°")
 
         await websocket.send_text("Тестирование компаса завершено.")
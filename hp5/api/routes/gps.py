@@ -2,8 +2,12 @@ from fastapi import APIRouter
 from threading import Event, Thread
 from queue import Queue, Empty
 from utils import gps_utils
+from api.utils.io_executor import run_io
+import asyncio
+import math
 import time
 import logging
+import cfg
 from pydantic import BaseModel
 
 router = APIRouter()
@@ -19,11 +23,11 @@ async def handle_gps_command(request: GPSRequest):
 
         # Обработка команды для статуса GPS
         if command == "status":
-            return get_gps_status()
+            return await get_gps_status()
 
         # Обработка команды для теста GPS
         elif command == "test":
-            return test_gps_connection()
+            return await test_gps_connection()
 
         else:
             logger.warning(f"Unknown command: {command}")
@@ -43,7 +47,13 @@ BAUDRATE = 115200
 stop_event = Event()
 gps_queue = Queue(maxsize=1)
 
-gps_reader = gps_utils.GPSData(device=DEVICE_PATH, rate_ms=RATE_MS, baudrate=BAUDRATE)
+#тот же режим приемника, что и у main.py, иначе каждый процесс
+#перенастраивает ublox под себя и заново пишет flash
+GPS_MODE_ARGS = {"fast": cfg.GPS_FAST_PARSER, "binary": cfg.GPS_BINARY}
+#сколько ждать фикс при тестовом чтении, с
+TEST_READ_TIMEOUT = 3
+
+gps_reader = gps_utils.GPSData(device=DEVICE_PATH, rate_ms=RATE_MS, baudrate=BAUDRATE, **GPS_MODE_ARGS)
 
 # Настройка логирования
 logging.basicConfig(level=logging.INFO)
@@ -52,46 +62,53 @@ logger = logging.getLogger(__name__)
 def gps_worker():
     while not stop_event.is_set():
         try:
-            gps_reader._stream.reset_input_buffer()
-            _, parsed = gps_reader._ublox_m8n.read()
-            
-            if parsed:
+            #парсер получает весь поток, буфер не сбрасываем
+            fixes = gps_reader.read_fixes()
+
+            if fixes:
+                #в очереди только последний фикс
                 try:
-                    gps_queue.put(parsed, timeout=1)
-                    logger.info(f"GPS data received: {parsed}")
-                except:
-                    pass  # Игнорируем ошибку, если очередь заполнена
-            else:
-                logger.warning("No data received from GPS")
+                    gps_queue.get_nowait()
+                except Empty:
+                    pass
+                gps_queue.put(fixes[-1])
+                logger.debug(f"GPS data received: {fixes[-1]}")
 
         except Exception as e:
             logger.error(f"Error while reading GPS data: {e}")
-        
-        # Задержка между запросами
-        time.sleep(RATE_MS / 1000)
+            time.sleep(RATE_MS / 1000)
 
 # Запуск фонового потока
 Thread(target=gps_worker, daemon=True).start()
 
 def extract_gps_data(parsed):
     """
-    Извлекает данные из парсированного GPS объекта
+    Извлекает данные из фикса GPSFix
     """
-    def safe_get(attr):
-        val = getattr(parsed, attr, None)
-        return val() if callable(val) else val
-
     return {
-        "identity": safe_get("identity"),
-        "latitude": safe_get("lat"),
-        "longitude": safe_get("lon"),
-        "altitude": safe_get("alt"),
-        "speed": safe_get("speed"),
-        "satellites": safe_get("satellites"),
+        "identity": "NAV-PVT" if cfg.GPS_BINARY else "NMEA",
+        "latitude": parsed.lat,
+        "longitude": parsed.lon,
+        "altitude": parsed.alt,
+        "speed": math.hypot(parsed.veln, parsed.vele) if parsed.vel_valid else None,
+        "satellites": parsed.num_sv,
     }
 
+async def gps_call(func, timeout=None):
+    """Блокирующий обработчик в пуле GPS, по таймауту - ответ с ошибкой."""
+    try:
+        return await run_io("gps", func, timeout=timeout)
+    except asyncio.TimeoutError:
+        logger.error(f"GPS не ответил: {func.__name__}")
+        return {"status": "error", "detail": "GPS did not respond in time"}
+
+
 @router.get("/status")
-def get_gps_status():
+async def get_gps_status():
+    return await gps_call(read_gps_status)
+
+
+def read_gps_status():
     """
     Статус GPS: пытаемся получить данные из очереди
     """
@@ -125,15 +142,27 @@ def get_gps_status():
     }
 
 @router.get("/test")
-def test_gps_connection():
+async def test_gps_connection():
+    #настройка приемника при первом подключении может занять несколько секунд
+    return await gps_call(run_gps_test, timeout=30)
+
+
+def run_gps_test():
     """
     Одноразовое ручное чтение, например, если нужно форсированно протестировать GPS.
     """
     try:
         # Создаем временный экземпляр GPS для одноразового чтения
-        temp_reader = gps_utils.GPSData(device=DEVICE_PATH, rate_ms=RATE_MS, baudrate=BAUDRATE)
-        temp_reader._stream.reset_input_buffer()
-        _, parsed = temp_reader._ublox_m8n.read()
+        temp_reader = gps_utils.GPSData(device=DEVICE_PATH, rate_ms=RATE_MS, baudrate=BAUDRATE, **GPS_MODE_ARGS)
+        parsed = None
+        deadline = time.monotonic() + TEST_READ_TIMEOUT
+        try:
+            while parsed is None and time.monotonic() < deadline:
+                fixes = temp_reader.read_fixes()
+                if fixes:
+                    parsed = fixes[-1]
+        finally:
+            temp_reader._stream.close()
 
         if not parsed:
             logger.warning("No data received during test.")
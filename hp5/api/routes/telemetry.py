@@ -1,8 +1,13 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, Query, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
 from datetime import datetime
-from pymavlink import mavutil
+import asyncio
+from contextlib import aclosing
+import json
 import logging
 import threading
+from api.utils.io_executor import run_io
+from api.utils.mavlink_manager import mavlink_manager
 import time
 
 router = APIRouter(prefix="/telemetry", tags=["telemetry"])
@@ -15,61 +20,75 @@ logging.basicConfig(
 )
 
 # Глобальные переменные
-connection = None
 telemetry_data = {}
 is_collecting = False
-collect_thread = None
+subscription = None
+# Ожидание подключения менеджера MAVLink, с
+CONNECT_TIMEOUT = 10
+# Данные пишутся в лог не чаще раза в LOG_INTERVAL, с
+LOG_INTERVAL = 1.0
+TELEMETRY_TYPES = ('GLOBAL_POSITION_INT', 'VFR_HUD', 'SYS_STATUS')
+last_log = 0.0
+# Типы сообщений для потоковой телеметрии
+STREAM_TYPES = ('GLOBAL_POSITION_INT', 'VFR_HUD', 'SYS_STATUS', 'ATTITUDE')
+# Верхняя граница частоты потока, Гц; фактически не выше частоты автопилота
+MAX_STREAM_RATE = 50
+# Пустое сообщение, если данных нет дольше KEEPALIVE, с
+KEEPALIVE = 5.0
 
 
-def find_pixhawk_port(baudrate=57600, timeout=3):
+def telemetry_fields(msg):
     """
-    Ищет Pixhawk на доступных портах.
+    Поля телеметрии из сообщения MAVLink.
     """
-    from glob import glob
-    CANDIDATE_PORTS = [
-        "/dev/ttyUSB*",
-        "/dev/ttyACM*",
-        "/dev/ttyS*",
-        "/dev/serial/by-id/*",
-    ]
+    msg_type = msg.get_type()
+    if msg_type == 'GLOBAL_POSITION_INT':
+        return {
+            "lat": msg.lat / 1e7,
+            "lon": msg.lon / 1e7,
+            "altitude": msg.relative_alt / 1000.0,
+            "alt_msl": msg.alt / 1000.0,
+            "vx": msg.vx / 100.0,
+            "vy": msg.vy / 100.0,
+            "vz": msg.vz / 100.0,
+        }
+    if msg_type == 'VFR_HUD':
+        return {
+            "groundspeed": msg.groundspeed,
+            "airspeed": msg.airspeed,
+            "heading": msg.heading,
+            "throttle": msg.throttle,
+            "climb": msg.climb,
+        }
+    if msg_type == 'SYS_STATUS':
+        return {
+            "voltage_battery": msg.voltage_battery / 1000.0,
+            "current_battery": msg.current_battery / 100.0,
+            "battery_remaining": msg.battery_remaining,
+        }
+    if msg_type == 'ATTITUDE':
+        return {
+            "roll": msg.roll,
+            "pitch": msg.pitch,
+            "yaw": msg.yaw,
+        }
+    return {}
 
-    for pattern in CANDIDATE_PORTS:
-        for port in glob(pattern):
-            try:
-                print(f"Пробуем подключиться к {port}...")
-                connection = mavutil.mavlink_connection(port, baud=baudrate)
-                connection.wait_heartbeat(timeout=timeout)
-                print(f"✅ Найден Pixhawk на {port}")
-                return connection
-            except Exception as e:
-                print(f"❌ {port} не подходит: {e}")
-    raise Exception("❗ Pixhawk не найден на доступных портах")
-
-
-def collect_telemetry():
-    """
-    Фоновая задача для сбора телеметрии.
-    """
-    global is_collecting, telemetry_data
-
-    while is_collecting:
-        msg = connection.recv_match(blocking=True)
-        if not msg:
-            continue
-
-        if msg.get_type() == 'GLOBAL_POSITION_INT':
-            telemetry_data["lat"] = msg.lat / 1e7
-            telemetry_data["lon"] = msg.lon / 1e7
-            telemetry_data["altitude"] = msg.relative_alt / 1000.0
-        elif msg.get_type() == 'VFR_HUD':
-            telemetry_data["groundspeed"] = msg.groundspeed
-            telemetry_data["airspeed"] = msg.airspeed
-        elif msg.get_type() == 'SYS_STATUS':
-            telemetry_data["voltage_battery"] = msg.voltage_battery / 1000.0
-
-        # Логирование данных в файл
+
+def collect_telemetry(msg):
+    """
+    Обработчик сообщений телеметрии, вызывается менеджером MAVLink
+    на каждое сообщение без пропусков.
+    """
+    global last_log
+
+    telemetry_data.update(telemetry_fields(msg))
+
+    # Логирование данных в файл
+    now = time.monotonic()
+    if now - last_log >= LOG_INTERVAL:
+        last_log = now
         logging.info(f"Telemetry Data: {telemetry_data}")
-        time.sleep(1)
 
 
 @router.get("/start")
@@ -77,19 +96,17 @@ async def start_telemetry():
     """
     Запуск сбора телеметрии.
     """
-    global connection, is_collecting, collect_thread
+    global is_collecting, subscription
 
     if is_collecting:
         return {"status": "already_running"}
 
-    try:
-        connection = find_pixhawk_port()
-        is_collecting = True
-        collect_thread = threading.Thread(target=collect_telemetry)
-        collect_thread.start()
-        return {"status": "started"}
-    except Exception as e:
-        return {"status": "failed", "error": str(e)}
+    # ожидание соединения блокирует, выполняем в пуле mavlink
+    if not await run_io("mavlink", mavlink_manager.wait_connected, CONNECT_TIMEOUT, timeout=CONNECT_TIMEOUT + 1):
+        return {"status": "failed", "error": "❗ Pixhawk не найден на доступных портах"}
+    subscription = mavlink_manager.subscribe(TELEMETRY_TYPES, collect_telemetry)
+    is_collecting = True
+    return {"status": "started"}
 
 
 @router.get("/stop")
@@ -97,13 +114,14 @@ async def stop_telemetry():
     """
     Остановка сбора телеметрии.
     """
-    global is_collecting, collect_thread
+    global is_collecting, subscription
 
     if not is_collecting:
         return {"status": "not_running"}
 
     is_collecting = False
-    collect_thread.join()
+    mavlink_manager.unsubscribe(subscription)
+    subscription = None
     return {"status": "stopped"}
 
 
@@ -116,3 +134,128 @@ async def get_telemetry_status():
         return {"status": "not_running"}
     
     return {"status": "collecting", "data": telemetry_data}
+
+
+
+class TelemetryClient:
+    """
+    Очередь одного клиента потока: новые значения полей накапливаются
+    поверх неотправленных, так что медленный клиент получает последние
+    данные, а не растущий хвост сообщений.
+    """
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.ready = asyncio.Event()
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def on_message(self, msg):
+        # вызывается в потоке чтения менеджера MAVLink
+        fields = telemetry_fields(msg)
+        with self._lock:
+            wake = not self._pending
+            self._pending.update(fields)
+        if wake:
+            self.loop.call_soon_threadsafe(self.ready.set)
+
+    def take(self):
+        self.ready.clear()
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        return pending
+
+
+async def telemetry_updates(rate, types=STREAM_TYPES):
+    """
+    Изменившиеся поля телеметрии не чаще ``rate`` раз в секунду.
+    Пока клиент занят отправкой или ждет интервала, данные сливаются.
+    """
+    loop = asyncio.get_running_loop()
+    interval = 1 / min(rate, MAX_STREAM_RATE)
+    client = TelemetryClient(loop)
+    token = mavlink_manager.subscribe(types, client.on_message)
+    sent = {}
+    try:
+        while True:
+            try:
+                await asyncio.wait_for(client.ready.wait(), KEEPALIVE)
+            except asyncio.TimeoutError:
+                yield {}
+                continue
+            started = loop.time()
+            delta = {key: value for key, value in client.take().items() if sent.get(key) != value}
+            if delta:
+                sent.update(delta)
+                yield delta
+            await asyncio.sleep(max(0.0, interval - (loop.time() - started)))
+    finally:
+        mavlink_manager.unsubscribe(token)
+
+
+def parse_types(types):
+    if not types:
+        return STREAM_TYPES
+    selected = tuple(t.strip().upper() for t in types.split(",") if t.strip().upper() in STREAM_TYPES)
+    return selected or STREAM_TYPES
+
+
+@router.get("/stream")
+async def stream_telemetry(
+    rate: float = Query(10, gt=0, le=MAX_STREAM_RATE),
+    types: str | None = Query(None)
+):
+    """
+    Поток телеметрии (Server-Sent Events), в каждом событии только изменившиеся поля.
+    """
+    async def generate():
+        async with aclosing(telemetry_updates(rate, parse_types(types))) as updates:
+            async for delta in updates:
+                if not delta:
+                    yield ": keepalive\n\n"
+                    continue
+                yield f"data: {json.dumps({'time': time.time(), 'data': delta})}\n\n"
+
+    return StreamingResponse(
+        generate(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.websocket("/ws")
+async def telemetry_websocket(
+    websocket: WebSocket,
+    rate: float = Query(10, gt=0, le=MAX_STREAM_RATE),
+    types: str | None = Query(None)
+):
+    """
+    Поток телеметрии по WebSocket, JSON с изменившимися полями.
+    """
+    await websocket.accept()
+
+    async def send_updates():
+        async with aclosing(telemetry_updates(rate, parse_types(types))) as updates:
+            async for delta in updates:
+                await websocket.send_json({"time": time.time(), "data": delta})
+
+    async def wait_disconnect():
+        #клиент ничего не присылает, но закрытие приходит сразу, а не при следующей отправке
+        while (await websocket.receive())["type"] != "websocket.disconnect":
+            pass
+
+    sender = asyncio.create_task(send_updates())
+    receiver = asyncio.create_task(wait_disconnect())
+    try:
+        done, _ = await asyncio.wait((sender, receiver), return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            task.result()
+    except WebSocketDisconnect:
+        pass
+    finally:
+        #отмена закрывает генератор, подписка снимается
+        for task in (sender, receiver):
+            task.cancel()
+        #asyncio.wait, а не gather: отмена самого обработчика сервером проходит как есть
+        await asyncio.wait((sender, receiver))
+    logging.info("Telemetry WebSocket client disconnected")
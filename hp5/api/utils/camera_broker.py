@@ -0,0 +1,297 @@
+import base64
+import threading
+import time
+from contextlib import contextmanager
+
+import cv2
+
+from api.utils.logger import logger
+from modules.camera import Camera
+
+#сколько секунд камера остается открытой после ухода последнего клиента
+LINGER = 5.0
+#ожидание первого кадра после открытия устройства
+FIRST_FRAME_TIMEOUT = 3.0
+#качество JPEG по умолчанию, как у cv2.imencode без параметров
+JPEG_QUALITY = 95
+
+
+def fourcc_to_str(codec: float) -> str:
+    codec = int(codec)
+    if codec == 0:
+        return "Не определен"
+    return "".join(chr((codec >> shift) & 0xFF) for shift in (0, 8, 16, 24))
+
+
+def fit_size(frame_width: int, frame_height: int, width=None, height=None) -> tuple[int, int]:
+    """Размер кадра, вписанного в width x height с сохранением пропорций, без увеличения."""
+    if not width or not height:
+        return frame_width, frame_height
+    scale = min(width / frame_width, height / frame_height, 1.0)
+    return max(int(round(frame_width * scale)), 1), max(int(round(frame_height * scale)), 1)
+
+
+class CameraBroker:
+    """
+    Единственный владелец камеры для API.
+
+    Поток захвата держит устройство открытым, пока есть подписчики
+    (и еще LINGER секунд после последнего), и публикует последний кадр
+    с порядковым номером. Снимки берутся из текущего буфера без повторного
+    открытия устройства.
+    """
+
+    def __init__(self, cap_id=None, width=640, height=480, fps=30, linger=LINGER):
+        self.cap_id = cap_id
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.linger = linger
+        self.info = {}
+
+        self._cond = threading.Condition()
+        self._refs = 0
+        self._idle_since = time.monotonic()
+        self._thread = None
+        #устройство открывает только один поток, новый ждет закрытия старого
+        self._device = threading.Lock()
+        self._closed = False
+        self._resolution = None
+        #capture_at переключил разрешение, новые подписчики ждут возврата
+        self._switching = False
+        self._frame = None
+        self._seq = 0
+        self._timestamp = 0.0
+        self.read_errors = 0
+
+        #кэш JPEG по уровням (качество, ширина, высота): (seq, jpeg, base64)
+        self._jpeg = {}
+        self._tier_locks = {}
+        self.encoded = 0
+        self.encode_hits = 0
+
+    #хуки жизненного цикла приложения
+    def start(self):
+        self._closed = False
+        if self.cap_id is None:
+            try:
+                self.cap_id = Camera().id
+            except SystemError as e:
+                logger.error(f"Камера не найдена: {e}")
+
+    def shutdown(self):
+        with self._cond:
+            self._closed = True
+            thread = self._thread
+            self._cond.notify_all()
+        if thread is not None:
+            thread.join(timeout=2)
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    @property
+    def subscribers(self) -> int:
+        return self._refs
+
+    def acquire(self):
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("Camera broker is shut down")
+            deadline = time.monotonic() + 2 * FIRST_FRAME_TIMEOUT
+            while self._switching and not self._closed and time.monotonic() < deadline:
+                self._cond.wait(deadline - time.monotonic())
+            self._refs += 1
+            if not self.running:
+                if self.cap_id is None:
+                    self.start()
+                self._frame = None
+                self._thread = threading.Thread(target=self._capture, daemon=True)
+                self._thread.start()
+
+    def release(self):
+        with self._cond:
+            self._refs = max(self._refs - 1, 0)
+            if self._refs == 0:
+                self._idle_since = time.monotonic()
+
+    @contextmanager
+    def subscribe(self):
+        self.acquire()
+        try:
+            yield self
+        finally:
+            self.release()
+
+    def _open(self):
+        cap = cv2.VideoCapture(self.cap_id)
+        cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*"MJPG"))
+        cap.set(cv2.CAP_PROP_FRAME_WIDTH, self.width)
+        cap.set(cv2.CAP_PROP_FRAME_HEIGHT, self.height)
+        cap.set(cv2.CAP_PROP_FPS, self.fps)
+        return cap
+
+    def _update_info(self, cap):
+        try:
+            focus = cap.get(cv2.CAP_PROP_FOCUS)
+        except cv2.error:
+            focus = "Не поддерживается"
+        self.info = {
+            "fps": cap.get(cv2.CAP_PROP_FPS),
+            "resolution": f"{int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))}x{int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))}",
+            "codec": fourcc_to_str(cap.get(cv2.CAP_PROP_FOURCC)),
+            "focus": focus,
+        }
+
+    def _capture(self):
+        with self._device:
+            self._capture_loop()
+
+    def _capture_loop(self):
+        cap = self._open()
+        if not cap.isOpened():
+            logger.error(f"Камера {self.cap_id} не открывается")
+            cap.release()
+            with self._cond:
+                self._thread = None
+                self._cond.notify_all()
+            return
+        self._update_info(cap)
+        logger.info(f"Камера {self.cap_id} открыта брокером")
+
+        try:
+            while True:
+                with self._cond:
+                    if self._closed or (self._refs == 0 and time.monotonic() - self._idle_since > self.linger):
+                        #новый подписчик после этого момента запустит новый поток
+                        self._thread = None
+                        break
+                    resolution, self._resolution = self._resolution, None
+                if resolution is not None:
+                    cap.set(cv2.CAP_PROP_FRAME_WIDTH, resolution[0])
+                    cap.set(cv2.CAP_PROP_FRAME_HEIGHT, resolution[1])
+                    self._update_info(cap)
+
+                ret, frame = cap.read()
+                if not ret:
+                    self.read_errors += 1
+                    time.sleep(0.01)
+                    continue
+                with self._cond:
+                    self._frame = frame
+                    self._seq += 1
+                    self._timestamp = time.time()
+                    self._cond.notify_all()
+        finally:
+            cap.release()
+            with self._cond:
+                if self._thread is None:
+                    self._frame = None
+                    self._jpeg.clear()
+                self._cond.notify_all()
+            logger.info(f"Камера {self.cap_id} освобождена брокером")
+
+    def latest(self):
+        """Последний кадр ``(seq, frame, timestamp)`` без ожидания, frame None если кадров еще нет."""
+        with self._cond:
+            return self._seq, self._frame, self._timestamp
+
+    def wait_next(self, seq: int, timeout: float = FIRST_FRAME_TIMEOUT):
+        """Ждет кадр новее ``seq``, возвращает ``(seq, frame, timestamp)`` или None по таймауту."""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while self._frame is None or self._seq <= seq:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or self._closed or not self.running:
+                    return None
+                self._cond.wait(remaining)
+            return self._seq, self._frame, self._timestamp
+
+    def snapshot(self, timeout: float = FIRST_FRAME_TIMEOUT):
+        """
+        Текущий кадр из буфера ``(seq, frame)``; если камера не открыта -
+        открывает и ждет первый кадр. frame None по таймауту.
+        """
+        with self.subscribe():
+            seq, frame, _ = self.latest()
+            if frame is not None:
+                return seq, frame
+            result = self.wait_next(seq, timeout)
+            return (seq, None) if result is None else result[:2]
+
+    def capture_at(self, width: int, height: int, timeout: float = FIRST_FRAME_TIMEOUT):
+        """
+        Кадр в заданном разрешении. Если камеру больше никто не использует,
+        разрешение устройства меняется на время одного кадра, затем
+        возвращается исходное; новые подписчики ждут возврата. При
+        подключенных стримах их разрешение не трогается: кадр потока
+        вписывается в width x height без увеличения.
+        """
+        with self.subscribe():
+            with self._cond:
+                shared = self._refs > 1 or self._switching
+                if not shared:
+                    self._resolution = (width, height)
+                    self._switching = True
+                seq = self._seq
+            if shared:
+                _, frame = self.snapshot(timeout)
+                if frame is None:
+                    return None
+                size = fit_size(frame.shape[1], frame.shape[0], width, height)
+                if size != (frame.shape[1], frame.shape[0]):
+                    frame = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+                return frame
+            try:
+                #первый кадр после смены разрешения может быть еще старым
+                result = self.wait_next(seq, timeout)
+                if result is not None:
+                    result = self.wait_next(result[0], timeout)
+                return None if result is None else result[1]
+            finally:
+                with self._cond:
+                    self._resolution = (self.width, self.height)
+                    seq = self._seq
+                #подписчики получат кадры уже в исходном разрешении
+                result = self.wait_next(seq, timeout)
+                if result is not None:
+                    self.wait_next(result[0], timeout)
+                with self._cond:
+                    self._switching = False
+                    self._cond.notify_all()
+
+    def _tier_lock(self, tier):
+        with self._cond:
+            return self._tier_locks.setdefault(tier, threading.Lock())
+
+    def encode(self, seq: int, frame, quality: int = JPEG_QUALITY, width=None, height=None, b64=False):
+        """
+        JPEG кадра ``seq`` для уровня качества/разрешения; кадр вписывается
+        в ``width`` x ``height`` с сохранением пропорций. Каждый кадр
+        кодируется один раз на уровень, остальные зрители получают байты
+        из кэша; если в кэше уже кадр новее, отдается он. Возвращает
+        ``(seq, data)``, data - bytes или base64 str, None при ошибке.
+        """
+        tier = (quality, width, height)
+        with self._tier_lock(tier):
+            cached = self._jpeg.get(tier)
+            if cached is not None and cached[0] >= seq:
+                self.encode_hits += 1
+                seq, jpeg, text = cached
+            else:
+                size = fit_size(frame.shape[1], frame.shape[0], width, height)
+                if size != (frame.shape[1], frame.shape[0]):
+                    frame = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+                ret, buffer = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+                if not ret:
+                    return seq, None
+                self.encoded += 1
+                jpeg, text = buffer.tobytes(), None
+            if b64 and text is None:
+                text = base64.b64encode(jpeg).decode("utf-8")
+            self._jpeg[tier] = (seq, jpeg, text)
+        return seq, text if b64 else jpeg
+
+
+camera_broker = CameraBroker()
@@ -1,10 +1,8 @@
-from pymavlink import mavutil
-import time
-import glob
-from time import sleep
 from math import isclose
 import logging
 
+from api.utils.mavlink_manager import mavlink_manager
+
 # Настройка логгера
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
@@ -12,32 +10,17 @@ logger.setLevel(logging.INFO)
 # Погрешность для теста
 TOLERANCE = 5  # Допустимое отклонение в градусах
 
-CANDIDATE_PORTS = [
-    "/dev/ttyUSB*",
-    "/dev/ttyACM*",
-    "/dev/ttyS*",
-    "/dev/serial/by-id/*",
-]
+# Ожидание подключения менеджера MAVLink, с
+CONNECT_TIMEOUT = 10
 
-# Глобальная переменная для подключения
-connection = None
 
-def find_pixhawk_port(baudrate=57600, timeout=3):
+def find_pixhawk_port(timeout=CONNECT_TIMEOUT):
     """
-    Ищет порт Pixhawk
+    Порт Pixhawk из общего менеджера MAVLink
     """
-    for pattern in CANDIDATE_PORTS:
-        for port in glob.glob(pattern):
-            try:
-                logger.info(f"Пробуем подключиться к {port}...")
-                global connection
-                connection = mavutil.mavlink_connection(port, baud=baudrate)
-                connection.wait_heartbeat(timeout=timeout)
-                logger.info(f"✅ Найден Pixhawk на {port}")
-                return port
-            except Exception as e:
-                logger.warning(f"❌ {port} не подходит: {e}")
-    raise Exception("❗ Pixhawk не найден на доступных портах")
+    if not mavlink_manager.wait_connected(timeout):
+        raise Exception("❗ Pixhawk не найден на доступных портах")
+    return mavlink_manager.port
 
 
 def get_compass_yaw():
@@ -45,10 +28,7 @@ def get_compass_yaw():
     Получает текущий угол компаса (yaw) от Pixhawk.
     """
     try:
-        if connection is None:
-            find_pixhawk_port()
-        
-        msg = connection.recv_match(type='VFR_HUD', blocking=True, timeout=2)
+        msg = mavlink_manager.wait_for('VFR_HUD', timeout=2)
         if msg:
             logger.info(f"Получено значение yaw: {msg.heading}")
             return msg.heading
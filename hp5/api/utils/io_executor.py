@@ -0,0 +1,53 @@
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+from api.utils.logger import logger
+
+#отдельный пул потоков на каждый класс устройств, чтобы медленный
+#serial не занимал потоки камеры и общий пул starlette
+POOL_SIZES = {
+    "camera": 4,
+    "gps": 2,
+    "mavlink": 4,
+}
+#таймауты по умолчанию, с
+TIMEOUTS = {
+    "camera": 5.0,
+    "gps": 5.0,
+    "mavlink": 15.0,
+}
+
+_executors = {}
+
+
+def get_executor(device: str) -> ThreadPoolExecutor:
+    executor = _executors.get(device)
+    if executor is None:
+        executor = ThreadPoolExecutor(max_workers=POOL_SIZES.get(device, 2), thread_name_prefix=f"io-{device}")
+        _executors[device] = executor
+    return executor
+
+
+async def run_io(device: str, func, *args, timeout: float | None = None, **kwargs):
+    """
+    Выполняет блокирующий вызов в пуле устройства, не блокируя event loop.
+    По таймауту бросает asyncio.TimeoutError; сам вызов при этом
+    дорабатывает в своем потоке, поэтому у функций должен быть свой таймаут.
+    Аргумент timeout самой функции передается через functools.partial.
+    """
+    loop = asyncio.get_running_loop()
+    future = loop.run_in_executor(get_executor(device), functools.partial(func, *args, **kwargs))
+    timeout = TIMEOUTS.get(device) if timeout is None else timeout
+    try:
+        return await asyncio.wait_for(future, timeout)
+    except asyncio.TimeoutError:
+        name = getattr(getattr(func, "func", func), "__name__", func)
+        logger.warning(f"{device}: {name} не завершился за {timeout} с")
+        raise
+
+
+def shutdown():
+    for executor in _executors.values():
+        executor.shutdown(wait=False, cancel_futures=True)
+    _executors.clear()
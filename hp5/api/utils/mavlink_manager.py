@@ -0,0 +1,187 @@
+import itertools
+import threading
+import time
+
+from api.utils.logger import logger
+from api.utils.pixhawk_port_detector import connect_pixhawk, probe_port
+
+BAUDRATE = 57600
+HEARTBEAT_TIMEOUT = 3
+#пауза между попытками переподключения, с; удваивается после каждой
+#неудачи до MAX_RECONNECT_DELAY, чтобы не открывать порты постоянно
+RECONNECT_DELAY = 2.0
+MAX_RECONNECT_DELAY = 60.0
+#после потери связи столько раз пробуется только прежний порт,
+#затем снова перебор всех портов
+KNOWN_PORT_RETRIES = 5
+#без сообщений дольше этого соединение считается потерянным, с
+LINK_TIMEOUT = 5.0
+RECV_TIMEOUT = 0.5
+
+
+class MavlinkManager:
+    """
+    Одно соединение с Pixhawk на все API.
+
+    Фоновый поток находит порт (кэш, затем параллельный перебор), читает
+    сообщения без пауз и раздает их подписчикам по типу; последнее
+    сообщение каждого типа доступно через ``latest``/``wait_for``. При
+    потере связи поток переподключается сам: сначала к прежнему порту,
+    паузы между попытками растут до MAX_RECONNECT_DELAY.
+    """
+
+    def __init__(self, baudrate=BAUDRATE, heartbeat_timeout=HEARTBEAT_TIMEOUT):
+        self.baudrate = baudrate
+        self.heartbeat_timeout = heartbeat_timeout
+        self.port = None
+        self.connection = None
+
+        self._cond = threading.Condition()
+        self._latest = {}
+        self._counts = {}
+        self._subscribers = {}
+        self._tokens = itertools.count()
+        self._stop = threading.Event()
+        self._connected = threading.Event()
+        self._thread = None
+        self._last_msg = 0.0
+        self._failures = 0
+
+    def start(self):
+        with self._cond:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="mavlink-manager", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=RECONNECT_DELAY + RECV_TIMEOUT + 1)
+        self._disconnect()
+
+    @property
+    def connected(self) -> bool:
+        return self._connected.is_set()
+
+    def wait_connected(self, timeout=None) -> bool:
+        self.start()
+        return self._connected.wait(timeout)
+
+    @property
+    def mav(self):
+        """Отправка команд, например ``mavlink_manager.mav.command_long_send(...)``."""
+        connection = self.connection
+        if connection is None:
+            raise ConnectionError("Pixhawk не подключен")
+        return connection.mav
+
+    @property
+    def target_system(self):
+        return self.connection.target_system
+
+    @property
+    def target_component(self):
+        return self.connection.target_component
+
+    def subscribe(self, types, callback):
+        """
+        ``callback(msg)`` для сообщений из ``types`` (None - все типы),
+        вызывается в потоке чтения и не должен блокировать.
+        """
+        token = next(self._tokens)
+        with self._cond:
+            self._subscribers[token] = (frozenset(types) if types is not None else None, callback)
+        self.start()
+        return token
+
+    def unsubscribe(self, token):
+        with self._cond:
+            self._subscribers.pop(token, None)
+
+    def latest(self, msg_type):
+        with self._cond:
+            return self._latest.get(msg_type)
+
+    def wait_for(self, msg_type, timeout=2.0, fresh=True):
+        """
+        Сообщение типа ``msg_type``; с ``fresh`` - только пришедшее после
+        вызова. None по таймауту.
+        """
+        self.start()
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            count = self._counts.get(msg_type, 0) if fresh else 0
+            while self._counts.get(msg_type, 0) <= count:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self._cond.wait(remaining)
+            return self._latest[msg_type]
+
+    def _connect(self):
+        if self.port is not None and self._failures < KNOWN_PORT_RETRIES:
+            port, connection = self.port, probe_port(self.port, self.baudrate, self.heartbeat_timeout)
+        else:
+            port, connection = connect_pixhawk(self.baudrate, self.heartbeat_timeout)
+        if connection is None:
+            self._failures += 1
+            return False
+        self._failures = 0
+        self.port = port
+        self.connection = connection
+        self._last_msg = time.monotonic()
+        self._connected.set()
+        logger.info(f"✅ Pixhawk подключен на {port}")
+        return True
+
+    def _disconnect(self):
+        self._connected.clear()
+        connection, self.connection = self.connection, None
+        if connection is not None:
+            try:
+                connection.close()
+            except Exception:
+                pass
+
+    def _dispatch(self, msg):
+        msg_type = msg.get_type()
+        with self._cond:
+            self._latest[msg_type] = msg
+            self._counts[msg_type] = self._counts.get(msg_type, 0) + 1
+            subscribers = list(self._subscribers.values())
+            self._cond.notify_all()
+        for types, callback in subscribers:
+            if types is None or msg_type in types:
+                try:
+                    callback(msg)
+                except Exception as e:
+                    logger.error(f"Ошибка подписчика MAVLink: {e}")
+
+    def _run(self):
+        while not self._stop.is_set():
+            if self.connection is None:
+                if not self._connect():
+                    delay = min(RECONNECT_DELAY * 2 ** (self._failures - 1), MAX_RECONNECT_DELAY)
+                    logger.warning(f"Pixhawk не найден, повтор через {delay:.0f} с")
+                    self._stop.wait(delay)
+                continue
+
+            try:
+                msg = self.connection.recv_match(blocking=True, timeout=RECV_TIMEOUT)
+            except Exception as e:
+                logger.error(f"Ошибка чтения MAVLink: {e}")
+                self._disconnect()
+                continue
+
+            if msg is None or msg.get_type() == "BAD_DATA":
+                if time.monotonic() - self._last_msg > LINK_TIMEOUT:
+                    logger.warning(f"Нет сообщений от Pixhawk на {self.port}, переподключение")
+                    self._disconnect()
+                continue
+            self._last_msg = time.monotonic()
+            self._dispatch(msg)
+
+
+mavlink_manager = MavlinkManager()
@@ -1,22 +1,107 @@
 import glob
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
 from pymavlink import mavutil
 
+from api.utils.logger import logger
+
 CANDIDATE_PORTS = [
     "/dev/ttyUSB*",
     "/dev/ttyACM*",
     "/dev/ttyS*",
     "/dev/serial/by-id/*",
 ]
+#UART GPS-приемника (api/routes/gps.py, main.py): открытие на 57600
+#сбивает его скорость 115200 и портит поток GPS
+EXCLUDED_PORTS = ("/dev/ttyS0",)
+#последний найденный порт, проверяется первым при следующем запуске
+PORT_CACHE = os.path.expanduser("~/.cache/hp5/pixhawk_port.json")
 
-def find_pixhawk_port(baudrate=57600, timeout=3):
+
+def candidate_ports():
+    excluded = {os.path.realpath(port) for port in EXCLUDED_PORTS}
+    ports = []
     for pattern in CANDIDATE_PORTS:
-        for port in glob.glob(pattern):
-            try:
-                print(f"Пробуем подключиться к {port}...")
-                master = mavutil.mavlink_connection(port, baud=baudrate)
-                master.wait_heartbeat(timeout=timeout)
-                print(f"✅ Найден Pixhawk на {port}")
-                return port
-            except Exception as e:
-                print(f"❌ {port} не подходит: {e}")
-    raise Exception("❗ Pixhawk не найден на доступных портах")
+        for port in sorted(glob.glob(pattern)):
+            #by-id - ссылки на те же устройства
+            real = os.path.realpath(port)
+            if real not in excluded and real not in map(os.path.realpath, ports):
+                ports.append(port)
+    return ports
+
+
+def probe_port(port, baudrate=57600, timeout=3):
+    """Открытое соединение, если на порту есть heartbeat, иначе None."""
+    try:
+        master = mavutil.mavlink_connection(port, baud=baudrate)
+    except Exception as e:
+        logger.debug(f"❌ {port} не открывается: {e}")
+        return None
+    try:
+        if master.wait_heartbeat(timeout=timeout):
+            return master
+    except Exception as e:
+        logger.debug(f"❌ {port} не подходит: {e}")
+    master.close()
+    return None
+
+
+def load_cached_port():
+    try:
+        with open(PORT_CACHE) as f:
+            return json.load(f).get("port")
+    except (OSError, ValueError):
+        return None
+
+
+def save_cached_port(port, baudrate):
+    try:
+        os.makedirs(os.path.dirname(PORT_CACHE), exist_ok=True)
+        with open(PORT_CACHE, "w") as f:
+            json.dump({"port": port, "baudrate": baudrate}, f)
+    except OSError as e:
+        logger.warning(f"Не удалось сохранить порт Pixhawk: {e}")
+
+
+def connect_pixhawk(baudrate=57600, timeout=3):
+    """
+    Ищет Pixhawk и возвращает ``(port, connection)`` или ``(None, None)``.
+    Сначала проверяется порт из кэша, затем все кандидаты параллельно,
+    так что поиск занимает один таймаут heartbeat, а не по таймауту на порт.
+    """
+    cached = load_cached_port()
+    if cached in candidate_ports():
+        master = probe_port(cached, baudrate, timeout)
+        if master is not None:
+            return cached, master
+
+    ports = [port for port in candidate_ports() if port != cached]
+    if not ports:
+        return None, None
+    found = None
+    with ThreadPoolExecutor(max_workers=len(ports), thread_name_prefix="pixhawk-probe") as pool:
+        futures = {pool.submit(probe_port, port, baudrate, timeout): port for port in ports}
+        for future in as_completed(futures):
+            master = future.result()
+            if master is None:
+                continue
+            if found is None:
+                found = futures[future], master
+            else:
+                #второй автопилот не нужен
+                master.close()
+    if found is None:
+        return None, None
+    save_cached_port(found[0], baudrate)
+    return found
+
+
+def find_pixhawk_port(baudrate=57600, timeout=3):
+    port, master = connect_pixhawk(baudrate, timeout)
+    if port is None:
+        raise Exception("❗ Pixhawk не найден на доступных портах")
+    master.close()
+    print(f"✅ Найден Pixhawk на {port}")
+    return port
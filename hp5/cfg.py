@@ -6,6 +6,7 @@ PORT = 'udp:127.0.0.1:14550'
 # Dump directory and settings
 DUMP_DIR = '/home/orangepi/dumps'
 MIN_FREE_SPACE = 2**31  # bytes
+DUMP_BUDGET = None  # max size of DUMP_DIR in bytes, None for no limit
 
 # Flags for dumping and sending data
 DUMP = False
@@ -34,6 +35,11 @@ PIN_STATUS_VIO = 15
 # GPS mode configuration
 GPS_MODE = 'vio'  # Options: 'gps', 'vio'
 
+# Read the ublox stream in bulk and parse only the used NMEA fields into a GPSFix record
+GPS_FAST_PARSER = True
+# Opt-in: configure the ublox for binary UBX-NAV-PVT output (one message per fix) instead of NMEA
+GPS_BINARY = False
+
 # Default GPS coordinates (used if GPS data is not available)
 DEFAULT_LAT = 54.84309569281793
 DEFAULT_LON = 83.09851770880381
@@ -42,3 +48,31 @@ DEFAULT_ALT = 204
 # Altitude where to start VIO after mission
 TARGET_ALTITUDE = 30
 ALTITUDE_TOLERANCE = 3
+
+# Pass camera frames through a shared memory ring instead of a queue
+SHM_FRAMES = True
+FRAME_RING_SLOTS = 4
+
+# Share latest MAVLink values through shared memory instead of a queue
+SHM_TELEMETRY = True
+
+# Poll only the consumed MAVLink messages, blocking on the link between packets
+MAV_EVENT_POLL = True
+
+# Interpolate attitude/position to the frame capture time
+SYNC_TELEMETRY = True
+# Delay between frame exposure and its timestamp in the camera process, s
+FRAME_LATENCY = 0.0
+
+# Run VIO stages (warp, features, pose) in parallel worker processes
+VIO_PIPELINE = False
+
+# XFeat post-processing: 'torch' or 'numpy' (torch-free)
+XFEAT_BACKEND = 'torch'
+# XFeat backbone runtime: 'onnx' (CPU), 'rknn' (NPU, opt-in) or 'mock', falls back to 'onnx'
+XFEAT_INFERENCE = 'onnx'
+# XFeat model file, None for the default of the runtime (e.g. weights/net.int8.onnx)
+XFEAT_WEIGHTS = None
+
+# Record dumps with the asynchronous flight recorder (MJPEG + NPZ) instead of JPEG+JSON per frame
+RECORDER = True
@@ -9,9 +9,18 @@ from multiprocessing.sharedctypes import Synchronized
 from pymavlink import mavutil
 
 import cfg
-from modules import VIO, Camera, PosData
+from modules import (
+    VIO,
+    Camera,
+    FrameRing,
+    PosData,
+    SensorSync,
+    TelemetryStore,
+    VIOPipeline,
+)
 from modules.InfoOnDisplay import send_info_on_display
 from modules.logger import global_logger as logger
+from modules.pos_data import MSG_RATES, MSG_TYPES
 from utils.data_utils import dump_data, setup_dumping
 from utils.gps_utils import (
     change_altitude,
@@ -24,6 +33,8 @@ from utils.gps_utils import (
     GPSData
 )
 from utils.image_utils import letterbox
+from utils.recorder import FlightRecorder
+from utils.recording_manager import RecordingManager
 
 # from nvio import NVIO  # should be after VIO
 
@@ -55,7 +66,10 @@ def initialize_processes(
     # Initialize position data process
     list_processes = []
 
-    posdata = PosData()
+    if cfg.MAV_EVENT_POLL:
+        posdata = PosData(msg_types=MSG_TYPES, msg_rates=MSG_RATES)
+    else:
+        posdata = PosData()
     data_poll_process = Process(target=posdata.run, args=(stop, posque), daemon=True)
     data_poll_process.start()
     list_processes.append(data_poll_process)
@@ -72,7 +86,7 @@ def initialize_processes(
     list_processes.append(video_poll_process)
     
     # Initialize GPS data process
-    gps = GPSData()
+    gps = GPSData(fast=cfg.GPS_FAST_PARSER, binary=cfg.GPS_BINARY)
     gps_process = Process(target=gps.run, args=(stop, gpsque))
     gps_process.start()
     
@@ -95,7 +109,9 @@ def main_loop(
     vidque: Queue,
     data_dir: str | None,
     pos_queue_window: Queue,
-    gpsque: Queue
+    gpsque: Queue,
+    recorder: FlightRecorder | None = None,
+    recording_manager: RecordingManager | None = None,
 ) -> None:
     vio_state = cfg.USE_VIO_FROM_START
     vis_odo = None
@@ -112,6 +128,8 @@ def main_loop(
     land_3m = False
     altitude_send_30m =  False
     target_30m = False
+    # frames passed to dump_data, the budget thins them out when space runs low
+    dumped = 0
 
     # Init neural part of the odometry
     if cfg.USE_NVIO:
@@ -141,6 +159,9 @@ def main_loop(
     lat0 = cfg.DEFAULT_LAT
     lon0 = cfg.DEFAULT_LON
     alt0 = cfg.DEFAULT_ALT
+
+    # Align attitude and position to the frame capture time
+    sync = SensorSync() if cfg.SYNC_TELEMETRY else None
     
     while True:
         try:
@@ -149,8 +170,13 @@ def main_loop(
 
             # Get frame and message from pixhawk
             frame, timestemp_frame = vidque.get()
-            result_img = frame.copy()
+            result_img = frame
+            # ring views are overwritten after FRAME_RING_SLOTS - 1 more frames
+            ring_view = isinstance(vidque, FrameRing)
             msg, timestemp_msg = posque.get()
+            if sync is not None:
+                sync.update(posque if isinstance(posque, TelemetryStore) else msg)
+                sync.apply(msg, timestemp_frame - cfg.FRAME_LATENCY)
             
             # Get GPS data from ublox_m8n
             if not gpsque.empty():
@@ -235,31 +261,59 @@ def main_loop(
             if vio_state:
                 if vis_odo is None:
                     # Initialize Visual Inertial Odometry
-                    vis_odo = VIO(lat0, lon0, alt0)
+                    if cfg.VIO_PIPELINE:
+                        vis_odo = VIOPipeline(lat0, lon0, alt0, frame_shape=frame.shape,
+                                              backend=cfg.XFEAT_BACKEND,
+                                              inference=cfg.XFEAT_INFERENCE,
+                                              weights=cfg.XFEAT_WEIGHTS)
+                    else:
+                        vis_odo = VIO(lat0, lon0, alt0, backend=cfg.XFEAT_BACKEND,
+                                      inference=cfg.XFEAT_INFERENCE, weights=cfg.XFEAT_WEIGHTS)
                     logger.info(f"Starting at coordinates: {lat0}, {lon0}, {alt0}")
 
-                msg["VIO"] = vis_odo.add_trace_pt(frame, msg)
+                if isinstance(vis_odo, VIOPipeline):
+                    # results lag the frame by the pipeline depth
+                    vis_odo.submit(frame, msg, timestemp_frame)
+                    if (vio := vis_odo.poll()) is not None:
+                        msg["VIO"] = vio
+                else:
+                    # inference takes about as long as the ring lasts, VIO and
+                    # the recorder below need a frame that stays put
+                    if ring_view:
+                        result_img = frame = frame.copy()
+                        ring_view = False
+                    msg["VIO"] = vis_odo.add_trace_pt(frame, msg)
+
+            vio_crop = msg["VIO"]["crop"] if vio_state and "VIO" in msg else None
 
-            if vio_state and cfg.USE_NVIO:
-                nvio.send_frame(msg["VIO"]["crop"])
+            if vio_crop is not None and cfg.USE_NVIO:
+                nvio.send_frame(vio_crop)
                 results = nvio.get_data()
                 if cfg.DRAW_YOLO_RESULTS:
                     result_img, results = results
 
             # Reshape vio crop to camera shape
-            if vio_state and cfg.NADIR_DISPLAY:
+            if vio_crop is not None and cfg.NADIR_DISPLAY:
                 result_img, ratio, dwdh = letterbox(
-                    msg["VIO"]["crop"], (480, 640), auto=False
+                    vio_crop, (480, 640), auto=False
                 )
 
             # Display image
             if cfg.SHOW_DISPLAY:
                 if not pos_queue_window.full():
+                    # the queue pickles lazily, do not hand it a ring slot that may be reused
+                    if ring_view and result_img is frame:
+                        result_img = frame.copy()
                     pos_queue_window.put((result_img, msg))
 
             # Dump images and msg
-            if cfg.DUMP and data_dir:
-                dump_data(data_dir, frame, msg)
+            if ring_view and not vidque.valid(vidque.last_seq):
+                logger.warning("Frame was overwritten in the ring, not recorded")
+            elif recorder is not None:
+                recorder.record(frame, msg, timestemp_frame)
+            elif cfg.DUMP and data_dir:
+                dump_data(data_dir, frame, msg, recording_manager, dumped)
+                dumped += 1
 
             # Send gps data
             gps_data_to_send = gps2pixhawk(msg)
@@ -273,7 +327,12 @@ def main_loop(
 
                 # Calculate and show debug information
                 fps = 1 / (time.monotonic() - tic)
-                if timestemp_msg != -1:
+                if sync is not None and sync.skew is not None:
+                    print(
+                        f"FPS: {fps:.1f}, Voltage: {voltage if voltage else 'N/A'}, skew: {sync.skew * 1000:.1f} ms",
+                        end="\r",
+                    )
+                elif timestemp_msg != -1:
                     timestemp_frame = abs(timestemp_frame - start_frame) * 1000
                     timestemp_msg = abs(timestemp_msg - start_imu)
                     print(
@@ -301,6 +360,8 @@ def main_loop(
 
     # Ensure all processes are properly terminated
     stop.value = 1
+    if isinstance(vis_odo, VIOPipeline):
+        vis_odo.close()
 
 
 if __name__ == "__main__":
@@ -311,8 +372,10 @@ if __name__ == "__main__":
 
     # Initialize processes and queues
     stop_value = Value("i", 0)
-    pos_queue = Queue(2)
-    video_queue = Queue(2)
+    if cfg.SHM_TELEMETRY:
+        pos_queue = TelemetryStore()
+    else:
+        pos_queue = Queue(2)
     gps_queue = Queue(2)
 
     # Queue for showing results on monitor
@@ -320,6 +383,12 @@ if __name__ == "__main__":
 
     # Initialize camera
     vcap = Camera()
+    if cfg.SHM_FRAMES:
+        video_queue = FrameRing(
+            (vcap.target_height, vcap.target_width, 3), slots=cfg.FRAME_RING_SLOTS
+        )
+    else:
+        video_queue = Queue(2)
 
     # Initialize processes
     processes = initialize_processes(
@@ -328,8 +397,16 @@ if __name__ == "__main__":
 
     # Setup data dumping if enabled
     data_directory = None
+    recording_manager = None
+    recorder = None
     if cfg.DUMP:
-        data_directory = setup_dumping(cfg.DUMP_DIR, cfg.MIN_FREE_SPACE)
+        data_directory, recording_manager = setup_dumping(cfg.DUMP_DIR, cfg.MIN_FREE_SPACE, cfg.DUMP_BUDGET)
+        if cfg.RECORDER:
+            recorder = FlightRecorder(
+                data_directory,
+                (vcap.target_height, vcap.target_width, 3),
+                manager=recording_manager,
+            )
     try:
         # Run the main loop
         main_loop(
@@ -339,10 +416,18 @@ if __name__ == "__main__":
             video_queue,
             data_directory,
             pos_queue_window,
-            gps_queue
+            gps_queue,
+            recorder,
+            recording_manager,
         )
     finally:
+        if recorder is not None:
+            recorder.close()
         # Ensure all processes are joined properly
         for process in processes:
             process.terminate()
             process.join()
+        for shared in (video_queue, pos_queue):
+            if isinstance(shared, (FrameRing, TelemetryStore)):
+                shared.close()
+                shared.unlink()
@@ -1,6 +1,20 @@
 from modules.logger.logger_copter import CopterLogger
 from modules.camera import Camera
-from modules.xfeat.xfeat_ort import XFeat
+from modules.frame_ring import FrameRing
 from modules.pos_data import PosData
+from modules.telemetry_store import TelemetryStore
+from modules.sensor_sync import SensorSync
 from modules.vio.vio_ort import VIO
-from modules.InfoOnDisplay import send_info_on_display
\ No newline at end of file
+from modules.vio.pipeline import VIOPipeline
+from modules.InfoOnDisplay import send_info_on_display
+
+
+def __getattr__(name):
+    # the torch XFeat is imported on demand, the numpy backend runs without torch
+    if name == "XFeat":
+        from modules.xfeat.xfeat_ort import XFeat
+        return XFeat
+    if name == "XFeatNP":
+        from modules.xfeat.xfeat_np import XFeatNP
+        return XFeatNP
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -2,7 +2,9 @@ import queue
 import time
 
 import cv2
+import numpy as np
 
+from modules.frame_ring import FrameRing
 from modules.logger import global_logger as logger
 
 
@@ -29,6 +31,23 @@ class Camera:
         if self.id is None:
             raise SystemError("No camera found")
 
+    def _read_to_ring(self, cap, ring):
+        # decode straight into the shared memory slot
+        slot = ring.begin_write()
+        ret, frame = cap.read(slot)
+        timestemp = time.time()
+        if not ret:
+            ring.abort()
+            logger.error("Not frame!")
+            return
+        if frame.ctypes.data != slot.ctypes.data:
+            # the driver gave another resolution and OpenCV reallocated the buffer
+            if frame.shape == slot.shape:
+                np.copyto(slot, frame)
+            else:
+                cv2.resize(frame, (slot.shape[1], slot.shape[0]), dst=slot)
+        ring.commit(timestemp)
+
     def run(self, stop, outque):
         cap = cv2.VideoCapture(self.id)
 
@@ -46,6 +65,10 @@ class Camera:
         # Разрешение для inference
         while not stop.value:
             try:
+                if isinstance(outque, FrameRing):
+                    self._read_to_ring(cap, outque)
+                    continue
+
                 ret, frame = cap.read()
                 timestemp = time.time()
                 if not ret:
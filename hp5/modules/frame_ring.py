@@ -0,0 +1,192 @@
+import queue
+import time
+from multiprocessing import Queue, shared_memory
+
+import numpy as np
+
+# header is padded to a cache line so the frame slots stay aligned
+HEADER_ALIGN = 64
+
+
+class FrameRing:
+    """
+    Ring of fixed-size frame slots in shared memory.
+
+    The producer writes frames in place (``begin_write``/``commit`` or
+    ``put``), consumers get read-only NumPy views of the latest slot without
+    pickling. Every slot carries the sequence number and timestamp of the
+    frame it holds; a slot being written is marked with sequence -1.
+    The ring also mimics the part of the ``multiprocessing.Queue`` interface
+    used by the capture and main loops (``put``, ``get``, ``full``, ``empty``).
+    """
+
+    def __init__(self, shape, dtype=np.uint8, slots=4, name=None, create=True):
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.slots = slots
+        self.frame_size = int(np.prod(self.shape)) * self.dtype.itemsize
+
+        # [latest seq] + seq per slot (int64) + timestamp per slot (float64)
+        header = 8 * (1 + 2 * slots)
+        self._offset = -(-header // HEADER_ALIGN) * HEADER_ALIGN
+        size = self._offset + slots * self.frame_size
+
+        self._shm = shared_memory.SharedMemory(name=name, create=create, size=size if create else 0)
+        self.name = self._shm.name
+        self._map_arrays()
+
+        if create:
+            self._latest[0] = -1
+            self._seq[:] = -1
+            self._ts[:] = 0
+
+        self._write_seq = int(self._latest[0]) + 1
+        self._writing = None
+        self.last_seq = -1
+
+    def _map_arrays(self):
+        buf = self._shm.buf
+        self._latest = np.ndarray((1,), dtype=np.int64, buffer=buf, offset=0)
+        self._seq = np.ndarray((self.slots,), dtype=np.int64, buffer=buf, offset=8)
+        self._ts = np.ndarray((self.slots,), dtype=np.float64, buffer=buf, offset=8 * (1 + self.slots))
+        self._frames = np.ndarray(
+            (self.slots, *self.shape), dtype=self.dtype, buffer=buf, offset=self._offset
+        )
+
+    def __getstate__(self):
+        return dict(shape=self.shape, dtype=self.dtype.str, slots=self.slots, name=self.name)
+
+    def __setstate__(self, state):
+        self.__init__(create=False, **state)
+
+    # producer side
+
+    def begin_write(self) -> np.ndarray:
+        """Return the writable slot for the next frame and mark it as busy."""
+        slot = self._write_seq % self.slots
+        self._seq[slot] = -1
+        self._writing = slot
+        return self._frames[slot]
+
+    def commit(self, timestamp: float) -> int:
+        """Publish the slot returned by ``begin_write``."""
+        slot = self._writing
+        seq = self._write_seq
+        self._ts[slot] = timestamp
+        self._seq[slot] = seq
+        self._latest[0] = seq
+        self._writing = None
+        self._write_seq += 1
+        return seq
+
+    def abort(self):
+        self._writing = None
+
+    def put(self, item, block=True, timeout=None):
+        frame, timestamp = item
+        np.copyto(self.begin_write(), frame)
+        self.commit(timestamp)
+
+    # consumer side
+
+    def latest(self) -> int:
+        return int(self._latest[0])
+
+    def valid(self, seq: int) -> bool:
+        """True while the frame ``seq`` has not been overwritten."""
+        return seq >= 0 and int(self._seq[seq % self.slots]) == seq
+
+    def read(self, seq: int):
+        """Read-only view and timestamp of frame ``seq`` or None if it is gone."""
+        slot = seq % self.slots
+        if int(self._seq[slot]) != seq:
+            return None
+        view = self._frames[slot]
+        view.flags.writeable = False
+        return view, float(self._ts[slot])
+
+    def get(self, block=True, timeout=None, poll=0.0005):
+        """
+        Wait for a frame newer than the last one returned and give back a
+        read-only view of it. The view stays valid until ``slots - 1`` more
+        frames are written, check with ``valid(ring.last_seq)`` if unsure.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            seq = self.latest()
+            if seq > self.last_seq:
+                item = self.read(seq)
+                if item is not None:
+                    self.last_seq = seq
+                    return item
+            if not block or (deadline is not None and time.monotonic() > deadline):
+                raise queue.Empty
+            time.sleep(poll)
+
+    def empty(self) -> bool:
+        return self.latest() <= self.last_seq
+
+    def full(self) -> bool:
+        # the producer overwrites the oldest slot, it never blocks
+        return False
+
+    def close(self):
+        self._latest = self._seq = self._ts = self._frames = None
+        try:
+            self._shm.close()
+        except BufferError:
+            # a consumer still holds a view, the mapping goes away with the process
+            pass
+
+    def unlink(self):
+        self._shm.unlink()
+
+
+class ShmQueue:
+    """
+    Bounded FIFO of arrays between processes: the payload goes through a
+    FrameRing, only the slot number and small metadata are pickled.
+
+    Arrays may be shorter than the slot along the first axis. When the queue
+    is full the oldest item is dropped, the producer never blocks. Slots are
+    reused after ``maxsize + 2`` puts, so ``get`` copies the payload out and
+    checks that it was not overwritten meanwhile.
+    """
+
+    def __init__(self, shape, dtype=np.uint8, maxsize=2):
+        self.ring = FrameRing(shape, dtype, slots=maxsize + 2)
+        self._meta = Queue(maxsize)
+
+    def put(self, array, meta=None, timestamp=0.0):
+        slot = self.ring.begin_write()
+        size = len(array)
+        slot[:size] = array
+        seq = self.ring.commit(timestamp)
+        item = (seq, size, meta)
+        while True:
+            try:
+                self._meta.put_nowait(item)
+                return seq
+            except queue.Full:
+                # drop the oldest item to keep latency bounded
+                try:
+                    self._meta.get_nowait()
+                except queue.Empty:
+                    pass
+
+    def get(self, block=True, timeout=None):
+        """Return ``(seq, array, meta)``, the payload is None if it was lapped."""
+        seq, size, meta = self._meta.get(block, timeout)
+        item = self.ring.read(seq)
+        if item is None:
+            return seq, None, meta
+        array = np.array(item[0][:size])
+        if not self.ring.valid(seq):
+            array = None
+        return seq, array, meta
+
+    def close(self):
+        self.ring.close()
+
+    def unlink(self):
+        self.ring.unlink()
@@ -1,37 +1,161 @@
 import queue
+import select
+import time
+from fnmatch import fnmatchcase
 
 from pymavlink import mavutil
 
 from modules.logger import global_logger as logger
+from modules.telemetry_store import TelemetryStore
+
+# Message types consumed on the companion computer, shell-style patterns allowed
+MSG_TYPES = (
+    "ATTITUDE",
+    "GLOBAL_POSITION_INT",
+    "LOCAL_POSITION_NED",
+    "HEARTBEAT",
+    "RC_CHANNELS",
+    "MISSION_*",
+    "SYS_STATUS",
+    "RAW_IMU",
+)
+
+# Stream rates requested from the autopilot, Hz
+MSG_RATES = {
+    "ATTITUDE": 50,
+    "RAW_IMU": 50,
+    "GLOBAL_POSITION_INT": 10,
+    "LOCAL_POSITION_NED": 10,
+    "RC_CHANNELS": 5,
+    "SYS_STATUS": 2,
+}
+
+# How long the poller sleeps on the link waiting for data, s
+SELECT_TIMEOUT = 0.1
 
 
 class PosData:
     def __init__(
-        self, port="udp:127.0.0.1:14551", gps_baudrate=115200, gps_rate_ms=100
+        self,
+        port="udp:127.0.0.1:14551",
+        gps_baudrate=115200,
+        gps_rate_ms=100,
+        msg_types=None,
+        msg_rates=None,
+        select_timeout=SELECT_TIMEOUT,
     ):
         # set connection with PixHawk
         self._master = mavutil.mavlink_connection(port)
         self._master.wait_heartbeat()
         logger.info(f"got heartbeat on {port}")
 
+        # None keeps every message type
+        self.msg_types = msg_types
+        self.select_timeout = select_timeout
+        self._accepted = {}
+        if msg_types is not None:
+            self._filter_decode()
+
+        if msg_rates:
+            self._request_intervals(msg_rates)
+
         # init data storage
         self.pdata = {}
 
+    def _request_intervals(self, msg_rates):
+        for type, rate in msg_rates.items():
+            msg_id = getattr(mavutil.mavlink, f"MAVLINK_MSG_ID_{type}", None)
+            if msg_id is None:
+                logger.warning(f"unknown MAVLink message {type}, rate is not set")
+                continue
+            self._master.mav.command_long_send(
+                self._master.target_system,
+                self._master.target_component,
+                mavutil.mavlink.MAV_CMD_SET_MESSAGE_INTERVAL,
+                0,  # confirmation
+                msg_id,
+                int(1e6 / rate),  # interval, us
+                0, 0, 0, 0, 0,
+            )
+        logger.info(f"requested message rates {msg_rates}")
+
+    def _accepts(self, type):
+        accepted = self._accepted.get(type)
+        if accepted is None:
+            accepted = "UNKNOWN" not in type and (
+                self.msg_types is None
+                or any(fnmatchcase(type, pattern) for pattern in self.msg_types)
+            )
+            self._accepted[type] = accepted
+        return accepted
+
+    def _filter_decode(self):
+        # unpack and CRC-check only the accepted message ids, the rest come
+        # back from recv_match as cheap MAVLink_unknown placeholders
+        mav = self._master.mav
+        decode = mav.decode
+        mavlink = mavutil.mavlink
+        # the heartbeat is still tracked by mavutil for target ids and modes
+        wanted = {
+            msg_id
+            for msg_id, msg_cls in mavlink.mavlink_map.items()
+            if msg_cls.msgname == "HEARTBEAT" or self._accepts(msg_cls.msgname)
+        }
+
+        def filtered(msgbuf):
+            if msgbuf[0] == mavlink.PROTOCOL_MARKER_V1:
+                msg_id = msgbuf[5]
+            else:
+                msg_id = msgbuf[7] | msgbuf[8] << 8 | msgbuf[9] << 16
+            if msg_id in wanted:
+                return decode(msgbuf)
+            return mavlink.MAVLink_unknown(msg_id, msgbuf)
+
+        mav.decode = filtered
+
+    def _wait_link(self):
+        # block on the link socket/tty instead of spinning on recv_match
+        fd = getattr(self._master, "fd", None)
+        if fd is None:
+            time.sleep(self.select_timeout / 50)
+            return
+        select.select([fd], [], [], self.select_timeout)
+
     def _fetch_PX(self):
+        count = 0
         while msg := self._master.recv_match(blocking=False):
-            text = msg.to_dict()
-            type = text["mavpackettype"]
-            if "UNKNOWN" not in type:
-                self.pdata[type] = text
+            type = msg.get_type()
+            if self._accepts(type):
+                data = msg.to_dict()
+                # host receive time, as the TelemetryStore records it
+                data["_recv_time"] = time.time()
+                self.pdata[type] = data
+                count += 1
+        return count
+
+    def _publish_PX(self, store):
+        count = 0
+        while msg := self._master.recv_match(blocking=False):
+            type = msg.get_type()
+            if self._accepts(type) and store.accepts(type):
+                store.publish(type, msg)
+            count += 1
+        return count
 
     def run(self, stop_value, outque):
         logger.info("start polling pos data")
 
+        if isinstance(outque, TelemetryStore):
+            self._run_store(stop_value, outque)
+            return
+
         while not stop_value.value:
             try:
                 # finally poll pixhawk until empty packet
                 try:
-                    self._fetch_PX()
+                    if not self._fetch_PX():
+                        self._wait_link()
+                        continue
                 except Exception as e:
                     logger.error(f"PixHawk read error {e}")
 
@@ -50,3 +174,16 @@ class PosData:
                 continue
 
         logger.info("pixhawk, imu, altimeter polling stopped")
+
+    def _run_store(self, stop_value, store):
+        while not stop_value.value:
+            try:
+                if not self._publish_PX(store):
+                    self._wait_link()
+            except KeyboardInterrupt:
+                logger.warning("keybopard interrupt in posdata poll process")
+                break
+            except Exception as e:
+                logger.error(f"PixHawk read error {e}")
+
+        logger.info("pixhawk, imu, altimeter polling stopped")
@@ -0,0 +1,156 @@
+from bisect import bisect_right
+from collections import deque
+
+import numpy as np
+
+from modules.telemetry_store import TelemetryStore
+
+# Number of skew measurements kept for the statistics
+SKEW_WINDOW = 100
+
+# Fields of GLOBAL_POSITION_INT that are interpolated linearly
+POSITION_FIELDS = ("lat", "lon", "alt", "relative_alt", "vx", "vy", "vz")
+ATTITUDE_RATES = ("rollspeed", "pitchspeed", "yawspeed")
+
+
+def euler2quat(roll, pitch, yaw):
+    cr, sr = np.cos(roll / 2), np.sin(roll / 2)
+    cp, sp = np.cos(pitch / 2), np.sin(pitch / 2)
+    cy, sy = np.cos(yaw / 2), np.sin(yaw / 2)
+    return np.asarray(
+        [
+            cr * cp * cy + sr * sp * sy,
+            sr * cp * cy - cr * sp * sy,
+            cr * sp * cy + sr * cp * sy,
+            cr * cp * sy - sr * sp * cy,
+        ]
+    )
+
+
+def quat2euler(q):
+    w, x, y, z = q
+    roll = np.arctan2(2 * (w * x + y * z), 1 - 2 * (x * x + y * y))
+    pitch = np.arcsin(np.clip(2 * (w * y - z * x), -1, 1))
+    yaw = np.arctan2(2 * (w * z + x * y), 1 - 2 * (y * y + z * z))
+    return roll, pitch, yaw
+
+
+def slerp(q0, q1, alpha):
+    dot = np.dot(q0, q1)
+    if dot < 0:
+        q1, dot = -q1, -dot
+    if dot > 0.9995:
+        # almost the same orientation, lerp is accurate and stable
+        q = q0 + alpha * (q1 - q0)
+        return q / np.linalg.norm(q)
+    theta = np.arccos(dot)
+    return (np.sin((1 - alpha) * theta) * q0 + np.sin(alpha * theta) * q1) / np.sin(theta)
+
+
+class SensorSync:
+    """
+    Aligns autopilot telemetry to frame capture times.
+
+    Keeps a short ring of timestamped ATTITUDE and GLOBAL_POSITION_INT
+    samples (host receive time) and interpolates them to the frame time:
+    slerp for the attitude angles, linear for everything else. Times outside
+    the buffered window are clamped to the nearest sample, never extrapolated.
+    The skew between the frame and the nearest attitude sample is kept as a
+    metric.
+    """
+
+    def __init__(self, depth=32):
+        self._samples = {
+            "ATTITUDE": deque(maxlen=depth),
+            "GLOBAL_POSITION_INT": deque(maxlen=depth),
+        }
+        self._since = {msg_type: 0 for msg_type in self._samples}
+        self.skew = None
+        self._skews = deque(maxlen=SKEW_WINDOW)
+
+    def update(self, source):
+        """Take new samples from a TelemetryStore or from a msg dict."""
+        if isinstance(source, TelemetryStore):
+            for msg_type in self._samples:
+                for number, data in source.history(msg_type, self._since[msg_type]):
+                    self._push(msg_type, data["_recv_time"], data)
+                    self._since[msg_type] = number + 1
+        else:
+            for msg_type in self._samples:
+                # a sample without its receive time cannot be placed in time
+                if msg_type in source and "_recv_time" in source[msg_type]:
+                    data = source[msg_type]
+                    self._push(msg_type, data["_recv_time"], data)
+
+    def _push(self, msg_type, t, data):
+        samples = self._samples[msg_type]
+        if samples and t <= samples[-1][0]:
+            return
+        samples.append((t, data))
+
+    def _bracket(self, msg_type, t):
+        samples = self._samples[msg_type]
+        if not samples:
+            return None
+        ii = bisect_right([ts for ts, _ in samples], t)
+        if ii == 0:
+            return samples[0], samples[0], 0.0
+        if ii == len(samples):
+            return samples[-1], samples[-1], 0.0
+        (t0, d0), (t1, d1) = samples[ii - 1], samples[ii]
+        return (t0, d0), (t1, d1), (t - t0) / (t1 - t0)
+
+    def attitude_at(self, t):
+        bracket = self._bracket("ATTITUDE", t)
+        if bracket is None:
+            return None
+        (t0, d0), (t1, d1), alpha = bracket
+
+        # distance to the nearest real sample
+        self.skew = t - (t0 if alpha < 0.5 else t1)
+        self._skews.append(self.skew)
+
+        att = dict(d0 if alpha < 0.5 else d1)
+        if alpha > 0:
+            q = slerp(
+                euler2quat(d0["roll"], d0["pitch"], d0["yaw"]),
+                euler2quat(d1["roll"], d1["pitch"], d1["yaw"]),
+                alpha,
+            )
+            att["roll"], att["pitch"], att["yaw"] = (float(a) for a in quat2euler(q))
+            for field in ATTITUDE_RATES:
+                att[field] = d0[field] + alpha * (d1[field] - d0[field])
+        att["_recv_time"] = t
+        return att
+
+    def position_at(self, t):
+        bracket = self._bracket("GLOBAL_POSITION_INT", t)
+        if bracket is None:
+            return None
+        (t0, d0), (t1, d1), alpha = bracket
+
+        pos = dict(d0 if alpha < 0.5 else d1)
+        if alpha > 0:
+            for field in POSITION_FIELDS:
+                pos[field] = int(round(d0[field] + alpha * (d1[field] - d0[field])))
+        pos["_recv_time"] = t
+        return pos
+
+    def apply(self, msg: dict, t: float) -> dict:
+        """Replace the telemetry in ``msg`` with values aligned to time ``t``."""
+        if (att := self.attitude_at(t)) is not None:
+            msg["ATTITUDE"] = att
+        if (pos := self.position_at(t)) is not None:
+            msg["GLOBAL_POSITION_INT"] = pos
+        msg["SYNC"] = self.stats()
+        return msg
+
+    def stats(self) -> dict:
+        if not self._skews:
+            return dict(skew_ms=None, mean_abs_skew_ms=None, max_abs_skew_ms=None)
+        skews = np.abs(self._skews)
+        return dict(
+            skew_ms=float(self.skew * 1000),
+            mean_abs_skew_ms=float(skews.mean() * 1000),
+            max_abs_skew_ms=float(skews.max() * 1000),
+        )
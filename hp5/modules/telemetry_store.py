@@ -0,0 +1,251 @@
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+# Fields kept for every subscribed MAVLink message type
+TELEMETRY_LAYOUT = {
+    "ATTITUDE": [
+        ("time_boot_ms", "u4"),
+        ("roll", "f4"),
+        ("pitch", "f4"),
+        ("yaw", "f4"),
+        ("rollspeed", "f4"),
+        ("pitchspeed", "f4"),
+        ("yawspeed", "f4"),
+    ],
+    "GLOBAL_POSITION_INT": [
+        ("time_boot_ms", "u4"),
+        ("lat", "i4"),
+        ("lon", "i4"),
+        ("alt", "i4"),
+        ("relative_alt", "i4"),
+        ("vx", "i2"),
+        ("vy", "i2"),
+        ("vz", "i2"),
+        ("hdg", "u2"),
+    ],
+    "LOCAL_POSITION_NED": [
+        ("time_boot_ms", "u4"),
+        ("x", "f4"),
+        ("y", "f4"),
+        ("z", "f4"),
+        ("vx", "f4"),
+        ("vy", "f4"),
+        ("vz", "f4"),
+    ],
+    "HEARTBEAT": [
+        ("type", "u1"),
+        ("autopilot", "u1"),
+        ("base_mode", "u1"),
+        ("custom_mode", "u4"),
+        ("system_status", "u1"),
+        ("mavlink_version", "u1"),
+    ],
+    "RC_CHANNELS": [("time_boot_ms", "u4"), ("chancount", "u1")]
+    + [(f"chan{ii}_raw", "u2") for ii in range(1, 19)]
+    + [("rssi", "u1")],
+    "MISSION_COUNT": [
+        ("target_system", "u1"),
+        ("target_component", "u1"),
+        ("count", "u2"),
+    ],
+    "MISSION_CURRENT": [("seq", "u2")],
+    "SYS_STATUS": [
+        ("voltage_battery", "u2"),
+        ("current_battery", "i2"),
+        ("battery_remaining", "i1"),
+        ("load", "u2"),
+        ("drop_rate_comm", "u2"),
+    ],
+    "RAW_IMU": [
+        ("time_usec", "u8"),
+        ("xacc", "i2"),
+        ("yacc", "i2"),
+        ("zacc", "i2"),
+        ("xgyro", "i2"),
+        ("ygyro", "i2"),
+        ("zgyro", "i2"),
+        ("xmag", "i2"),
+        ("ymag", "i2"),
+        ("zmag", "i2"),
+    ],
+}
+
+# seqlock counter and host receive time precede the message fields
+HEADER_FIELDS = [("_seq", "u8"), ("_recv_time", "f8")]
+READ_RETRIES = 100
+
+# Message types that keep a short history of samples, e.g. for time alignment
+HISTORY_DEPTH = {
+    "ATTITUDE": 32,
+    "GLOBAL_POSITION_INT": 16,
+}
+
+
+class TelemetryStore:
+    """
+    Latest-value MAVLink telemetry in shared memory.
+
+    Every message type of the layout owns a small ring of fixed-size records
+    (a single one unless listed in ``history``), each guarded by a seqlock:
+    the writer makes the counter odd, writes the record and makes it even
+    again, readers retry until they see the same even counter before and
+    after copying. Readers therefore never block the poller and nothing is
+    pickled. ``get`` returns the same ``(msg, timestamp)`` pair main_loop used
+    to receive from the position queue.
+    """
+
+    def __init__(self, layout=TELEMETRY_LAYOUT, history=HISTORY_DEPTH, name=None, create=True):
+        self.layout = {key: list(fields) for key, fields in layout.items()}
+        self.history_depth = {key: history.get(key, 1) for key in self.layout}
+        self.dtypes = {}
+        self._offsets = {}
+        # number of samples ever published per type precede the records
+        size = 8 * len(self.layout)
+        for key, fields in self.layout.items():
+            fields = HEADER_FIELDS + fields
+            # keep every record 8-byte aligned
+            itemsize = -(-np.dtype(fields).itemsize // 8) * 8
+            self.dtypes[key] = np.dtype(
+                dict(names=[n for n, _ in fields], formats=[f for _, f in fields], itemsize=itemsize)
+            )
+            self._offsets[key] = size
+            size += self.history_depth[key] * itemsize
+
+        self._shm = shared_memory.SharedMemory(name=name, create=create, size=size if create else 0)
+        self.name = self._shm.name
+        self._counts = np.ndarray((len(self.layout),), dtype=np.uint64, buffer=self._shm.buf)
+        self._index = {key: ii for ii, key in enumerate(self.layout)}
+        self._records = {
+            key: np.ndarray(
+                (self.history_depth[key],), dtype=dtype, buffer=self._shm.buf, offset=self._offsets[key]
+            )
+            for key, dtype in self.dtypes.items()
+        }
+        if create:
+            self._counts[:] = 0
+            for record in self._records.values():
+                record[:] = np.zeros((), dtype=record.dtype)
+
+        self._last = {}
+
+    def __getstate__(self):
+        return dict(layout=self.layout, history=self.history_depth, name=self.name)
+
+    def __setstate__(self, state):
+        self.__init__(create=False, **state)
+
+    def accepts(self, msg_type: str) -> bool:
+        return msg_type in self._records
+
+    # writer side, single process only
+
+    def publish(self, msg_type: str, msg, recv_time: float | None = None) -> bool:
+        """
+        Store the fields of a pymavlink message (or dict). Returns False when
+        the values did not change since the last publish.
+        """
+        records = self._records.get(msg_type)
+        if records is None:
+            return False
+
+        if isinstance(msg, dict):
+            values = tuple(msg[field] for field, _ in self.layout[msg_type])
+        else:
+            values = tuple(getattr(msg, field) for field, _ in self.layout[msg_type])
+        if self._last.get(msg_type) == values:
+            return False
+        self._last[msg_type] = values
+
+        if recv_time is None:
+            recv_time = time.time()
+        index = self._index[msg_type]
+        count = int(self._counts[index])
+        slot = count % len(records)
+        record = records[slot:slot + 1]
+        seq = int(record["_seq"][0])
+        record["_seq"] = seq + 1
+        record[0] = (seq + 1, recv_time, *values)
+        record["_seq"] = seq + 2
+        self._counts[index] = count + 1
+        return True
+
+    # reader side
+
+    def _read_slot(self, msg_type, slot):
+        """Number of writes to the slot and a consistent copy of its message."""
+        record = self._records[msg_type][slot:slot + 1]
+        for _ in range(READ_RETRIES):
+            seq = int(record["_seq"][0])
+            if seq % 2:
+                continue
+            data = record.copy()
+            if int(record["_seq"][0]) == seq:
+                break
+        else:
+            return 0, None
+
+        if seq == 0:
+            return 0, None
+        item = data[0].item()
+        msg = dict(zip(data.dtype.names[2:], item[2:]))
+        msg["mavpackettype"] = msg_type
+        msg["_recv_time"] = item[1]
+        return seq // 2, msg
+
+    def count(self, msg_type: str) -> int:
+        """Number of samples of the type published so far."""
+        return int(self._counts[self._index[msg_type]])
+
+    def read(self, msg_type: str) -> dict | None:
+        """Consistent copy of the latest message of the type or None."""
+        count = self.count(msg_type)
+        if count == 0:
+            return None
+        return self._read_slot(msg_type, (count - 1) % self.history_depth[msg_type])[1]
+
+    def history(self, msg_type: str, since: int = 0) -> list[tuple[int, dict]]:
+        """
+        Samples of the type numbered from ``since`` (as counted by ``count``),
+        oldest first, limited to what the ring still holds.
+        """
+        count = self.count(msg_type)
+        depth = self.history_depth[msg_type]
+        samples = []
+        for number in range(max(since, count - depth), count):
+            writes, msg = self._read_slot(msg_type, number % depth)
+            # sample ``number`` is the ``number // depth + 1``-th write to its
+            # slot, anything else was lapped by the writer meanwhile
+            if msg is not None and writes == number // depth + 1:
+                samples.append((number, msg))
+        return samples
+
+    def snapshot(self) -> dict:
+        msg = {}
+        for msg_type in self._records:
+            if (data := self.read(msg_type)) is not None:
+                msg[msg_type] = data
+        return msg
+
+    def get(self, block=True, timeout=None):
+        msg = self.snapshot()
+        if "RAW_IMU" in msg:
+            return msg, msg["RAW_IMU"]["time_usec"] / 1000
+        return msg, -1
+
+    def empty(self) -> bool:
+        return False
+
+    def full(self) -> bool:
+        return False
+
+    def close(self):
+        self._records = {}
+        try:
+            self._shm.close()
+        except BufferError:
+            pass
+
+    def unlink(self):
+        self._shm.unlink()
@@ -0,0 +1,169 @@
+import queue
+import time
+from multiprocessing import Process, Queue, Value
+
+import numpy as np
+
+from modules.frame_ring import ShmQueue
+from modules.logger import global_logger as logger
+from modules.vio.vio_ort import RAD, VIO
+
+# Frames older than this are dropped by every stage, s
+LATENCY_BUDGET = 0.25
+# Items buffered between two stages
+STAGE_QUEUE_SIZE = 2
+# Width of a packed feature row: x, y, score and a 64-d descriptor
+FEATURE_WIDTH = 67
+# How long a worker waits for input before checking the stop flag, s
+POLL_TIMEOUT = 0.1
+
+
+def _expired(timestamp, budget):
+    return time.time() - timestamp > budget
+
+
+def _warp_worker(stop, frames, crops, vio_kwargs, budget):
+    vio = VIO(**vio_kwargs, stages=('warp',))
+    while not stop.value:
+        try:
+            seq, frame, meta = frames.get(timeout=POLL_TIMEOUT)
+        except queue.Empty:
+            continue
+        try:
+            msg, timestamp = meta
+            if frame is None or _expired(timestamp, budget):
+                continue
+            crop, angles, height, dpp = vio.warp(frame, msg)
+            crops.put(crop, (seq, timestamp, angles, height, dpp), timestamp)
+        except KeyboardInterrupt:
+            break
+        except Exception as e:
+            logger.error(f"VIO warp stage error {e}")
+
+
+def _extract_worker(stop, crops, features, vio_kwargs, budget):
+    vio = VIO(**vio_kwargs, stages=('features',))
+    while not stop.value:
+        try:
+            crop_seq, crop, meta = crops.get(timeout=POLL_TIMEOUT)
+        except queue.Empty:
+            continue
+        try:
+            seq, timestamp, angles, height, dpp = meta
+            if crop is None or _expired(timestamp, budget):
+                continue
+            packed = vio.pack_features(vio.detect_and_compute(crop))
+            features.put(packed, (seq, crop_seq, timestamp, angles, height, dpp), timestamp)
+        except KeyboardInterrupt:
+            break
+        except Exception as e:
+            logger.error(f"VIO feature stage error {e}")
+
+
+def _pose_worker(stop, features, results, vio_kwargs, budget):
+    vio = VIO(**vio_kwargs, stages=('pose',))
+    last_seq = -1
+    while not stop.value:
+        try:
+            _, packed, meta = features.get(timeout=POLL_TIMEOUT)
+        except queue.Empty:
+            continue
+        try:
+            seq, crop_seq, timestamp, angles, height, dpp = meta
+            # stages are FIFO, this only guards against a restarted producer
+            if packed is None or seq <= last_seq or _expired(timestamp, budget):
+                continue
+            last_seq = seq
+            trace_pt = dict(crop=None,
+                            out=vio.unpack_features(packed),
+                            angles=angles,
+                            height=height,
+                            )
+            result = vio.update(trace_pt, dpp, timestamp)
+            result.update(seq=seq, crop_seq=crop_seq, latency=time.time() - timestamp)
+            if results.full():
+                try:
+                    results.get_nowait()
+                except queue.Empty:
+                    pass
+            results.put(result)
+        except KeyboardInterrupt:
+            break
+        except Exception as e:
+            logger.error(f"VIO pose stage error {e}")
+
+
+class VIOPipeline:
+    """
+    VIO.add_trace_pt split into three worker processes: geometric warp,
+    XFeat feature extraction and matching/pose. Frames and features travel
+    through bounded shared-memory queues that drop the oldest item when a
+    stage falls behind, and every stage drops frames older than the latency
+    budget, so throughput follows the slowest stage instead of the sum.
+    """
+
+    def __init__(self, lat0=0, lon0=0, alt0=0, frame_shape=(480, 640, 3), top_k=512,
+                 budget=LATENCY_BUDGET, maxsize=STAGE_QUEUE_SIZE, **vio_kwargs):
+        vio_kwargs.update(lat0=lat0, lon0=lon0, alt0=alt0, top_k=top_k)
+        self.budget = budget
+        self.stop = Value("i", 0)
+        self.frames = ShmQueue(frame_shape, np.uint8, maxsize)
+        self.crops = ShmQueue((RAD, RAD, frame_shape[2]), np.uint8, maxsize)
+        self.features = ShmQueue((top_k, FEATURE_WIDTH), np.float32, maxsize)
+        self.results = Queue(maxsize)
+
+        self._last_seq = -1
+        self.dropped = 0
+
+        stages = (
+            (_warp_worker, self.frames, self.crops),
+            (_extract_worker, self.crops, self.features),
+            (_pose_worker, self.features, self.results),
+        )
+        self.processes = []
+        for target, inque, outque in stages:
+            process = Process(
+                target=target,
+                args=(self.stop, inque, outque, vio_kwargs, budget),
+                daemon=True,
+            )
+            process.start()
+            self.processes.append(process)
+
+    def submit(self, frame, msg, timestamp):
+        """Queue a frame with its telemetry, never blocks."""
+        # only plain telemetry goes to the workers
+        msg = {key: value for key, value in msg.items() if key != "VIO"}
+        self.frames.put(frame, (msg, timestamp), timestamp)
+
+    def poll(self):
+        """Newest finished result or None, older finished results are skipped."""
+        result = None
+        while True:
+            try:
+                result = self.results.get_nowait()
+            except queue.Empty:
+                break
+        if result is None or _expired(result["timestamp"], self.budget):
+            return None
+
+        self.dropped += result["seq"] - self._last_seq - 1
+        self._last_seq = result["seq"]
+
+        # the crop is read back from the shared ring if it is still there,
+        # the slot may be overwritten while it is copied
+        crop_seq = result.pop("crop_seq")
+        item = self.crops.ring.read(crop_seq)
+        crop = None if item is None else np.array(item[0])
+        result["crop"] = crop if self.crops.ring.valid(crop_seq) else None
+        return result
+
+    def close(self):
+        self.stop.value = 1
+        for process in self.processes:
+            process.join(timeout=1)
+            if process.is_alive():
+                process.terminate()
+        for shared in (self.frames, self.crops, self.features):
+            shared.close()
+            shared.unlink()
@@ -1,7 +1,11 @@
 import datetime
+from collections import OrderedDict
 
 import numpy as np
 
+# remap coordinate that is guaranteed to land on the constant border
+OUT_OF_BOUNDS = -16
+
 
 def count_none_recursive(arr):
     count = 0
@@ -35,7 +39,8 @@ def calc_GPS_week_time():
 
 
 def fetch_angles(msg):
-    angles = msg["ATTITUDE"]
+    # copy, msg is recorded after VIO and must keep the autopilot yaw
+    angles = dict(msg["ATTITUDE"])
     angles["yaw"] = -angles["yaw"]
     return angles
 
@@ -60,7 +65,7 @@ def extract_neighborhood(image, keypoint, size):
         return nbh
 
 
-def fisheye2rectilinear(focal, pp, rw, rh, fproj="equidistant"):
+def fisheye_offsets(focal, rw, rh, fproj="equidistant"):
     # Create a grid for the rectilinear image
     rx, ry = np.meshgrid(np.arange(rw) - rw // 2, np.arange(rh) - rh // 2)
     r = np.sqrt(rx**2 + ry**2) / focal
@@ -77,12 +82,118 @@ def fisheye2rectilinear(focal, pp, rw, rh, fproj="equidistant"):
 
     angle_t = np.arctan2(ry, rx)
 
-    pt_x = focal * angle_n * np.cos(angle_t) + pp[0]
-    pt_y = focal * angle_n * np.sin(angle_t) + pp[1]
+    # Offsets of the fisheye sampling points from the principal point
+    off_x = focal * angle_n * np.cos(angle_t)
+    off_y = focal * angle_n * np.sin(angle_t)
+
+    return off_x, off_y
+
+
+def fisheye2rectilinear(focal, pp, rw, rh, fproj="equidistant"):
+    off_x, off_y = fisheye_offsets(focal, rw, rh, fproj)
+
+    map_x = (off_x + pp[0]).astype(np.float32)
+    map_y = (off_y + pp[1]).astype(np.float32)
+
+    return map_x, map_y
 
-    map_x = pt_x.astype(np.float32)
-    map_y = pt_y.astype(np.float32)
 
+class RemapCache:
+    """
+    LRU cache of fisheye->rectilinear remap tables keyed by the nadir point.
+
+    The radius/angle part of the projection does not depend on the principal
+    point, so it is computed once; a miss only adds the quantized point to the
+    precomputed offsets. Fused tables (rotation and mask folded in) are kept
+    in the same LRU keyed by the point and the yaw quantized to `yaw_quant`
+    radians; with `yaw_quant=0` they are built for the exact yaw every call.
+    """
+
+    def __init__(self, focal, rw, rh, fproj="equidistant", maxsize=32, quant=1, yaw_quant=0.0):
+        off_x, off_y = fisheye_offsets(focal, rw, rh, fproj)
+        self.off_x = off_x.astype(np.float32)
+        self.off_y = off_y.astype(np.float32)
+        self.maxsize = maxsize
+        self.quant = max(1, int(quant))
+        self.yaw_quant = yaw_quant
+        self.hits = 0
+        self.misses = 0
+        self._maps = OrderedDict()
+
+    def key(self, pp):
+        q = self.quant
+        return (int(round(pp[0] / q)) * q, int(round(pp[1] / q)) * q)
+
+    def _lookup(self, key):
+        maps = self._maps.get(key)
+        if maps is not None:
+            self.hits += 1
+            self._maps.move_to_end(key)
+        else:
+            self.misses += 1
+        return maps
+
+    def _store(self, key, maps):
+        self._maps[key] = maps
+        if len(self._maps) > self.maxsize:
+            self._maps.popitem(last=False)
+        return maps
+
+    def get(self, pp):
+        key = self.key(pp)
+        maps = self._lookup(key)
+        if maps is not None:
+            return maps
+        return self._store(key, (self.off_x + np.float32(key[0]), self.off_y + np.float32(key[1])))
+
+    def warp(self, pp, angle, mask=None):
+        """
+        Compose rotation by `angle` (radians, counter-clockwise as PIL rotate)
+        about `pp` with the fisheye unwarp. Pixels that fall outside `mask`
+        are redirected out of the frame so cv2.remap fills them with zeros.
+        The returned tables may be cached and must not be modified.
+        """
+        if not self.yaw_quant:
+            return self._warp(pp, angle, mask)
+        step = int(round(angle / self.yaw_quant))
+        key = (*self.key(pp), step)
+        maps = self._lookup(key)
+        if maps is not None:
+            return maps
+        return self._store(key, self._warp(key[:2], step * self.yaw_quant, mask))
+
+    def _warp(self, pp, angle, mask):
+        c, s = np.float32(np.cos(angle)), np.float32(np.sin(angle))
+        map_x = c * self.off_x - s * self.off_y + np.float32(pp[0])
+        map_y = s * self.off_x + c * self.off_y + np.float32(pp[1])
+        if mask is not None:
+            fold_mask(map_x, map_y, mask)
+        return map_x, map_y
+
+    def stats(self):
+        total = self.hits + self.misses
+        return dict(
+            hits=self.hits,
+            misses=self.misses,
+            size=len(self._maps),
+            hit_rate=self.hits / total if total else 0.0,
+        )
+
+    def clear(self):
+        self._maps.clear()
+        self.hits = 0
+        self.misses = 0
+
+
+def fold_mask(map_x, map_y, mask, sentinel=OUT_OF_BOUNDS):
+    h, w = mask.shape[:2]
+    ix = np.rint(map_x).astype(np.int32)
+    iy = np.rint(map_y).astype(np.int32)
+    inside = (ix >= 0) & (ix < w) & (iy >= 0) & (iy < h)
+    valid = np.zeros_like(inside)
+    valid[inside] = mask[iy[inside], ix[inside]]
+    map_x[~valid] = sentinel
+    map_y[~valid] = sentinel
     return map_x, map_y
 
 
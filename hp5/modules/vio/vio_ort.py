@@ -1,5 +1,6 @@
 import json
 import os
+from concurrent.futures import ThreadPoolExecutor
 from time import time
 
 import cv2
@@ -7,11 +8,10 @@ import numpy as np
 from PIL import Image
 from pymavlink import mavutil
 
-from modules import XFeat
 from modules.vio.utils import (
     calc_GPS_week_time,
+    RemapCache,
     fetch_angles,
-    fisheye2rectilinear,
     preprocess_frame,
     pt2h,
 )
@@ -24,6 +24,7 @@ for shape in camparam['shapes']:
         MASK = np.zeros((camparam['imageHeight'], camparam['imageWidth'], 3), dtype=np.uint8)
         cnt = np.asarray(shape['points']).reshape(-1,1,2).astype(np.int32)
         cv2.drawContours(MASK, [cnt], -1, (255,255,255), -1)
+MASK2D = MASK[..., 0] > 0
 
 CENTER = [camparam['ppx'], camparam['ppy']]
 CENTER[0] += -6 #TODO insert corrections into file
@@ -38,30 +39,66 @@ HOMO_THR = 2.0
 NUM_MATCH_THR = 8
 TRACE_DEPTH = 4
 VEL_FIT_DEPTH = TRACE_DEPTH
+POSE_MODEL = 'homography' # 'homography' or 'similarity' (4-DOF, cheaper)
+POSE_WORKERS = min(TRACE_DEPTH + 1, os.cpu_count() or 1) # threads for RANSAC over the trace
 METERS_DEG = 111320
+REMAP_CACHE_SIZE = 32 # number of remap tables kept for recent nadir points
+DPP_QUANT = 1 # nadir point quantization in pixels for the remap cache
+YAW_QUANT = np.deg2rad(0.25) # yaw quantization of the cached fused remap tables, 0 rebuilds them every frame
+XFEAT_BACKEND = 'torch' # 'torch' or 'numpy' (no torch import at runtime)
+XFEAT_INFERENCE = 'onnx' # 'onnx', 'rknn' (NPU) or 'mock', falls back to onnx
+STAGES = ('warp', 'features', 'pose') # parts of the pipeline a VIO instance runs
 
 FLAGS = mavutil.mavlink.GPS_INPUT_IGNORE_FLAG_VEL_VERT | mavutil.mavlink.GPS_INPUT_IGNORE_FLAG_VERTICAL_ACCURACY | mavutil.mavlink.GPS_INPUT_IGNORE_FLAG_HORIZONTAL_ACCURACY
 
 
 class VIO():
-    def __init__(self, lat0=0, lon0=0, alt0=0, top_k=512, detection_threshold=0.05):
+    def __init__(self, lat0=0, lon0=0, alt0=0, top_k=512, detection_threshold=0.05, fused_warp=True,
+                 batch_match=True, pose_model=POSE_MODEL, pose_workers=POSE_WORKERS, backend=XFEAT_BACKEND,
+                 inference=XFEAT_INFERENCE, weights=None, stages=STAGES):
         self.lat0 = lat0
         self.lon0 = lon0
-        self._matcher = XFeat(top_k=top_k, detection_threshold=detection_threshold)
+        self._matcher = None
+        if 'features' in stages or 'pose' in stages:
+            if backend == 'numpy':
+                from modules.xfeat.xfeat_np import XFeatNP as matcher_cls
+            elif backend == 'torch':
+                from modules.xfeat.xfeat_ort import XFeat as matcher_cls
+            else:
+                raise ValueError(f"Unknown XFeat backend {backend}")
+            # the backbone sees the crop resized to a multiple of 32
+            side = RAD // 32 * 32
+            self._matcher = matcher_cls(top_k=top_k, detection_threshold=detection_threshold,
+                                        weights=weights, inference=inference, input_shape=(1, 3, side, side))
         self.track = []
         self.trace = []
         self.prev = None
         self.HoM = None
         self.height = 0
         self.P0 = None
+        self.fused_warp = fused_warp
+        self.batch_match = batch_match
+        tracking = 'pose' in stages
+        # descriptors of the trace points, one bank slot per point
+        self._bank = self._matcher.descriptor_bank(TRACE_DEPTH + 1) if batch_match and tracking else None
+        self.pose_model = pose_model
+        self._pose_pool = ThreadPoolExecutor(pose_workers) if pose_workers > 1 and tracking else None
+        self._remap_cache = RemapCache(FOCAL, RAD, RAD, maxsize=REMAP_CACHE_SIZE, quant=DPP_QUANT,
+                                       yaw_quant=YAW_QUANT) if 'warp' in stages else None
 
     def add_trace_pt(self, frame, msg):
+        timestamp = time()
+        crop, angles, height, dpp = self.warp(frame, msg)
+        trace_pt = dict(crop=crop,
+                        out= self.detect_and_compute(crop),
+                        angles=angles,
+                        height=height,
+                       )
+        return self.update(trace_pt, dpp, timestamp)
 
+    def warp(self, frame, msg):
         angles= fetch_angles(msg)
         height = self.fetch_height(msg)
-        timestamp = time()
-
-        frame = preprocess_frame(frame, MASK)
 
         roll, pitch = angles['roll'] / np.pi * 180, angles['pitch'] / np.pi * 180
 
@@ -69,18 +106,27 @@ class VIO():
                  int(CENTER[1] + pitch * FOCAL_DPP_CORR)
         )
 
-        rotated = Image.fromarray(frame).rotate(angles['yaw']/np.pi*180, center=dpp)
-        rotated = np.asarray(rotated)
+        if self.fused_warp:
+            # yaw derotation, mask and unwarp in a single remap pass
+            map_x, map_y = self._remap_cache.warp(dpp, angles['yaw'], MASK2D)
+            crop = cv2.remap(frame, map_x, map_y, interpolation=cv2.INTER_LINEAR, borderMode=cv2.BORDER_CONSTANT)
+        else:
+            frame = preprocess_frame(frame, MASK)
+            rotated = Image.fromarray(frame).rotate(angles['yaw']/np.pi*180, center=dpp)
+            rotated = np.asarray(rotated)
 
-        map_x, map_y = fisheye2rectilinear(FOCAL, dpp, RAD, RAD)
-        crop = cv2.remap(rotated, map_x, map_y, interpolation=cv2.INTER_LINEAR, borderMode=cv2.BORDER_CONSTANT)
-        trace_pt = dict(crop=crop,
-                        out= self.detect_and_compute(crop),
-                        angles=angles,
-                        height=height,
-                       )
+            map_x, map_y = self._remap_cache.get(dpp)
+            crop = cv2.remap(rotated, map_x, map_y, interpolation=cv2.INTER_LINEAR, borderMode=cv2.BORDER_CONSTANT)
+
+        return crop, angles, height, dpp
+
+    def update(self, trace_pt, dpp, timestamp):
+        height = trace_pt['height']
+        crop = trace_pt['crop']
 
         if len(self.trace)>TRACE_DEPTH:
+            if self.batch_match:
+                self._bank.clear(self.trace[0]['slot'])
             self.trace = self.trace[1:]
 
         if len(self.trace)==0:
@@ -93,6 +139,10 @@ class VIO():
             else:
                 trace_pt['local_posm'] = local_pos_metric
 
+        if self.batch_match:
+            used = {pt['slot'] for pt in self.trace}
+            trace_pt['slot'] = min(set(range(len(self._bank))) - used)
+            self._bank.put(trace_pt['slot'], trace_pt['out']['descriptors'])
         self.trace.append(trace_pt)
         self.track.append(np.hstack((timestamp, trace_pt['local_posm'], height)))
 
@@ -127,51 +177,90 @@ class VIO():
                    )
 
     def calc_pos(self, next_pt):
-        poses = []
+        if self.batch_match:
+            # one GEMM against every trace point at once
+            bank_matches = self._matcher.match_bank(self._bank.feats,
+                                                    self._bank.valid,
+                                                    next_pt['out']['descriptors'],
+                                                    min_cossim=-1,
+                                                    )
+        pairs = []
         for prev_pt in self.trace:
-            match_prev, match_next, HoM = self.match_points_hom(prev_pt['out'],
-                                                                next_pt['out'],
-                                                                )
-
-            if len(match_prev) <= NUM_MATCH_THR:
-                continue
-
-            center_proj = cv2.perspectiveTransform(CROP_CENTER.reshape(-1,1,2), HoM).ravel()
-            pix_shift = CROP_CENTER - center_proj
-            pix_shift[0], pix_shift[1] = -pix_shift[1], pix_shift[0]
-            height = np.mean([prev_pt['height'], next_pt['height']])
-            ############################################
-            ##### умножать
-            metric_shift = pix_shift / FOCAL * height
-            #########################################
-            local_pos = prev_pt['local_posm'] + metric_shift
-            poses.append(local_pos)
-
-        if len(poses):
-            return np.mean(poses, axis=0)
+            idxs = bank_matches[prev_pt['slot']] if self.batch_match else None
+            mkpts_0, mkpts_1 = self.match_points(prev_pt['out'], next_pt['out'], idxs)
+            if len(mkpts_0) >= NUM_MATCH_THR:
+                pairs.append((prev_pt, mkpts_0, mkpts_1))
+
+        # RANSAC releases the GIL, so the trace pairs are estimated concurrently
+        if self._pose_pool is not None and len(pairs) > 1:
+            estimates = list(self._pose_pool.map(lambda pair: self.estimate_transform(pair[1], pair[2]), pairs))
         else:
-            return None
+            estimates = [self.estimate_transform(mkpts_0, mkpts_1) for _, mkpts_0, mkpts_1 in pairs]
 
-    def match_points_hom(self, out0, out1):
-        idxs0, idxs1 = self._matcher.match(out0['descriptors'], out1['descriptors'], min_cossim=-1 )
-        mkpts_0, mkpts_1 = out0['keypoints'][idxs0].numpy(), out1['keypoints'][idxs1].numpy()
-        mkpts_0 = mkpts_0[:MAX_NUM_PTS2HOMO]
-        mkpts_1 = mkpts_1[:MAX_NUM_PTS2HOMO]
+        good = [(prev_pt, HoM) for (prev_pt, _, _), (HoM, mask) in zip(pairs, estimates)
+                if HoM is not None and np.count_nonzero(mask) > NUM_MATCH_THR]
+        if not len(good):
+            return None
 
-        good_prev = []
-        good_next = []
-        if len(mkpts_0)>=NUM_MATCH_THR:
+        # project the crop center with every transform at once
+        HoMs = np.stack([HoM for _, HoM in good])
+        center_proj = HoMs @ np.append(CROP_CENTER, 1)
+        center_proj = center_proj[:, :2] / center_proj[:, 2:]
+        pix_shift = CROP_CENTER - center_proj
+        pix_shift = np.stack((-pix_shift[:, 1], pix_shift[:, 0]), axis=1)
+        height = (np.asarray([prev_pt['height'] for prev_pt, _ in good]) + next_pt['height']) / 2
+        ############################################
+        ##### умножать
+        metric_shift = pix_shift / FOCAL * height[:, None]
+        #########################################
+        local_pos = np.stack([prev_pt['local_posm'] for prev_pt, _ in good]) + metric_shift
+
+        return np.mean(local_pos, axis=0)
+
+    def match_points(self, out0, out1, idxs=None):
+        if idxs is None:
+            idxs = self._matcher.match(out0['descriptors'], out1['descriptors'], min_cossim=-1 )
+        idxs0, idxs1 = idxs
+        # np.asarray works for both backends, torch CPU tensors share memory
+        mkpts_0, mkpts_1 = np.asarray(out0['keypoints'][idxs0]), np.asarray(out1['keypoints'][idxs1])
+        return mkpts_0[:MAX_NUM_PTS2HOMO], mkpts_1[:MAX_NUM_PTS2HOMO]
+
+    def estimate_transform(self, mkpts_0, mkpts_1):
+        if self.pose_model == 'similarity':
+            # the crop is already yaw-derotated, a 4-DOF model is enough
+            HoM, mask = cv2.estimateAffinePartial2D(mkpts_0, mkpts_1, method=cv2.RANSAC,
+                                                    ransacReprojThreshold=HOMO_THR)
+            if HoM is not None:
+                HoM = np.vstack((HoM, [0, 0, 1]))
+        else:
             HoM, mask = cv2.findHomography(mkpts_0, mkpts_1, cv2.RANSAC, HOMO_THR)
 
-            mask = mask.ravel()
-            good_prev = np.asarray([pt for ii, pt in enumerate(mkpts_0) if mask[ii]])
-            good_next = np.asarray([pt for ii, pt in enumerate(mkpts_1) if mask[ii]])
+        if HoM is None:
+            return None, np.zeros(len(mkpts_0), dtype=bool)
+        return HoM, mask.ravel().astype(bool)
 
-            return good_prev, good_next, HoM
+    def match_points_hom(self, out0, out1, idxs=None):
+        mkpts_0, mkpts_1 = self.match_points(out0, out1, idxs)
+
+        if len(mkpts_0)>=NUM_MATCH_THR:
+            HoM, mask = self.estimate_transform(mkpts_0, mkpts_1)
+            if HoM is None:
+                return [], [], np.eye(3)
+
+            return mkpts_0[mask], mkpts_1[mask], HoM
 
         else:
             return [], [], np.eye(3)
 
+    def remap_cache_stats(self):
+        return self._remap_cache.stats()
+
+    def pack_features(self, out):
+        return self._matcher.pack_features(out)
+
+    def unpack_features(self, packed):
+        return self._matcher.unpack_features(packed)
+
     def detect_and_compute(self, frame):
         img = self._matcher.parse_input(frame)
         out = self._matcher.detectAndCompute(img)[0]
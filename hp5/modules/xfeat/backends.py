@@ -0,0 +1,242 @@
+"""
+Inference backends for the XFeat backbone.
+
+Every backend takes a float32 NCHW image batch and returns the raw network
+outputs ``(M1, K1, H1)`` as float32 NumPy arrays: descriptors (B, 64, H/8, W/8),
+keypoint logits (B, 65, H/8, W/8) and reliability (B, 1, H/8, W/8).
+"""
+
+import glob
+import os
+import re
+
+import numpy as np
+
+from modules.logger import global_logger as logger
+
+WEIGHTS_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(__file__))), "weights"
+)
+DEFAULT_WEIGHTS = {
+    "onnx": os.path.join(WEIGHTS_DIR, "net.onnx"),
+    "rknn": os.path.join(WEIGHTS_DIR, "XFeat.rknn"),
+    "mock": None,
+}
+# Input used to check a backend when the real crop size is unknown
+PROBE_SHAPE = (1, 3, 256, 256)
+DESCRIPTOR_DIM = 64
+# Graph optimizations, big-core threads, optimized model cache and IOBinding
+ORT_TUNED = True
+# Intra-op threads for the tuned session, None for one per big core
+ORT_THREADS = None
+CPUFREQ_GLOB = "/sys/devices/system/cpu/cpu[0-9]*/cpufreq/cpuinfo_max_freq"
+
+
+def big_cores():
+    """
+    CPUs of the fastest cluster (e.g. the Cortex-A76 cores of an RK3588),
+    detected from cpufreq, limited to the CPUs this process may run on.
+    """
+    allowed = sorted(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else list(range(os.cpu_count() or 1))
+    freqs = {}
+    for path in glob.glob(CPUFREQ_GLOB):
+        cpu = int(re.search(r"cpu(\d+)/cpufreq", path).group(1))
+        if cpu not in allowed:
+            continue
+        try:
+            with open(path) as f:
+                freqs[cpu] = int(f.read())
+        except (OSError, ValueError):
+            continue
+    if not freqs:
+        return allowed
+    # little and big clusters are far apart, anything above the midpoint is big
+    threshold = (min(freqs.values()) + max(freqs.values())) / 2
+    return sorted(cpu for cpu, freq in freqs.items() if freq >= threshold)
+
+
+def expected_shapes(input_shape):
+    B, _, H, W = input_shape
+    return (
+        (B, DESCRIPTOR_DIM, H // 8, W // 8),
+        (B, 65, H // 8, W // 8),
+        (B, 1, H // 8, W // 8),
+    )
+
+
+class InferenceBackend:
+    """Runs the XFeat backbone, see the module docstring for the contract."""
+
+    name = "base"
+
+    def run(self, x: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        raise NotImplementedError
+
+    def check(self, input_shape=PROBE_SHAPE):
+        """Run a blank input through the model and validate the output shapes."""
+        outputs = self.run(np.zeros(input_shape, dtype=np.float32))
+        shapes = tuple(tuple(out.shape) for out in outputs)
+        if shapes != expected_shapes(input_shape):
+            raise ValueError(
+                f"{self.name} backend returned {shapes} for input {tuple(input_shape)}, "
+                f"expected {expected_shapes(input_shape)}"
+            )
+
+    def close(self):
+        pass
+
+
+class OnnxBackend(InferenceBackend):
+    """
+    onnxruntime on the CPU. In tuned mode the session runs with all graph
+    optimizations on threads pinned to the big cores, the optimized graph is
+    cached next to the weights for a faster start, and inputs/outputs go
+    through an IOBinding with buffers reused across frames. ``run`` returns
+    copies of the output buffers, so results survive the next ``run``.
+    """
+
+    name = "onnx"
+
+    def __init__(self, weights=DEFAULT_WEIGHTS["onnx"], providers=("CPUExecutionProvider",),
+                 tuned=ORT_TUNED, threads=ORT_THREADS):
+        import onnxruntime as ort
+
+        self.tuned = tuned
+        if tuned:
+            self.session = self._tuned_session(ort, weights, list(providers), threads)
+        else:
+            self.session = ort.InferenceSession(weights, providers=list(providers))
+        self.input_name = self.session.get_inputs()[0].name
+        self.output_names = [out.name for out in self.session.get_outputs()]
+        self._binding = None
+        self._input = None
+        self._outputs = None
+
+    @staticmethod
+    def _tuned_session(ort, weights, providers, threads):
+        options = ort.SessionOptions()
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        cores = big_cores()
+        if threads is None:
+            threads = len(cores)
+        options.intra_op_num_threads = threads
+        if 1 < threads <= len(cores):
+            # the calling thread is the first one, ORT wants 1-based CPU ids for the rest
+            options.add_session_config_entry(
+                "session.intra_op_thread_affinities", ";".join(str(cpu + 1) for cpu in cores[1:threads])
+            )
+
+        cache = f"{os.path.splitext(weights)[0]}.ort{ort.__version__}.onnx"
+        if os.path.exists(cache) and os.path.getmtime(cache) >= os.path.getmtime(weights):
+            # already optimized offline, skip the optimizer on startup
+            options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_DISABLE_ALL
+            try:
+                return ort.InferenceSession(cache, options, providers=providers)
+            except Exception as e:
+                logger.warning(f"Ignoring optimized model cache {cache}: {e}")
+
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.optimized_model_filepath = cache
+        try:
+            return ort.InferenceSession(weights, options, providers=providers)
+        except Exception as e:
+            # e.g. read-only weights directory, run without the cache
+            logger.warning(f"Cannot write optimized model cache {cache}: {e}")
+            options.optimized_model_filepath = ""
+            return ort.InferenceSession(weights, options, providers=providers)
+
+    def _bind(self, shape):
+        self._input = np.empty(shape, dtype=np.float32)
+        self._outputs = [np.empty(out_shape, dtype=np.float32) for out_shape in expected_shapes(shape)]
+        self._binding = self.session.io_binding()
+        self._binding.bind_cpu_input(self.input_name, self._input)
+        for name, buf in zip(self.output_names, self._outputs):
+            self._binding.bind_output(name, "cpu", 0, np.float32, buf.shape, buf.ctypes.data)
+
+    def run(self, x):
+        if not self.tuned:
+            return tuple(self.session.run(None, {self.input_name: x}))
+
+        if self._input is None or self._input.shape != x.shape:
+            self._bind(x.shape)
+        np.copyto(self._input, x)
+        self.session.run_with_iobinding(self._binding)
+        # the bound buffers are overwritten by the next frame
+        return tuple(out.copy() for out in self._outputs)
+
+
+class RKNNBackend(InferenceBackend):
+    """XFeat on the Rockchip NPU through rknn-toolkit-lite2."""
+
+    name = "rknn"
+
+    def __init__(self, weights=DEFAULT_WEIGHTS["rknn"], core_mask=None):
+        from rknnlite.api import RKNNLite
+
+        self.rknn = RKNNLite()
+        if self.rknn.load_rknn(weights) != 0:
+            raise RuntimeError(f"Failed to load RKNN model {weights}")
+        ret = self.rknn.init_runtime() if core_mask is None else self.rknn.init_runtime(core_mask=core_mask)
+        if ret != 0:
+            raise RuntimeError("Failed to init RKNN runtime")
+
+    def run(self, x):
+        outputs = self.rknn.inference(inputs=[np.ascontiguousarray(x)], data_format="nchw")
+        if outputs is None:
+            raise RuntimeError("RKNN inference failed")
+        return tuple(np.asarray(out, dtype=np.float32) for out in outputs)
+
+    def close(self):
+        self.rknn.release()
+
+
+class MockBackend(InferenceBackend):
+    """
+    Deterministic fake outputs of the right shape, for running and testing
+    the whole VIO stack off-device without a model.
+    """
+
+    name = "mock"
+
+    def __init__(self, weights=None, seed=0):
+        self.seed = seed
+
+    def run(self, x):
+        shapes = expected_shapes(x.shape)
+        rng = np.random.default_rng(self.seed)
+        return tuple(rng.standard_normal(shape).astype(np.float32) for shape in shapes)
+
+
+BACKENDS = {
+    "onnx": OnnxBackend,
+    "rknn": RKNNBackend,
+    "mock": MockBackend,
+}
+
+
+def create_backend(name="onnx", weights=None, input_shape=PROBE_SHAPE):
+    """
+    Create and check the requested backend. Any failure (missing runtime,
+    model or unexpected outputs) falls back to ONNX on the CPU, with
+    ``weights`` if they are an .onnx model.
+    """
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown inference backend {name}")
+    try:
+        backend = BACKENDS[name](weights or DEFAULT_WEIGHTS[name])
+        backend.check(input_shape)
+        logger.info(f"XFeat inference backend: {name}")
+        return backend
+    except Exception as e:
+        if name == "onnx":
+            raise
+        logger.warning(f"XFeat {name} backend unavailable ({e}), falling back to onnx on CPU")
+
+    # an .onnx variant (e.g. int8) was asked for, keep it on the fallback
+    if weights is not None and weights.endswith(".onnx"):
+        logger.info(f"XFeat onnx fallback uses {weights}")
+        backend = OnnxBackend(weights)
+    else:
+        backend = OnnxBackend()
+    backend.check(input_shape)
+    return backend
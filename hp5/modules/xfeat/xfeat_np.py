@@ -0,0 +1,317 @@
+"""
+"XFeat: Accelerated Features for Lightweight Image Matching, CVPR 2024."
+https://www.verlab.dcc.ufmg.br/descriptors/xfeat_cvpr24/
+
+Torch-free XFeat inference: the backbone runs on an inference backend and the
+post-processing (heatmap, NMS, sparse interpolation, matching) is NumPy/OpenCV.
+Outputs follow modules.xfeat.xfeat_ort.XFeat with np.ndarray instead of tensors.
+"""
+
+import cv2
+import numpy as np
+
+from modules.xfeat.backends import PROBE_SHAPE, create_backend
+
+# cubic convolution coefficient used by torch grid_sample(mode="bicubic")
+CUBIC_A = -0.75
+
+
+def normalize(x, axis):
+    norm = np.linalg.norm(x, axis=axis, keepdims=True)
+    return x / np.maximum(norm, 1e-12)
+
+
+def softmax(x, axis):
+    e = np.exp(x - x.max(axis=axis, keepdims=True))
+    return e / e.sum(axis=axis, keepdims=True)
+
+
+def _cubic_weights(t):
+    A = CUBIC_A
+    return (
+        ((A * (t + 1) - 5 * A) * (t + 1) + 8 * A) * (t + 1) - 4 * A,
+        ((A + 2) * t - (A + 3)) * t * t + 1,
+        ((A + 2) * (1 - t) - (A + 3)) * (1 - t) * (1 - t) + 1,
+        ((A * (2 - t) - 5 * A) * (2 - t) + 8 * A) * (2 - t) - 4 * A,
+    )
+
+
+def _gather(x, iy, ix):
+    """Values of x (C, h, w) at integer positions, zero outside the map."""
+    _, h, w = x.shape
+    inside = (ix >= 0) & (ix < w) & (iy >= 0) & (iy < h)
+    return x[:, np.clip(iy, 0, h - 1), np.clip(ix, 0, w - 1)] * inside
+
+
+def interpolate_sparse2d(x, pos, H, W, mode="bicubic"):
+    """
+    NumPy version of InterpolateSparse2d (grid_sample, align_corners=False,
+    zero padding).
+    input:
+            x -> np.ndarray(B, C, h, w): feature map
+            pos -> np.ndarray(B, N, 2): positions (x, y) in the H x W image
+    return:
+            np.ndarray(B, N, C)
+    """
+    B, C, h, w = x.shape
+    size = np.asarray([W - 1, H - 1], dtype=np.float32)
+    grid = 2.0 * (pos.astype(np.float32) / size) - 1.0
+    # unnormalize to the sampled map, align_corners=False
+    ix = ((grid[..., 0] + 1) * w - 1) / 2
+    iy = ((grid[..., 1] + 1) * h - 1) / 2
+
+    out = np.zeros((B, pos.shape[1], C), dtype=x.dtype)
+    for b in range(B):
+        if mode == "nearest":
+            vals = _gather(x[b], np.rint(iy[b]).astype(np.int64), np.rint(ix[b]).astype(np.int64))
+        else:
+            x0 = np.floor(ix[b])
+            y0 = np.floor(iy[b])
+            tx = ix[b] - x0
+            ty = iy[b] - y0
+            x0 = x0.astype(np.int64)
+            y0 = y0.astype(np.int64)
+            if mode == "bilinear":
+                vals = (
+                    _gather(x[b], y0, x0) * ((1 - tx) * (1 - ty))
+                    + _gather(x[b], y0, x0 + 1) * (tx * (1 - ty))
+                    + _gather(x[b], y0 + 1, x0) * ((1 - tx) * ty)
+                    + _gather(x[b], y0 + 1, x0 + 1) * (tx * ty)
+                )
+            else:
+                wx = _cubic_weights(tx)
+                wy = _cubic_weights(ty)
+                vals = 0
+                for ii in range(4):
+                    row = 0
+                    for jj in range(4):
+                        row = row + _gather(x[b], y0 - 1 + ii, x0 - 1 + jj) * wx[jj]
+                    vals = vals + row * wy[ii]
+        out[b] = vals.T
+    return out
+
+
+class DescriptorBankNP:
+    """NumPy counterpart of modules.xfeat.xfeat_ort.DescriptorBank."""
+
+    def __init__(self, slots, top_k, dim=64):
+        self.feats = np.zeros((slots, top_k, dim), dtype=np.float32)
+        self.valid = np.zeros((slots, top_k), dtype=bool)
+
+    def __len__(self):
+        return len(self.feats)
+
+    def put(self, slot, descriptors):
+        n = min(len(descriptors), self.feats.shape[1])
+        self.feats[slot] = 0
+        self.feats[slot, :n] = descriptors[:n]
+        self.valid[slot] = False
+        self.valid[slot, :n] = True
+
+    def clear(self, slot):
+        self.valid[slot] = False
+
+
+class XFeatNP:
+    """
+    Implements sparse XFeat inference without torch.
+    """
+
+    def __init__(
+        self,
+        weights=None,
+        top_k=4096,
+        detection_threshold=0.05,
+        inference="onnx",
+        input_shape=PROBE_SHAPE,
+    ):
+        self.weights = weights
+        self.inference = inference
+        self.input_shape = input_shape
+        self._backend = None
+        self.top_k = top_k
+        self.detection_threshold = detection_threshold
+
+    @property
+    def backend(self):
+        # created on first use, so matching-only instances never load the model
+        if self._backend is None:
+            self._backend = create_backend(self.inference, self.weights, self.input_shape)
+        return self._backend
+
+    def detectAndCompute(self, x, top_k=None, detection_threshold=None):
+        """
+        Compute sparse keypoints & descriptors. Supports batched mode.
+
+        input:
+                x -> np.ndarray(B, C, H, W): grayscale or rgb image
+                top_k -> int: keep best k features
+        return:
+                List[Dict]:
+                        'keypoints'    ->   np.ndarray(N, 2): keypoints (x,y)
+                        'scores'       ->   np.ndarray(N,): keypoint scores
+                        'descriptors'  ->   np.ndarray(N, 64): local features
+        """
+        if top_k is None:
+            top_k = self.top_k
+        if detection_threshold is None:
+            detection_threshold = self.detection_threshold
+        x, rh1, rw1 = self.preprocess_tensor(x)
+
+        B, _, _H1, _W1 = x.shape
+
+        M1, K1, H1 = self.backend.run(x)
+        M1 = normalize(M1, axis=1)
+
+        # Convert logits to heatmap and extract kpts
+        K1h = self.get_kpts_heatmap(K1)
+        mkpts = self.NMS(K1h, threshold=detection_threshold, kernel_size=5)
+
+        # Compute reliability scores
+        scores = (
+            interpolate_sparse2d(K1h, mkpts, _H1, _W1, "nearest")
+            * interpolate_sparse2d(H1, mkpts, _H1, _W1, "bilinear")
+        )[..., 0]
+        scores[np.all(mkpts == 0, axis=-1)] = -1
+
+        # Select top-k features
+        idxs = np.argsort(-scores, axis=-1, kind="stable")[:, :top_k]
+        mkpts = np.take_along_axis(mkpts, idxs[..., None], axis=1)
+        scores = np.take_along_axis(scores, idxs, axis=-1)
+
+        # Interpolate descriptors at kpts positions
+        feats = interpolate_sparse2d(M1, mkpts, _H1, _W1, "bicubic")
+
+        # L2-Normalize
+        feats = normalize(feats, axis=-1)
+
+        # Correct kpt scale
+        mkpts = mkpts.astype(np.float32) * np.asarray([rw1, rh1], dtype=np.float32)
+
+        valid = scores > 0
+        return [
+            {
+                "keypoints": mkpts[b][valid[b]],
+                "scores": scores[b][valid[b]],
+                "descriptors": feats[b][valid[b]],
+            }
+            for b in range(B)
+        ]
+
+    def preprocess_tensor(self, x):
+        """Guarantee that image is divisible by 32 to avoid aliasing artifacts."""
+        if len(x.shape) == 3:
+            x = x.transpose(2, 0, 1)[None]
+        x = x.astype(np.float32)
+
+        H, W = x.shape[-2:]
+        _H, _W = (H // 32) * 32, (W // 32) * 32
+        rh, rw = H / _H, W / _W
+
+        if (_H, _W) != (H, W):
+            x = np.stack(
+                [
+                    cv2.resize(img.transpose(1, 2, 0), (_W, _H), interpolation=cv2.INTER_LINEAR)
+                    .reshape(_H, _W, -1)
+                    .transpose(2, 0, 1)
+                    for img in x
+                ]
+            )
+        return np.ascontiguousarray(x), rh, rw
+
+    def get_kpts_heatmap(self, kpts, softmax_temp=1.0):
+        scores = softmax(kpts * softmax_temp, 1)[:, :64]
+        B, _, H, W = scores.shape
+        heatmap = scores.transpose(0, 2, 3, 1).reshape(B, H, W, 8, 8)
+        heatmap = heatmap.transpose(0, 1, 3, 2, 4).reshape(B, 1, H * 8, W * 8)
+        return heatmap
+
+    def NMS(self, x, threshold=0.05, kernel_size=5):
+        B = x.shape[0]
+        kernel = np.ones((kernel_size, kernel_size), dtype=np.uint8)
+        pos_batched = []
+        for b in range(B):
+            heatmap = x[b, 0]
+            local_max = cv2.dilate(heatmap, kernel)
+            ys, xs = np.nonzero((heatmap == local_max) & (heatmap > threshold))
+            pos_batched.append(np.stack([xs, ys], axis=-1))
+
+        pad_val = max([len(k) for k in pos_batched])
+        pos = np.zeros((B, pad_val, 2), dtype=np.int64)
+
+        # Pad kpts and build (B, N, 2) array
+        for b in range(B):
+            pos[b, : len(pos_batched[b]), :] = pos_batched[b]
+
+        return pos
+
+    def match(self, feats1, feats2, min_cossim=0.82):
+        empty = np.zeros(0, dtype=np.int64)
+        if len(feats1) == 0 or len(feats2) == 0:
+            return empty, empty
+
+        cossim = feats1 @ feats2.T
+
+        match12 = cossim.argmax(axis=1)
+        match21 = cossim.argmax(axis=0)
+
+        idx0 = np.arange(len(match12))
+        mutual = match21[match12] == idx0
+
+        if min_cossim > 0:
+            good = cossim.max(axis=1) > min_cossim
+            mutual = mutual & good
+
+        return idx0[mutual], match12[mutual]
+
+    def descriptor_bank(self, slots):
+        return DescriptorBankNP(slots, self.top_k)
+
+    def match_bank(self, bank, valid, feats2, min_cossim=0.82):
+        """Same as XFeat.match_bank for NumPy arrays."""
+        T, N, C = bank.shape
+        empty = np.zeros(0, dtype=np.int64)
+        if len(feats2) == 0:
+            return [(empty, empty) for _ in range(T)]
+
+        cossim = (bank.reshape(T * N, C) @ feats2.T).reshape(T, N, -1)
+        # cosine similarity is >= -1, so padded rows never win an argmax
+        cossim[~valid] = -2.0
+
+        match12 = cossim.argmax(axis=2)
+        cossim_max = np.take_along_axis(cossim, match12[..., None], axis=2)[..., 0]
+        match21 = cossim.argmax(axis=1)
+
+        idx0 = np.arange(N)
+        counts = valid.sum(axis=1)
+
+        matches = []
+        for t in range(T):
+            n = counts[t]
+            mutual = match21[t][match12[t, :n]] == idx0[:n]
+            if min_cossim > 0:
+                mutual = mutual & (cossim_max[t, :n] > min_cossim)
+            matches.append((idx0[:n][mutual], match12[t, :n][mutual]))
+
+        return matches
+
+    def pack_features(self, out):
+        """Pack a detectAndCompute result into one (N, 67) float32 array."""
+        return np.concatenate(
+            [out["keypoints"], out["scores"][:, None], out["descriptors"]],
+            axis=1,
+            dtype=np.float32,
+        )
+
+    def unpack_features(self, packed):
+        return {
+            "keypoints": packed[:, :2],
+            "scores": packed[:, 2],
+            "descriptors": packed[:, 3:],
+        }
+
+    def parse_input(self, x):
+        if len(x.shape) == 3:
+            x = x[None, ...]
+
+        return x.transpose(0, 3, 1, 2).astype(np.float32) / 255
@@ -3,17 +3,41 @@
 https://www.verlab.dcc.ufmg.br/descriptors/xfeat_cvpr24/
 """
 
-import os
-
 import numpy as np
-import onnxruntime as ort
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
 
+from modules.xfeat.backends import PROBE_SHAPE, create_backend
 from modules.xfeat.interpolator import InterpolateSparse2d
 
 
+class DescriptorBank:
+    """
+    Fixed-size stack of descriptor sets, one slot per trace point, kept
+    ready for XFeat.match_bank so nothing is re-stacked per frame.
+    """
+
+    def __init__(self, slots, top_k, dim=64):
+        self.feats = torch.zeros((slots, top_k, dim), dtype=torch.float32)
+        self.valid = torch.zeros((slots, top_k), dtype=torch.bool)
+
+    def __len__(self):
+        return len(self.feats)
+
+    @torch.inference_mode()
+    def put(self, slot, descriptors):
+        n = min(len(descriptors), self.feats.shape[1])
+        self.feats[slot].zero_()
+        self.feats[slot, :n] = descriptors[:n]
+        self.valid[slot] = False
+        self.valid[slot, :n] = True
+
+    @torch.inference_mode()
+    def clear(self, slot):
+        self.valid[slot] = False
+
+
 class XFeat(nn.Module):
     """
     Implements the inference module for XFeat.
@@ -22,22 +46,50 @@ class XFeat(nn.Module):
 
     def __init__(
         self,
-        weights=os.path.join(
-            os.path.dirname(os.path.dirname(os.path.dirname(__file__))),
-            "weights",
-            "net.onnx",
-        ),
+        weights=None,
         top_k=4096,
         detection_threshold=0.05,
         dev="cpu",
+        inference="onnx",
+        input_shape=PROBE_SHAPE,
     ):
         super().__init__()
         self.dev = dev
-        self.session = ort.InferenceSession(weights, providers=["CPUExecutionProvider"])
+        self.weights = weights
+        self.inference = inference
+        self.input_shape = input_shape
+        self._backend = None
         self.top_k = top_k
         self.detection_threshold = detection_threshold
         self.interpolator = InterpolateSparse2d("bicubic")
 
+    @property
+    def backend(self):
+        # created on first use, so matching-only instances never load the model
+        if self._backend is None:
+            self._backend = create_backend(self.inference, self.weights, self.input_shape)
+        return self._backend
+
+    def pack_features(self, out):
+        """Pack a detectAndCompute result into one (N, 67) float32 array."""
+        return np.concatenate(
+            [
+                out["keypoints"].numpy(),
+                out["scores"].numpy()[:, None],
+                out["descriptors"].numpy(),
+            ],
+            axis=1,
+            dtype=np.float32,
+        )
+
+    def unpack_features(self, packed):
+        packed = torch.from_numpy(np.ascontiguousarray(packed))
+        return {
+            "keypoints": packed[:, :2],
+            "scores": packed[:, 2],
+            "descriptors": packed[:, 3:],
+        }
+
     @torch.inference_mode()
     def detectAndCompute(self, x, top_k=None, detection_threshold=None):
         """
@@ -60,8 +112,8 @@ class XFeat(nn.Module):
 
         B, _, _H1, _W1 = x.shape
 
-        M1, K1, H1 = self.session.run(None, {"input": x.numpy()})
-        M1, K1, H1 = torch.tensor(M1), torch.tensor(K1), torch.tensor(H1)
+        M1, K1, H1 = self.backend.run(x.numpy())
+        M1, K1, H1 = torch.from_numpy(M1), torch.from_numpy(K1), torch.from_numpy(H1)
         M1 = F.normalize(M1, dim=1)
 
         # Convert logits to heatmap and extract kpts
@@ -298,11 +350,11 @@ class XFeat(nn.Module):
 
     @torch.inference_mode()
     def match(self, feats1, feats2, min_cossim=0.82):
+        # single GEMM: the reverse similarity is the transpose of this one
         cossim = feats1 @ feats2.t()
-        cossim_t = feats2 @ feats1.t()
 
         _, match12 = cossim.max(dim=1)
-        _, match21 = cossim_t.max(dim=1)
+        _, match21 = cossim.max(dim=0)
 
         idx0 = torch.arange(len(match12), device=match12.device)
         mutual = match21[match12] == idx0
@@ -318,6 +370,46 @@ class XFeat(nn.Module):
 
         return idx0, idx1
 
+    def descriptor_bank(self, slots):
+        return DescriptorBank(slots, self.top_k)
+
+    @torch.inference_mode()
+    def match_bank(self, bank, valid, feats2, min_cossim=0.82):
+        """
+        MNN-match one descriptor set against a padded bank of descriptor sets
+        with a single matrix multiply.
+        input:
+                bank -> torch.Tensor(T, N, 64): stacked descriptors, zero padded at the end
+                valid -> torch.Tensor(T, N): False for padded rows
+                feats2 -> torch.Tensor(M, 64): descriptors to match
+        return:
+                List[Tuple[idx0, idx1]] of size T, as returned by match()
+        """
+        T, N, C = bank.shape
+        empty = torch.zeros(0, dtype=torch.long, device=bank.device)
+        if len(feats2) == 0:
+            return [(empty, empty) for _ in range(T)]
+
+        cossim = (bank.reshape(T * N, C) @ feats2.t()).reshape(T, N, -1)
+        # cosine similarity is >= -1, so padded rows never win an argmax
+        cossim.masked_fill_(~valid[..., None], -2.0)
+
+        cossim_max, match12 = cossim.max(dim=2)
+        _, match21 = cossim.max(dim=1)
+
+        idx0 = torch.arange(N, device=bank.device)
+        counts = valid.sum(dim=1).tolist()
+
+        matches = []
+        for t in range(T):
+            n = counts[t]
+            mutual = match21[t][match12[t, :n]] == idx0[:n]
+            if min_cossim > 0:
+                mutual = mutual & (cossim_max[t, :n] > min_cossim)
+            matches.append((idx0[:n][mutual], match12[t, :n][mutual]))
+
+        return matches
+
     def create_xy(self, h, w, dev):
         y, x = torch.meshgrid(
             torch.arange(h, device=dev), torch.arange(w, device=dev), indexing="ij"
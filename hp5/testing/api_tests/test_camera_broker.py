@@ -0,0 +1,70 @@
+import time
+import unittest
+from unittest import mock
+
+import cv2
+import numpy as np
+
+from api.utils import camera_broker
+from api.utils.camera_broker import CameraBroker
+
+
+class FakeCapture:
+    """VideoCapture that returns frames of the currently set resolution."""
+
+    widths = []
+
+    def __init__(self, cap_id):
+        self.props = {cv2.CAP_PROP_FRAME_WIDTH: 640, cv2.CAP_PROP_FRAME_HEIGHT: 480}
+
+    def isOpened(self):
+        return True
+
+    def set(self, prop, value):
+        self.props[prop] = value
+        if prop == cv2.CAP_PROP_FRAME_WIDTH:
+            FakeCapture.widths.append(value)
+
+    def get(self, prop):
+        return self.props.get(prop, 0)
+
+    def read(self):
+        time.sleep(0.005)
+        width, height = int(self.props[cv2.CAP_PROP_FRAME_WIDTH]), int(self.props[cv2.CAP_PROP_FRAME_HEIGHT])
+        return True, np.zeros((height, width, 3), dtype=np.uint8)
+
+    def release(self):
+        pass
+
+
+class TestCaptureAt(unittest.TestCase):
+    def setUp(self):
+        FakeCapture.widths = []
+        patcher = mock.patch.object(camera_broker.cv2, "VideoCapture", FakeCapture)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.broker = CameraBroker(cap_id=0, linger=0.1)
+        self.addCleanup(self.broker.shutdown)
+
+    def test_switches_without_streams(self):
+        frame = self.broker.capture_at(1280, 720)
+        self.assertEqual(frame.shape, (720, 1280, 3))
+        # the stream resolution is back before anyone else can subscribe
+        self.assertEqual(FakeCapture.widths[-1], 640)
+        with self.broker.subscribe():
+            seq, frame, _ = self.broker.wait_next(self.broker.latest()[0])
+            self.assertEqual(frame.shape, (480, 640, 3))
+
+    def test_streams_keep_their_resolution(self):
+        with self.broker.subscribe():
+            self.broker.wait_next(0)
+            frame = self.broker.capture_at(320, 240)
+            self.assertEqual(frame.shape, (240, 320, 3))
+            # never upscaled
+            frame = self.broker.capture_at(1920, 1080)
+            self.assertEqual(frame.shape, (480, 640, 3))
+        self.assertEqual(set(FakeCapture.widths), {640})
+
+
+if __name__ == "__main__":
+    unittest.main()
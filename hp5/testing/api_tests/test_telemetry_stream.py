@@ -0,0 +1,131 @@
+import asyncio
+import threading
+import time
+import unittest
+from unittest import mock
+
+from pymavlink.dialects.v20 import ardupilotmega as mavlink
+
+from api.routes import telemetry
+from api.routes.telemetry import MAX_STREAM_RATE, STREAM_TYPES, TelemetryClient, parse_types
+
+
+def attitude(roll):
+    return mavlink.MAVLink_attitude_message(0, roll, 0.0, 0.0, 0.0, 0.0, 0.0)
+
+
+class FakeManager:
+    def __init__(self):
+        self.callbacks = {}
+        self.unsubscribed = threading.Event()
+
+    def subscribe(self, types, callback):
+        token = len(self.callbacks)
+        self.callbacks[token] = callback
+        return token
+
+    def unsubscribe(self, token):
+        self.callbacks.pop(token, None)
+        self.unsubscribed.set()
+
+
+class FakeWebSocket:
+    def __init__(self):
+        self.sent = asyncio.Queue()
+        self.closed = asyncio.Event()
+
+    async def accept(self):
+        pass
+
+    async def send_json(self, data):
+        await self.sent.put(data)
+
+    async def receive(self):
+        await self.closed.wait()
+        return {"type": "websocket.disconnect", "code": 1000}
+
+
+class TestTelemetryClient(unittest.TestCase):
+    def test_coalesces_pending_fields(self):
+        loop = asyncio.new_event_loop()
+        self.addCleanup(loop.close)
+        client = TelemetryClient(loop)
+        client.on_message(attitude(0.1))
+        client.on_message(attitude(0.2))
+        loop.run_until_complete(asyncio.wait_for(client.ready.wait(), 1))
+        # only the newest value of each field is kept for a slow client
+        self.assertEqual(client.take(), {"roll": attitude(0.2).roll, "pitch": 0.0, "yaw": 0.0})
+        self.assertFalse(client.ready.is_set())
+        self.assertEqual(client.take(), {})
+
+
+class TestParseTypes(unittest.TestCase):
+    def test_parse_types(self):
+        self.assertEqual(parse_types(None), STREAM_TYPES)
+        self.assertEqual(parse_types(" attitude, Vfr_Hud ,bogus"), ("ATTITUDE", "VFR_HUD"))
+        # nothing known selects every type
+        self.assertEqual(parse_types("bogus,"), STREAM_TYPES)
+
+
+class TestTelemetryUpdates(unittest.TestCase):
+    def setUp(self):
+        self.manager = FakeManager()
+        patcher = mock.patch.object(telemetry, "mavlink_manager", self.manager)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_rate_cap(self):
+        duration = 0.5
+
+        async def collect():
+            stop = threading.Event()
+
+            def feed():
+                roll = 0.0
+                while not stop.is_set():
+                    roll += 0.01
+                    for callback in list(self.manager.callbacks.values()):
+                        callback(attitude(roll))
+                    time.sleep(0.001)
+
+            feeder = threading.Thread(target=feed)
+            updates = telemetry.telemetry_updates(10 * MAX_STREAM_RATE)
+            count = 0
+            feeder.start()
+            try:
+                deadline = time.monotonic() + duration
+                async for delta in updates:
+                    count += bool(delta)
+                    if time.monotonic() > deadline:
+                        break
+            finally:
+                stop.set()
+                feeder.join()
+                await updates.aclose()
+            return count
+
+        count = asyncio.run(collect())
+        # about 1 kHz of messages are sent at no more than MAX_STREAM_RATE
+        self.assertGreater(count, 5)
+        self.assertLessEqual(count, duration * MAX_STREAM_RATE + 2)
+        self.assertTrue(self.manager.unsubscribed.is_set())
+
+    def test_websocket_disconnect_unsubscribes(self):
+        async def session():
+            websocket = FakeWebSocket()
+            handler = asyncio.create_task(telemetry.telemetry_websocket(websocket, rate=10, types="attitude"))
+            await asyncio.sleep(0.05)
+            self.manager.callbacks[0](attitude(0.3))
+            data = await asyncio.wait_for(websocket.sent.get(), 1)
+            websocket.closed.set()
+            # no telemetry flows, yet the handler ends well before a keepalive is due
+            await asyncio.wait_for(handler, telemetry.KEEPALIVE / 2)
+            return data
+
+        data = asyncio.run(session())
+        self.assertEqual(data["data"]["roll"], attitude(0.3).roll)
+        self.assertTrue(self.manager.unsubscribed.is_set())
+
+
+if __name__ == "__main__":
+    unittest.main()
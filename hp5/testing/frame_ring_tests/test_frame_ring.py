@@ -0,0 +1,105 @@
+import pickle
+import queue
+import unittest
+
+import numpy as np
+
+from modules.frame_ring import FrameRing, ShmQueue
+
+
+class TestFrameRing(unittest.TestCase):
+    def setUp(self):
+        self.ring = FrameRing((4, 6, 3), np.uint8, slots=3)
+
+    def tearDown(self):
+        self.ring.close()
+        self.ring.unlink()
+
+    def test_write_commit_read(self):
+        slot = self.ring.begin_write()
+        slot[:] = 5
+        # a slot being written is never handed out
+        self.assertEqual(self.ring.latest(), -1)
+        self.assertIsNone(self.ring.read(0))
+        seq = self.ring.commit(1.5)
+
+        self.assertEqual(seq, 0)
+        self.assertEqual(self.ring.latest(), 0)
+        view, ts = self.ring.read(seq)
+        self.assertEqual(ts, 1.5)
+        np.testing.assert_array_equal(view, 5)
+        self.assertFalse(view.flags.writeable)
+
+        frame, ts = self.ring.get(timeout=0.1)
+        np.testing.assert_array_equal(frame, 5)
+        with self.assertRaises(queue.Empty):
+            self.ring.get(timeout=0.01)
+
+    def test_lapped_slot(self):
+        for i in range(4):
+            self.ring.put((np.full((4, 6, 3), i, dtype=np.uint8), float(i)))
+        # slot of frame 0 now holds frame 3
+        self.assertFalse(self.ring.valid(0))
+        self.assertIsNone(self.ring.read(0))
+        self.assertTrue(self.ring.valid(1))
+        view, ts = self.ring.read(3)
+        np.testing.assert_array_equal(view, 3)
+        self.assertEqual(ts, 3.0)
+
+    def test_attach_by_name(self):
+        self.ring.put((np.full((4, 6, 3), 9, dtype=np.uint8), 2.0))
+        reader = pickle.loads(pickle.dumps(self.ring))
+        frame, ts = reader.get(timeout=0.1)
+        np.testing.assert_array_equal(frame, 9)
+        self.assertEqual(ts, 2.0)
+        # a view held by the consumer does not break close
+        reader.close()
+
+
+class TestShmQueue(unittest.TestCase):
+    def setUp(self):
+        self.que = ShmQueue((8, 2), np.float32, maxsize=2)
+
+    def tearDown(self):
+        self.que.close()
+        self.que.unlink()
+
+    def test_fifo_with_short_arrays(self):
+        self.que.put(np.ones((3, 2), dtype=np.float32), "a")
+        self.que.put(np.zeros((8, 2), dtype=np.float32), "b")
+        seq, array, meta = self.que.get(timeout=1)
+        self.assertEqual((seq, meta, array.shape), (0, "a", (3, 2)))
+        seq, array, meta = self.que.get(timeout=1)
+        self.assertEqual((seq, meta, array.shape), (1, "b", (8, 2)))
+
+    def test_drop_oldest(self):
+        for i in range(5):
+            self.que.put(np.full((8, 2), i, dtype=np.float32), i)
+        items = [self.que.get(timeout=1) for _ in range(2)]
+        self.assertEqual([meta for _, _, meta in items], [3, 4])
+        np.testing.assert_array_equal(items[1][1], 4)
+        with self.assertRaises(queue.Empty):
+            self.que.get(timeout=0.05)
+
+    def test_lapped_payload(self):
+        self.que.put(np.ones((8, 2), dtype=np.float32), "old")
+        # the meta queue still holds "old" while the ring wraps around
+        for _ in range(self.que.ring.slots):
+            self.que.ring.put((np.zeros((8, 2), dtype=np.float32), 0.0))
+        seq, array, meta = self.que.get(timeout=1)
+        self.assertEqual((seq, meta), (0, "old"))
+        self.assertIsNone(array)
+
+
+class TestUnlink(unittest.TestCase):
+    def test_unlink_removes_segment(self):
+        ring = FrameRing((2, 2), np.uint8, slots=2)
+        name = ring.name
+        ring.close()
+        ring.unlink()
+        with self.assertRaises(FileNotFoundError):
+            FrameRing((2, 2), np.uint8, slots=2, name=name, create=False)
+
+
+if __name__ == "__main__":
+    unittest.main()
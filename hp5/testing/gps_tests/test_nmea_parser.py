@@ -0,0 +1,60 @@
+import unittest
+from datetime import date, timedelta
+from functools import reduce
+from operator import xor
+
+from utils.nmea_parser import NMEAParser, gps_week_time, parse_date
+
+
+def sentence(body):
+    return f"${body}*{reduce(xor, body.encode(), 0):02X}\r\n".encode()
+
+
+EPOCH = b"".join(
+    sentence(body)
+    for body in (
+        "GNRMC,083559.00,A,5450.58574,N,08305.91106,E,10.000,90.00,181026,,,A",
+        "GNVTG,90.00,T,,M,10.000,N,18.520,K,A",
+        "GNGGA,083559.00,5450.58574,N,08305.91106,E,1,09,1.02,204.3,M,-20.1,M,,",
+        "GNGSA,A,3,10,12,15,18,24,25,,,,,,,1.85,1.02,1.54,1",
+        "GNGSA,A,3,66,67,,,,,,,,,,,1.85,1.02,1.54,2",
+        "GPGSV,1,1,02,10,45,120,30,12,30,200,28,1",
+    )
+)
+
+
+class TestNMEAParser(unittest.TestCase):
+    def test_fix_fields(self):
+        fixes = NMEAParser().feed(EPOCH)
+        self.assertEqual(len(fixes), 1)
+        fix = fixes[0]
+        self.assertAlmostEqual(fix.lat, 54 + 50.58574 / 60)
+        self.assertAlmostEqual(fix.lon, 83 + 5.91106 / 60)
+        self.assertAlmostEqual(fix.alt, 204.3)
+        self.assertEqual((fix.hdop, fix.vdop, fix.num_sv, fix.fix_quality), (1.02, 1.54, 9, 1))
+        self.assertTrue(fix.vel_valid)
+        self.assertAlmostEqual(fix.veln, 0.0, places=6)
+        self.assertAlmostEqual(fix.vele, 18.52 / 3.6)
+
+    def test_split_buffers_and_noise(self):
+        parser = NMEAParser()
+        data = b"\xb5\x62\x05\x01garbage" + EPOCH + sentence("GNRMC,083600.00,V,,,,,,,181026,,,N")
+        fixes = []
+        for ii in range(0, len(data), 7):
+            fixes += parser.feed(data[ii:ii + 7])
+        self.assertEqual(len(fixes), 1)
+        # a corrupted checksum drops the sentence and the epoch stays incomplete
+        self.assertEqual(NMEAParser().feed(EPOCH.replace(b"*", b"0*", 1)), [])
+
+    def test_week_time_matches_calc_gps_week_time(self):
+        # reference: Monday based weeks as in calc_GPS_week_time
+        epoch_monday = date(1980, 1, 6) - timedelta(6)
+        for day in (date(2026, 10, 18), date(2026, 10, 19), date(2024, 2, 29)):
+            today_monday = day - timedelta(day.weekday())
+            week = (today_monday - epoch_monday).days // 7
+            ms = (day - today_monday).days * 86400000 + 30 * 60000
+            self.assertEqual(gps_week_time(parse_date(day.strftime("%d%m%y").encode()), 30 * 60000), (week, ms))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,68 @@
+import struct
+import unittest
+
+from utils.ublox_config import ACK, CFG_MSG, CFG_PRT, CFG_RATE, configure
+from utils.ubx_parser import checksum, split_frames
+
+
+def frame(msg_class, msg_id, payload):
+    body = bytes((msg_class, msg_id)) + struct.pack("<H", len(payload)) + payload
+    return b"\xb5\x62" + body + checksum(body, 0, len(body))
+
+
+class FakeReceiver:
+    """Serial stream of a receiver answering polls and acknowledging CFG messages."""
+
+    def __init__(self, rate_ms=1000, pvt_rate=0, baudrate=9600, out_mask=0x02):
+        self.rate = (rate_ms, 1, 1)
+        self.pvt_rate = pvt_rate
+        self.baudrate = baudrate
+        self.out_mask = out_mask
+        self.sets = []
+        self._out = bytearray()
+
+    @property
+    def in_waiting(self):
+        return len(self._out)
+
+    def read(self, size=1):
+        data = bytes(self._out[:size])
+        del self._out[:size]
+        return data
+
+    def reset_input_buffer(self):
+        self._out.clear()
+
+    def flush(self):
+        pass
+
+    def write(self, raw):
+        frames, _ = split_frames(bytearray(raw))
+        for msg_class, msg_id, offset, length in frames:
+            payload = raw[offset:offset + length]
+            ident = (msg_class, msg_id)
+            if ident == CFG_RATE and not payload:
+                self._out += frame(*CFG_RATE, struct.pack("<HHH", *self.rate))
+            elif ident == CFG_MSG and len(payload) == 2:
+                self._out += frame(*CFG_MSG, payload + bytes((0, self.pvt_rate, 0, 0, 0, 0)))
+            elif ident == CFG_PRT and len(payload) == 1:
+                self._out += frame(*CFG_PRT, struct.pack("<BBHIIHHHH", 1, 0, 0, 0x8C0, self.baudrate, 3, self.out_mask, 0, 0))
+            else:
+                self.sets.append(ident)
+                self._out += frame(ACK, 0x01, bytes(ident))
+
+
+class TestUbloxConfig(unittest.TestCase):
+    def test_matching_receiver_is_left_alone(self):
+        receiver = FakeReceiver(rate_ms=100, pvt_rate=1, baudrate=115200, out_mask=0x01)
+        self.assertEqual(configure(receiver, 100, 115200, binary=True), (True, False))
+        self.assertEqual(receiver.sets, [])
+
+    def test_only_differences_are_sent(self):
+        receiver = FakeReceiver(rate_ms=100, pvt_rate=0, baudrate=9600, out_mask=0x02)
+        self.assertEqual(configure(receiver, 100, 115200, binary=True), (True, True))
+        self.assertEqual(receiver.sets, [CFG_MSG, CFG_PRT])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,58 @@
+import unittest
+
+from utils.nmea_parser import gps_week_time, parse_date, parse_time
+from utils.ubx_parser import NAV_PVT_STRUCT, UBXParser
+
+
+def ubx_frame(msg_class, msg_id, payload):
+    body = bytes((msg_class, msg_id)) + len(payload).to_bytes(2, "little") + payload
+    ck_a = ck_b = 0
+    for byte in body:
+        ck_a = (ck_a + byte) & 0xFF
+        ck_b = (ck_b + ck_a) & 0xFF
+    return b"\xb5\x62" + body + bytes((ck_a, ck_b))
+
+
+def nav_pvt(fix_type=3, flags=0x01):
+    return ubx_frame(0x01, 0x07, NAV_PVT_STRUCT.pack(
+        30959000, 2026, 10, 18, 8, 35, 59, 0x07, 20, 0,
+        fix_type, flags, 0, 9, 830985177, 548430956, 224300, 204300, 1500, 2500,
+        0, 5144, -120, 5144, 9000000, 300, 100000, 185, 0,
+        0, 0, 0,
+    ))
+
+
+class TestUBXParser(unittest.TestCase):
+    def test_nav_pvt_fields(self):
+        fix, = UBXParser().feed(nav_pvt())
+        self.assertAlmostEqual(fix.lat, 54.8430956)
+        self.assertAlmostEqual(fix.lon, 83.0985177)
+        self.assertAlmostEqual(fix.alt, 204.3)
+        self.assertAlmostEqual(fix.vele, 5.144)
+        self.assertAlmostEqual(fix.veld, -0.12)
+        self.assertEqual((fix.fix_type, fix.num_sv, fix.vel_vert_valid), (3, 9, True))
+        self.assertEqual((fix.h_acc, fix.v_acc, fix.s_acc), (1.5, 2.5, 0.3))
+        # same time base as the NMEA sentences of the same epoch
+        self.assertEqual((fix.gps_week, fix.gps_ms), gps_week_time(parse_date(b"181026"), parse_time(b"083559.00")))
+
+    def test_fix_type(self):
+        # dead reckoning is a plain 3D fix, DGPS and RTK come from the flags
+        for fix_type, flags, expected in ((2, 0x01, 2), (4, 0x01, 3), (3, 0x03, 4), (3, 0x43, 5), (3, 0x83, 6)):
+            fix, = UBXParser().feed(nav_pvt(fix_type, flags))
+            self.assertEqual(fix.fix_type, expected)
+
+    def test_stream(self):
+        ack = ubx_frame(0x05, 0x01, b"\x06\x01")
+        corrupted = bytearray(nav_pvt())
+        corrupted[40] ^= 0xFF
+        data = b"$GNTXT,01*00\r\n" + ack + bytes(corrupted) + nav_pvt() + nav_pvt(fix_type=0) + nav_pvt()
+        parser = UBXParser()
+        fixes = []
+        for ii in range(0, len(data), 13):
+            fixes += parser.feed(data[ii:ii + 13])
+        # the corrupted frame and the one without a fix are dropped
+        self.assertEqual(len(fixes), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
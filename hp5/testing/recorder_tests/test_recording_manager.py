@@ -0,0 +1,91 @@
+import os
+import tempfile
+import time
+import unittest
+
+import numpy as np
+
+from utils.data_utils import dump_data
+from utils.recording_manager import FULL, OFF, REDUCED, RecordingManager
+
+OLD = "2024_9_18_10_0_0_num_1"
+MID = "2024_9_18_11_0_0_num_2"
+CURRENT = "2024_9_18_12_0_0_num_3"
+
+
+def make_session(dump_dir, name, size, created):
+    path = os.path.join(dump_dir, name)
+    os.makedirs(path)
+    with open(os.path.join(path, "frames.mjpeg"), "wb") as f:
+        f.write(b"\0" * size)
+    os.utime(path, (created, created))
+    return path
+
+
+class TestRecordingManager(unittest.TestCase):
+    def test_evicts_oldest_sessions(self):
+        with tempfile.TemporaryDirectory() as dump_dir:
+            make_session(dump_dir, OLD, 4000, 1000)
+            make_session(dump_dir, MID, 4000, 2000)
+            current = make_session(dump_dir, CURRENT, 1000, 3000)
+            # folders that are not dump sessions are left alone
+            make_session(dump_dir, "weights", 9000, 500)
+
+            manager = RecordingManager(dump_dir, min_free_space=0, budget=6000, session=current)
+            self.assertEqual(manager.check(force=True), FULL)
+            self.assertEqual(sorted(os.listdir(dump_dir)), [".recording_index.json", MID, CURRENT, "weights"])
+
+            # sizes come from the index, written bytes are accounted incrementally
+            manager = RecordingManager(dump_dir, min_free_space=0, budget=6000, session=current)
+            self.assertEqual(manager.total_size(), 5000)
+            manager.add(2000)
+            manager.check(force=True)
+            self.assertEqual(sorted(os.listdir(dump_dir)), [".recording_index.json", CURRENT, "weights"])
+
+    def test_degrades_when_nothing_to_evict(self):
+        with tempfile.TemporaryDirectory() as dump_dir:
+            current = make_session(dump_dir, CURRENT, 1000, 1000)
+            manager = RecordingManager(dump_dir, min_free_space=0, budget=2000, session=current)
+            manager.add(2000)
+            # disk is not full, the budget is exceeded by half of itself
+            self.assertEqual(manager.check(force=True), REDUCED)
+            self.assertTrue(manager.frame_allowed(0))
+            self.assertFalse(manager.frame_allowed(1))
+            self.assertTrue(os.path.isdir(current))
+            manager.add(1000)
+            self.assertEqual(manager.check(force=True), OFF)
+
+    def test_dump_data_keeps_budget(self):
+        with tempfile.TemporaryDirectory() as dump_dir:
+            current = make_session(dump_dir, CURRENT, 0, 1000)
+            manager = RecordingManager(dump_dir, min_free_space=0, budget=10 ** 6, session=current,
+                                       check_interval=0)
+            frame = np.random.default_rng(0).integers(0, 255, (120, 160, 3), dtype=np.uint8)
+
+            def dump(number):
+                dump_data(current, frame, {"ATTITUDE": {"roll": 0.1}}, manager, number)
+                # files are named by the millisecond
+                time.sleep(0.002)
+
+            dump(0)
+            self.assertEqual(manager.total_size(), sum(
+                os.path.getsize(os.path.join(current, name)) for name in os.listdir(current)
+            ))
+
+            # over budget by a third of itself, only every REDUCED_STRIDE-th frame is written
+            manager.budget = manager.total_size() * 3 // 4
+            dump(1)
+            self.assertEqual(manager.level, REDUCED)
+            dump(3)
+            exts = [os.path.splitext(name)[1] for name in os.listdir(current)]
+            self.assertEqual((exts.count(".json"), exts.count(".jpg")), (3, 2))
+
+            manager.budget = 1
+            count = len(os.listdir(current))
+            dump(6)
+            self.assertEqual(manager.level, OFF)
+            self.assertEqual(len(os.listdir(current)), count)
+
+
+if __name__ == "__main__":
+    unittest.main()
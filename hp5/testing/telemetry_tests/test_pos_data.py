@@ -0,0 +1,50 @@
+import unittest
+from types import SimpleNamespace
+
+from pymavlink.dialects.v10 import ardupilotmega as mavlink1
+from pymavlink.dialects.v20 import ardupilotmega as mavlink2
+
+from modules.pos_data import PosData
+
+
+def poller(mav, msg_types):
+    # PosData without the serial link and heartbeat wait
+    posdata = PosData.__new__(PosData)
+    posdata.msg_types = msg_types
+    posdata._accepted = {}
+    posdata._master = SimpleNamespace(mav=mav)
+    posdata._filter_decode()
+    return posdata
+
+
+class TestDecodeFilter(unittest.TestCase):
+    def check(self, dialect):
+        sender = dialect.MAVLink(None, srcSystem=1, srcComponent=1)
+        packets = [
+            dialect.MAVLink_attitude_message(10, 0.1, 0.2, 0.3, 0, 0, 0),
+            dialect.MAVLink_sys_status_message(0, 0, 0, 500, 12000, -1, 80, 0, 0, 0, 0, 0, 0),
+            dialect.MAVLink_heartbeat_message(2, 3, 0, 0, 4, 3),
+            dialect.MAVLink_vfr_hud_message(1.0, 2.0, 90, 50, 10.0, 0.5),
+        ]
+        data = b"".join(packet.pack(sender) for packet in packets)
+
+        parser = dialect.MAVLink(None)
+        posdata = poller(parser, ("ATTITUDE",))
+        msgs = parser.parse_buffer(data)
+
+        types = [msg.get_type() for msg in msgs]
+        self.assertEqual(types, ["ATTITUDE", f"UNKNOWN_{dialect.MAVLINK_MSG_ID_SYS_STATUS}",
+                                 "HEARTBEAT", f"UNKNOWN_{dialect.MAVLINK_MSG_ID_VFR_HUD}"])
+        self.assertAlmostEqual(msgs[0].pitch, 0.2, places=6)
+        self.assertEqual(msgs[2].type, 2)
+        self.assertEqual([posdata._accepts(type) for type in types], [True, False, False, False])
+
+    def test_mavlink1(self):
+        self.check(mavlink1)
+
+    def test_mavlink2(self):
+        self.check(mavlink2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,60 @@
+import unittest
+
+import numpy as np
+
+from modules.sensor_sync import SensorSync
+
+
+def attitude(t, roll=0.0, pitch=0.0, yaw=0.0):
+    return dict(_recv_time=t, roll=roll, pitch=pitch, yaw=yaw, rollspeed=0.0, pitchspeed=0.0, yawspeed=0.0)
+
+
+class TestSensorSync(unittest.TestCase):
+    def test_bracket(self):
+        sync = SensorSync()
+        sync.update({"ATTITUDE": attitude(1.0)})
+        sync.update({"ATTITUDE": attitude(2.0)})
+        sync.update({"ATTITUDE": attitude(3.0)})
+
+        (t0, _), (t1, _), alpha = sync._bracket("ATTITUDE", 2.25)
+        self.assertEqual((t0, t1), (2.0, 3.0))
+        self.assertAlmostEqual(alpha, 0.25)
+        # clamped to the buffered window, never extrapolated
+        self.assertEqual(sync._bracket("ATTITUDE", 0.5)[2], 0.0)
+        self.assertEqual(sync._bracket("ATTITUDE", 3.5)[0][0], 3.0)
+        self.assertIsNone(sync._bracket("GLOBAL_POSITION_INT", 2.0))
+
+    def test_queue_samples_need_receive_time(self):
+        sync = SensorSync()
+        sample = attitude(1.0)
+        # the main loop sees the same dict until a new packet arrives
+        for _ in range(3):
+            sync.update({"ATTITUDE": sample})
+        sync.update({"ATTITUDE": dict(roll=0.0, pitch=0.0, yaw=0.0)})
+        self.assertEqual(len(sync._samples["ATTITUDE"]), 1)
+
+    def test_slerp_across_yaw_wrap(self):
+        sync = SensorSync()
+        sync.update({"ATTITUDE": attitude(1.0, yaw=np.pi - 0.1)})
+        sync.update({"ATTITUDE": attitude(2.0, yaw=-np.pi + 0.1)})
+        att = sync.attitude_at(1.5)
+        # the short way round through +-pi, not through 0
+        self.assertAlmostEqual(abs(att["yaw"]), np.pi, places=5)
+        att = sync.attitude_at(1.25)
+        self.assertAlmostEqual(att["yaw"], np.pi - 0.05, places=5)
+
+    def test_skew(self):
+        sync = SensorSync()
+        sync.update({"ATTITUDE": attitude(1.0)})
+        sync.update({"ATTITUDE": attitude(2.0)})
+        sync.attitude_at(1.3)
+        self.assertAlmostEqual(sync.skew, 0.3)
+        sync.attitude_at(1.8)
+        self.assertAlmostEqual(sync.skew, -0.2)
+        stats = sync.stats()
+        self.assertAlmostEqual(stats["mean_abs_skew_ms"], 250.0)
+        self.assertAlmostEqual(stats["max_abs_skew_ms"], 300.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
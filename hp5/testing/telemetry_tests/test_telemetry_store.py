@@ -0,0 +1,92 @@
+import time
+import unittest
+from multiprocessing import Process
+
+import numpy as np
+
+from modules.telemetry_store import TELEMETRY_LAYOUT, TelemetryStore
+
+ATTITUDE_FIELDS = [name for name, _ in TELEMETRY_LAYOUT["ATTITUDE"]]
+WRITES = 20000
+
+
+def attitude(value):
+    return {name: value for name in ATTITUDE_FIELDS}
+
+
+def write_attitudes(store):
+    for value in range(1, WRITES + 1):
+        store.publish("ATTITUDE", attitude(value), recv_time=float(value))
+    store.close()
+
+
+class TestTelemetryStore(unittest.TestCase):
+    def setUp(self):
+        self.store = TelemetryStore()
+
+    def tearDown(self):
+        self.store.close()
+        self.store.unlink()
+
+    def test_layout_round_trip(self):
+        for msg_type, fields in TELEMETRY_LAYOUT.items():
+            msg = {}
+            for ii, (name, fmt) in enumerate(fields):
+                kind = np.dtype(fmt).kind
+                msg[name] = ii + 0.5 if kind == "f" else (-ii - 1 if kind == "i" else ii + 1)
+            self.assertTrue(self.store.publish(msg_type, msg, recv_time=12.5))
+            data = self.store.read(msg_type)
+            self.assertEqual(data.pop("mavpackettype"), msg_type)
+            self.assertEqual(data.pop("_recv_time"), 12.5)
+            self.assertEqual(data, msg)
+        # unchanged values and unknown types are not published
+        self.assertFalse(self.store.publish(msg_type, msg))
+        self.assertFalse(self.store.publish("STATUSTEXT", {"text": "x"}))
+
+        msg, timestamp = self.store.get()
+        self.assertEqual(set(msg), set(TELEMETRY_LAYOUT))
+        self.assertEqual(timestamp, msg["RAW_IMU"]["time_usec"] / 1000)
+
+    def test_history_numbering(self):
+        self.assertIsNone(self.store.read("ATTITUDE"))
+        self.assertEqual(self.store.history("ATTITUDE"), [])
+        depth = self.store.history_depth["ATTITUDE"]
+        for value in range(depth + 5):
+            self.store.publish("ATTITUDE", attitude(value), recv_time=float(value))
+
+        self.assertEqual(self.store.count("ATTITUDE"), depth + 5)
+        samples = self.store.history("ATTITUDE")
+        # only the last depth samples are kept, numbered as by count
+        self.assertEqual([number for number, _ in samples], list(range(5, depth + 5)))
+        self.assertTrue(all(msg["time_boot_ms"] == number for number, msg in samples))
+        samples = self.store.history("ATTITUDE", since=depth + 3)
+        self.assertEqual([number for number, _ in samples], [depth + 3, depth + 4])
+        self.assertEqual(self.store.history("ATTITUDE", since=depth + 5), [])
+
+    def test_reader_never_sees_torn_records(self):
+        writer = Process(target=write_attitudes, args=(self.store,))
+        writer.start()
+        reads = 0
+        try:
+            deadline = time.monotonic() + 30
+            while writer.is_alive() and time.monotonic() < deadline:
+                samples = [(None, self.store.read("ATTITUDE"))] + self.store.history("ATTITUDE")
+                for number, msg in samples:
+                    if msg is None:
+                        continue
+                    reads += 1
+                    values = {msg[name] for name in ATTITUDE_FIELDS}
+                    self.assertEqual(len(values), 1, msg)
+                    self.assertEqual(msg["_recv_time"], values.pop())
+                    if number is not None:
+                        # a lapped slot is never reported under an old number
+                        self.assertEqual(msg["time_boot_ms"], number + 1)
+        finally:
+            writer.join()
+        self.assertGreater(reads, 0)
+        self.assertEqual(self.store.count("ATTITUDE"), WRITES)
+        self.assertEqual(self.store.read("ATTITUDE")["time_boot_ms"], WRITES)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,186 @@
+import os
+import sys
+import tempfile
+import time
+import types
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from modules.xfeat import backends
+from modules.xfeat.backends import PROBE_SHAPE, MockBackend, OnnxBackend, create_backend
+from modules.xfeat.xfeat_np import XFeatNP
+
+try:
+    import onnxruntime
+except ImportError:
+    onnxruntime = None
+
+
+class BrokenBackend(MockBackend):
+    name = "broken"
+
+    def run(self, x):
+        M1, K1, H1 = super().run(x)
+        return M1, K1[:, :64], H1
+
+
+class RecordingBackend(MockBackend):
+    def __init__(self, weights=None):
+        super().__init__(weights)
+        self.weights = weights
+
+
+class FakeSession:
+    """InferenceSession stand-in, fills the bound outputs with the run number."""
+
+    created = []
+
+    def __init__(self, path, options=None, providers=None):
+        self.path = path
+        self.options = options
+        self.runs = 0
+        FakeSession.created.append(self)
+        if options is not None and options.optimized_model_filepath:
+            with open(options.optimized_model_filepath, "w") as f:
+                f.write("optimized")
+
+    def get_inputs(self):
+        return [types.SimpleNamespace(name="images")]
+
+    def get_outputs(self):
+        return [types.SimpleNamespace(name=name) for name in ("feats", "keypoints", "heatmaps")]
+
+    def io_binding(self):
+        return FakeBinding()
+
+    def run_with_iobinding(self, binding):
+        self.runs += 1
+        for shape, address in binding.outputs:
+            size = int(np.prod(shape))
+            buf = np.ctypeslib.as_array((np.ctypeslib.ctypes.c_float * size).from_address(address))
+            buf[:] = self.runs
+
+
+class FakeBinding:
+    def __init__(self):
+        self.outputs = []
+
+    def bind_cpu_input(self, name, array):
+        pass
+
+    def bind_output(self, name, device, device_id, dtype, shape, address):
+        self.outputs.append((shape, address))
+
+
+class FakeOptions:
+    def __init__(self):
+        self.optimized_model_filepath = ""
+        self.config = {}
+
+    def add_session_config_entry(self, key, value):
+        self.config[key] = value
+
+
+def fake_ort():
+    return types.SimpleNamespace(
+        __version__="1.0.0",
+        SessionOptions=FakeOptions,
+        InferenceSession=FakeSession,
+        ExecutionMode=types.SimpleNamespace(ORT_SEQUENTIAL="sequential"),
+        GraphOptimizationLevel=types.SimpleNamespace(ORT_DISABLE_ALL="disable", ORT_ENABLE_ALL="all"),
+    )
+
+
+class TestOnnxBackend(unittest.TestCase):
+    def setUp(self):
+        FakeSession.created = []
+        patchers = [
+            mock.patch.dict(sys.modules, {"onnxruntime": fake_ort()}),
+            mock.patch.object(backends, "big_cores", lambda: [4, 5, 6, 7]),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.weights = os.path.join(tmp.name, "net.onnx")
+        with open(self.weights, "w") as f:
+            f.write("model")
+        self.cache = os.path.join(tmp.name, "net.ort1.0.0.onnx")
+
+    def test_session_options(self):
+        options = OnnxBackend(self.weights).session.options
+        self.assertEqual(options.execution_mode, "sequential")
+        self.assertEqual(options.graph_optimization_level, "all")
+        # one thread per big core, the calling thread is not pinned
+        self.assertEqual(options.intra_op_num_threads, 4)
+        self.assertEqual(options.config["session.intra_op_thread_affinities"], "6;7;8")
+
+        options = OnnxBackend(self.weights, threads=1).session.options
+        self.assertEqual(options.intra_op_num_threads, 1)
+        self.assertEqual(options.config, {})
+        self.assertIsNone(OnnxBackend(self.weights, tuned=False).session.options)
+
+    def test_optimized_model_cache(self):
+        session = OnnxBackend(self.weights).session
+        self.assertEqual(session.path, self.weights)
+        self.assertEqual(session.options.optimized_model_filepath, self.cache)
+        self.assertTrue(os.path.exists(self.cache))
+
+        # the cached graph is loaded without optimizing it again
+        session = OnnxBackend(self.weights).session
+        self.assertEqual(session.path, self.cache)
+        self.assertEqual(session.options.graph_optimization_level, "disable")
+
+        # newer weights invalidate the cache
+        later = time.time() + 10
+        os.utime(self.weights, (later, later))
+        self.assertEqual(OnnxBackend(self.weights).session.path, self.weights)
+
+    def test_outputs_survive_next_run(self):
+        backend = OnnxBackend(self.weights)
+        x = np.zeros(PROBE_SHAPE, dtype=np.float32)
+        first = backend.run(x)
+        second = backend.run(x)
+        self.assertEqual([out.shape for out in first], list(backends.expected_shapes(PROBE_SHAPE)))
+        self.assertTrue(all((out == 1).all() for out in first))
+        self.assertTrue(all((out == 2).all() for out in second))
+
+
+class TestBackends(unittest.TestCase):
+    def test_mock_shapes(self):
+        backend = create_backend("mock", input_shape=(1, 3, 128, 96))
+        self.assertIsInstance(backend, MockBackend)
+        M1, K1, H1 = backend.run(np.zeros((2, 3, 64, 64), dtype=np.float32))
+        self.assertEqual(M1.shape, (2, 64, 8, 8))
+        self.assertEqual(K1.shape, (2, 65, 8, 8))
+        self.assertEqual(H1.shape, (2, 1, 8, 8))
+
+    def test_check_rejects_wrong_outputs(self):
+        with self.assertRaises(ValueError):
+            BrokenBackend().check()
+
+    @unittest.skipIf(onnxruntime is None, "onnxruntime is required for the fallback")
+    def test_fallback_to_onnx(self):
+        with mock.patch.dict(backends.BACKENDS, {"mock": BrokenBackend}):
+            self.assertIsInstance(create_backend("mock"), OnnxBackend)
+
+    def test_fallback_keeps_onnx_weights(self):
+        with mock.patch.dict(backends.BACKENDS, {"rknn": BrokenBackend}), \
+                mock.patch.object(backends, "OnnxBackend", RecordingBackend):
+            self.assertEqual(create_backend("rknn", "weights/net.int8.onnx").weights, "weights/net.int8.onnx")
+            self.assertIsNone(create_backend("rknn", "weights/net.rknn").weights)
+
+    def test_xfeat_on_mock(self):
+        xfeat = XFeatNP(top_k=64, detection_threshold=0.01, inference="mock")
+        img = np.random.default_rng(0).integers(0, 255, (128, 128, 3), dtype=np.uint8)
+        out = xfeat.detectAndCompute(xfeat.parse_input(img))[0]
+        self.assertLessEqual(len(out["keypoints"]), 64)
+        self.assertEqual(out["descriptors"].shape, (len(out["keypoints"]), 64))
+        np.testing.assert_allclose(np.linalg.norm(out["descriptors"], axis=1), 1, atol=1e-5)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,132 @@
+import queue
+import threading
+import time
+import unittest
+from multiprocessing import Queue, Value
+
+import numpy as np
+
+from modules.frame_ring import ShmQueue
+from modules.vio.pipeline import VIOPipeline, _pose_worker, _warp_worker
+from modules.vio.vio_ort import RAD
+
+VIO_KWARGS = dict(backend="numpy", inference="mock", pose_workers=1)
+MSG = {"ATTITUDE": {"roll": 0.0, "pitch": 0.0, "yaw": 0.3}}
+
+
+def frame(value=100):
+    return np.full((480, 640, 3), value, dtype=np.uint8)
+
+
+def drain(que, timeout=2.0):
+    items = []
+    while True:
+        try:
+            items.append(que.get(timeout=timeout))
+        except queue.Empty:
+            return items
+        timeout = 0.3
+
+
+class TestStages(unittest.TestCase):
+    def setUp(self):
+        self.stop = Value("i", 0)
+        self.frames = ShmQueue((480, 640, 3), np.uint8, maxsize=2)
+        self.crops = ShmQueue((RAD, RAD, 3), np.uint8, maxsize=2)
+        self.workers = []
+
+    def tearDown(self):
+        self.stop.value = 1
+        for worker in self.workers:
+            worker.join()
+        for shared in (self.frames, self.crops):
+            shared.close()
+            shared.unlink()
+
+    def run_warp(self, budget=10.0):
+        worker = threading.Thread(target=_warp_worker,
+                                  args=(self.stop, self.frames, self.crops, VIO_KWARGS, budget))
+        worker.start()
+        self.workers.append(worker)
+
+    def test_drop_oldest(self):
+        seqs = [self.frames.put(frame(i), (MSG, time.time()), time.time()) for i in range(5)]
+        self.run_warp()
+        crops = drain(self.crops)
+        # only the newest maxsize frames survive a slow consumer
+        self.assertEqual([meta[0] for _, _, meta in crops], seqs[-2:])
+        self.assertEqual(crops[0][1].shape, (RAD, RAD, 3))
+
+    def test_latency_budget(self):
+        now = time.time()
+        self.frames.put(frame(), (MSG, now - 1.0), now - 1.0)
+        fresh = self.frames.put(frame(), (MSG, now), now)
+        self.run_warp(budget=0.5)
+        crops = drain(self.crops)
+        self.assertEqual([meta[0] for _, _, meta in crops], [fresh])
+
+    def test_pose_keeps_order(self):
+        features = ShmQueue((512, 67), np.float32, maxsize=4)
+        results = Queue(4)
+        try:
+            now = time.time()
+            packed = np.zeros((0, 67), dtype=np.float32)
+            for seq in (1, 2, 0, 3):
+                features.put(packed, (seq, seq, now, dict(roll=0, pitch=0, yaw=0), 10.0, (320, 240)), now)
+            worker = threading.Thread(target=_pose_worker,
+                                      args=(self.stop, features, results, VIO_KWARGS, 10.0))
+            worker.start()
+            self.workers.append(worker)
+            seqs = [result["seq"] for result in drain(results)]
+            # a sequence number going backwards is never reported
+            self.assertEqual(seqs, [1, 2, 3])
+        finally:
+            self.stop.value = 1
+            for worker in self.workers:
+                worker.join()
+            features.close()
+            features.unlink()
+
+
+class TestVIOPipeline(unittest.TestCase):
+    def test_results_in_order(self):
+        pipeline = VIOPipeline(budget=5.0, **VIO_KWARGS)
+        try:
+            seqs = []
+            deadline = time.monotonic() + 10
+            while len(seqs) < 3 and time.monotonic() < deadline:
+                pipeline.submit(frame(), MSG, time.time())
+                time.sleep(0.05)
+                result = pipeline.poll()
+                if result is not None:
+                    seqs.append(result["seq"])
+                    self.assertIn("lat", result)
+            self.assertGreaterEqual(len(seqs), 3)
+            self.assertEqual(seqs, sorted(set(seqs)))
+        finally:
+            pipeline.close()
+
+    def test_lapped_crop_is_dropped(self):
+        pipeline = VIOPipeline(**VIO_KWARGS)
+        try:
+            pipeline.stop.value = 1
+            for process in pipeline.processes:
+                process.join(timeout=2)
+            crop = np.full((RAD, RAD, 3), 7, dtype=np.uint8)
+            crop_seq = pipeline.crops.put(crop)
+            pipeline.results.put(dict(seq=0, crop_seq=crop_seq, timestamp=time.time()))
+            time.sleep(0.1)
+            np.testing.assert_array_equal(pipeline.poll()["crop"], crop)
+
+            # the crop slot is reused by newer crops before the result is polled
+            for _ in range(pipeline.crops.ring.slots):
+                pipeline.crops.put(crop)
+            pipeline.results.put(dict(seq=1, crop_seq=crop_seq, timestamp=time.time()))
+            time.sleep(0.1)
+            self.assertIsNone(pipeline.poll()["crop"])
+        finally:
+            pipeline.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,99 @@
+import unittest
+
+import cv2
+import numpy as np
+
+from modules.vio.vio_ort import CROP_CENTER, FOCAL, MAX_NUM_PTS2HOMO, RAD, TRACE_DEPTH, VIO
+
+NUM_PTS = 64
+
+
+def similarity(angle, scale, shift):
+    c, s = scale * np.cos(angle), scale * np.sin(angle)
+    return np.asarray([[c, -s, shift[0]], [s, c, shift[1]], [0, 0, 1]])
+
+
+def apply(matrix, pts):
+    pts = np.hstack((pts, np.ones((len(pts), 1)))) @ matrix.T
+    return (pts[:, :2] / pts[:, 2:]).astype(np.float32)
+
+
+def reference_pos(vio, next_pt):
+    """Pose of calc_pos computed pair by pair, without the batching."""
+    positions = []
+    for prev_pt in vio.trace:
+        mkpts_0, mkpts_1 = vio.match_points(prev_pt["out"], next_pt["out"])
+        if vio.pose_model == "similarity":
+            HoM, _ = cv2.estimateAffinePartial2D(mkpts_0, mkpts_1, method=cv2.RANSAC, ransacReprojThreshold=2.0)
+            HoM = np.vstack((HoM, [0, 0, 1]))
+        else:
+            HoM, _ = cv2.findHomography(mkpts_0, mkpts_1, cv2.RANSAC, 2.0)
+        center = apply(HoM, CROP_CENTER[None])[0]
+        pix_shift = CROP_CENTER - center
+        pix_shift = np.asarray([-pix_shift[1], pix_shift[0]])
+        height = (prev_pt["height"] + next_pt["height"]) / 2
+        positions.append(prev_pt["local_posm"] + pix_shift / FOCAL * height)
+    return np.mean(positions, axis=0)
+
+
+class TestPose(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.kpts = rng.uniform(40, RAD - 40, (NUM_PTS, 2)).astype(np.float32)
+        descriptors = rng.normal(size=(NUM_PTS, 64)).astype(np.float32)
+        self.descriptors = descriptors / np.linalg.norm(descriptors, axis=1, keepdims=True)
+        # motion from every trace point to the next frame, rotation stays small after derotation
+        self.motions = [similarity(0.02 * k, 1 + 0.01 * k, (3.0 * k - 4, 2.0 - k)) for k in range(TRACE_DEPTH)]
+
+    def vio(self, **kwargs):
+        vio = VIO(backend="numpy", inference="mock", **kwargs)
+        for k, motion in enumerate(self.motions):
+            # trace keypoints map onto the next frame keypoints through motion
+            kpts = apply(np.linalg.inv(motion), self.kpts)
+            trace_pt = dict(out=dict(keypoints=kpts, descriptors=self.descriptors),
+                            height=20.0 + k, local_posm=np.asarray([1.5 * k, -0.5 * k]))
+            if vio.batch_match:
+                trace_pt["slot"] = k
+                vio._bank.put(k, self.descriptors)
+            vio.trace.append(trace_pt)
+        return vio
+
+    def next_pt(self):
+        return dict(out=dict(keypoints=self.kpts, descriptors=self.descriptors), height=22.0)
+
+    def test_batched_matches_pair_loop(self):
+        for pose_model in ("homography", "similarity"):
+            for pose_workers in (1, 4):
+                for batch_match in (False, True):
+                    vio = self.vio(pose_model=pose_model, pose_workers=pose_workers, batch_match=batch_match)
+                    with self.subTest(pose_model=pose_model, pose_workers=pose_workers, batch_match=batch_match):
+                        np.testing.assert_allclose(vio.calc_pos(self.next_pt()),
+                                                   reference_pos(vio, self.next_pt()), atol=1e-3)
+
+    def test_similarity_estimate(self):
+        vio = self.vio(pose_model="similarity", pose_workers=1)
+        motion = self.motions[2]
+        mkpts_0 = apply(np.linalg.inv(motion), self.kpts)[:MAX_NUM_PTS2HOMO]
+        mkpts_1 = self.kpts[:MAX_NUM_PTS2HOMO]
+        HoM, mask = vio.estimate_transform(mkpts_0, mkpts_1)
+        self.assertEqual(HoM.shape, (3, 3))
+        self.assertTrue(mask.all())
+        np.testing.assert_allclose(HoM, motion, atol=1e-3)
+
+        # the 4-DOF fit agrees with the homography on similarity motion
+        vio.pose_model = "homography"
+        np.testing.assert_allclose(vio.estimate_transform(mkpts_0, mkpts_1)[0], HoM, atol=1e-3)
+
+    def test_estimate_rejects_outliers(self):
+        vio = self.vio(pose_model="similarity", pose_workers=1)
+        mkpts_0 = apply(np.linalg.inv(self.motions[1]), self.kpts)[:MAX_NUM_PTS2HOMO]
+        mkpts_1 = self.kpts[:MAX_NUM_PTS2HOMO].copy()
+        mkpts_1[:3] += 40
+        HoM, mask = vio.estimate_transform(mkpts_0, mkpts_1)
+        np.testing.assert_array_equal(mask[:3], False)
+        self.assertTrue(mask[3:].all())
+        np.testing.assert_allclose(HoM, self.motions[1], atol=1e-3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,36 @@
+import unittest
+
+import numpy as np
+
+from modules.vio.utils import RemapCache, fetch_angles
+
+
+class TestFetchAngles(unittest.TestCase):
+    def test_message_keeps_autopilot_yaw(self):
+        msg = {"ATTITUDE": {"roll": 0.1, "pitch": -0.2, "yaw": 1.5}}
+        self.assertAlmostEqual(fetch_angles(msg)["yaw"], -1.5)
+        # the same message is recorded and may be replayed through VIO again
+        self.assertAlmostEqual(msg["ATTITUDE"]["yaw"], 1.5)
+        self.assertAlmostEqual(fetch_angles(msg)["yaw"], -1.5)
+
+
+class TestRemapCache(unittest.TestCase):
+    def test_fused_tables_are_cached(self):
+        mask = np.ones((120, 160), dtype=bool)
+        mask[:, :20] = False
+        exact = RemapCache(40, 64, 64)
+        cached = RemapCache(40, 64, 64, yaw_quant=np.deg2rad(0.5))
+        yaw = np.deg2rad(10)
+        for delta in (0, np.deg2rad(0.1), 0):
+            maps = cached.warp((80, 60), yaw + delta, mask)
+        self.assertEqual((cached.hits, cached.misses), (2, 1))
+        # within the yaw quantization of the exact tables, away from the mask edge
+        ref = exact.warp((80, 60), yaw, mask)
+        inside = (ref[0] > 25) & (maps[0] > 25)
+        np.testing.assert_allclose(maps[0][inside], ref[0][inside], atol=0.2)
+        np.testing.assert_allclose(maps[1][inside], ref[1][inside], atol=0.2)
+        self.assertEqual(exact.stats()["size"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
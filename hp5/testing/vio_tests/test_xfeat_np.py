@@ -0,0 +1,91 @@
+import unittest
+
+import cv2
+import numpy as np
+
+from modules.xfeat.xfeat_np import XFeatNP, interpolate_sparse2d
+
+try:
+    import torch
+    from modules.xfeat.interpolator import InterpolateSparse2d
+    from modules.xfeat.xfeat_ort import XFeat
+except ImportError:
+    torch = None
+
+
+def textured_image(size=256, seed=0):
+    rng = np.random.default_rng(seed)
+    img = rng.integers(0, 255, (size // 8, size // 8, 3), dtype=np.uint8)
+    img = cv2.resize(img, (size, size), interpolation=cv2.INTER_CUBIC)
+    return cv2.GaussianBlur(img, (3, 3), 0)
+
+
+@unittest.skipIf(torch is None, "torch is required for the reference path")
+class TestXFeatNPParity(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.ref = XFeat(top_k=512)
+        cls.np_ = XFeatNP(top_k=512)
+        # both backends run the same onnx graph, share it
+        cls.np_._backend = cls.ref.backend
+
+    def test_interpolation(self):
+        rng = np.random.default_rng(1)
+        x = rng.standard_normal((1, 8, 32, 32)).astype(np.float32)
+        pos = rng.integers(0, 256, (1, 100, 2))
+        for mode in ("nearest", "bilinear", "bicubic"):
+            expected = InterpolateSparse2d(mode)(torch.from_numpy(x), torch.from_numpy(pos), 256, 256)
+            np.testing.assert_allclose(
+                interpolate_sparse2d(x, pos, 256, 256, mode), expected.numpy(), atol=1e-5, err_msg=mode
+            )
+
+    def test_detect_and_compute(self):
+        img = textured_image()
+        ref = self.ref.detectAndCompute(self.ref.parse_input(img))[0]
+        out = self.np_.detectAndCompute(self.np_.parse_input(img))[0]
+
+        # ties in the score sort may order keypoints differently, compare by position
+        ref_kpts = {tuple(kpt): ii for ii, kpt in enumerate(ref["keypoints"].numpy().tolist())}
+        kpts = out["keypoints"].tolist()
+        self.assertEqual(len(kpts), len(ref_kpts))
+        self.assertEqual(set(map(tuple, kpts)), set(ref_kpts))
+
+        order = [ref_kpts[tuple(kpt)] for kpt in kpts]
+        np.testing.assert_allclose(out["scores"], ref["scores"].numpy()[order], atol=1e-5)
+        np.testing.assert_allclose(out["descriptors"], ref["descriptors"].numpy()[order], atol=1e-4)
+
+    def test_match(self):
+        rng = np.random.default_rng(2)
+        feats1 = rng.standard_normal((300, 64)).astype(np.float32)
+        feats2 = np.concatenate([feats1[:200], rng.standard_normal((100, 64)).astype(np.float32)])
+        feats1 /= np.linalg.norm(feats1, axis=1, keepdims=True)
+        feats2 /= np.linalg.norm(feats2, axis=1, keepdims=True)
+
+        for min_cossim in (-1, 0.82):
+            idx0, idx1 = self.np_.match(feats1, feats2, min_cossim=min_cossim)
+            ref0, ref1 = self.ref.match(torch.from_numpy(feats1), torch.from_numpy(feats2), min_cossim=min_cossim)
+            np.testing.assert_array_equal(idx0, ref0.numpy())
+            np.testing.assert_array_equal(idx1, ref1.numpy())
+
+    def test_match_bank(self):
+        rng = np.random.default_rng(3)
+        sets = [rng.standard_normal((n, 64)).astype(np.float32) for n in (120, 80, 0)]
+        sets = [s / np.maximum(np.linalg.norm(s, axis=1, keepdims=True), 1e-12) for s in sets]
+        feats2 = np.concatenate([sets[0][:50], sets[1][:30]])
+
+        bank = self.np_.descriptor_bank(len(sets))
+        for slot, feats in enumerate(sets):
+            bank.put(slot, feats)
+
+        matches = self.np_.match_bank(bank.feats, bank.valid, feats2, min_cossim=-1)
+        for feats, (idx0, idx1) in zip(sets, matches):
+            if len(feats) == 0:
+                self.assertEqual(len(idx0), 0)
+                continue
+            ref0, ref1 = self.ref.match(torch.from_numpy(feats), torch.from_numpy(feats2), min_cossim=-1)
+            np.testing.assert_array_equal(idx0, ref0.numpy())
+            np.testing.assert_array_equal(idx1, ref1.numpy())
+
+
+if __name__ == "__main__":
+    unittest.main()
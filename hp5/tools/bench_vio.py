@@ -0,0 +1,200 @@
+"""
+VIO performance benchmark with per-stage timing and a regression gate.
+
+Stages: fisheye2rectilinear, the fused and the legacy rotation+remap warp,
+XFeat detectAndCompute, XFeat match, VIO.calc_pos and the full
+add_trace_pt, on synthetic frames or on recorded flights. Every stage
+reports p50/p95/p99 latency and the peak memory it allocates. Run from the
+hp5 directory:
+
+    python -m tools.bench_vio --save baseline.json
+    python -m tools.bench_vio --dump /home/orangepi/dumps/<flight> --baseline baseline.json
+
+With --baseline the run exits with status 1 when a stage's p50 or p95 got
+slower than the baseline by more than --threshold.
+"""
+
+import argparse
+import itertools
+import json
+import platform
+import resource
+import sys
+import time
+import tracemalloc
+
+import cv2
+import numpy as np
+
+from modules.vio.utils import fisheye2rectilinear
+from modules.vio.vio_ort import FOCAL, RAD, VIO, XFEAT_BACKEND, XFEAT_INFERENCE, camparam
+from utils.data_utils import iter_dump
+
+NUM_FRAMES = 100
+WARMUP = 5
+# allowed slowdown against the baseline, 0.15 is 15 %
+THRESHOLD = 0.15
+PERCENTILES = (50, 95, 99)
+
+
+def synthetic_frames(num_frames=NUM_FRAMES, seed=0):
+    """Textured fisheye-sized frames drifting across a larger scene with a gently swaying attitude."""
+    rng = np.random.default_rng(seed)
+    height, width = camparam["imageHeight"], camparam["imageWidth"]
+    margin = 2 * num_frames + 8
+    scene = rng.integers(0, 255, ((height + margin) // 8, (width + margin) // 8, 3), dtype=np.uint8)
+    scene = cv2.resize(scene, (width + margin, height + margin), interpolation=cv2.INTER_CUBIC)
+    for ii in range(num_frames):
+        frame = np.ascontiguousarray(scene[2 * ii:2 * ii + height, ii:ii + width])
+        msg = {
+            "ATTITUDE": dict(roll=0.02 * np.sin(ii / 10), pitch=0.02 * np.cos(ii / 10), yaw=0.001 * ii),
+            "GLOBAL_POSITION_INT": dict(lat=0, lon=0, alt=0, relative_alt=30000),
+        }
+        yield ii / 30, frame, msg
+
+
+class StageTimer:
+    def __init__(self):
+        self.samples = {}
+        self.peaks = {}
+
+    def measure(self, name, func, *args, trace=False):
+        if trace:
+            tracemalloc.start()
+            result = func(*args)
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            self.peaks[name] = max(self.peaks.get(name, 0), peak)
+            return result
+        tic = time.perf_counter()
+        result = func(*args)
+        self.samples.setdefault(name, []).append(time.perf_counter() - tic)
+        return result
+
+    def report(self):
+        stages = {}
+        for name, samples in self.samples.items():
+            ms = np.asarray(samples[WARMUP:] if len(samples) > 2 * WARMUP else samples) * 1000
+            stage = {f"p{p}_ms": float(np.percentile(ms, p)) for p in PERCENTILES}
+            stage.update(mean_ms=float(ms.mean()), n=int(len(ms)), peak_alloc_kb=self.peaks.get(name, 0) / 1024)
+            stages[name] = stage
+        return stages
+
+
+def measure_frame(timer, vio, legacy, full, frame, msg, prev_out, trace=False):
+    """Time (or trace) every stage on one frame, returns what the next frame needs."""
+    crop, angles, height, dpp = timer.measure("warp", vio.warp, frame, msg, trace=trace)
+    timer.measure("warp_legacy", legacy.warp, frame, msg, trace=trace)
+    timer.measure("fisheye2rectilinear", fisheye2rectilinear, FOCAL, dpp, RAD, RAD, trace=trace)
+    out = timer.measure("detect_and_compute", vio.detect_and_compute, crop, trace=trace)
+    if prev_out is not None:
+        timer.measure("match", vio._matcher.match, prev_out["descriptors"], out["descriptors"], -1, trace=trace)
+    trace_pt = dict(crop=crop, out=out, angles=angles, height=height)
+    if vio.trace:
+        timer.measure("calc_pos", vio.calc_pos, trace_pt, trace=trace)
+    timer.measure("add_trace_pt", full.add_trace_pt, frame, msg, trace=trace)
+    return trace_pt, dpp, out
+
+
+def run(frames, backend, inference, weights=None):
+    timer = StageTimer()
+    kwargs = dict(backend=backend, inference=inference, weights=weights)
+
+    def instances():
+        return VIO(**kwargs), VIO(fused_warp=False, **kwargs), VIO(**kwargs)
+
+    vio, legacy, full = instances()
+    # matchers load the model on first use, load it only once
+    legacy._matcher = full._matcher = vio._matcher
+
+    first = None
+    prev_out = None
+    for ii, (timestamp, frame, msg) in enumerate(frames):
+        if ii == 0:
+            first = frame, msg
+        elif ii == 1:
+            # memory peaks of the first frame with matching, on throwaway
+            # instances so the timed ones see every frame exactly once
+            traced = instances()
+            for other in traced:
+                other._matcher = vio._matcher
+            traced[0].add_trace_pt(*first)
+            traced[2].add_trace_pt(*first)
+            measure_frame(timer, *traced, frame, msg, prev_out, trace=True)
+
+        trace_pt, dpp, out = measure_frame(timer, vio, legacy, full, frame, msg, prev_out)
+        vio.update(trace_pt, dpp, timestamp)
+        prev_out = out
+
+    return timer.report()
+
+
+def compare(stages, baseline, threshold=THRESHOLD):
+    """Regression messages for stages slower than the baseline by more than threshold."""
+    regressions = []
+    for name, stage in stages.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        for key in ("p50_ms", "p95_ms"):
+            if stage[key] > base[key] * (1 + threshold):
+                regressions.append(f"{name} {key}: {stage[key]:.2f} ms vs {base[key]:.2f} ms baseline")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dump", help="recorded flight, synthetic frames if omitted")
+    parser.add_argument("--frames", type=int, default=NUM_FRAMES)
+    parser.add_argument("--backend", default=XFEAT_BACKEND)
+    parser.add_argument("--inference", default=XFEAT_INFERENCE)
+    parser.add_argument("--weights", default=None)
+    parser.add_argument("--save", help="write the results as a baseline JSON")
+    parser.add_argument("--baseline", help="baseline JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD)
+    args = parser.parse_args()
+
+    if args.dump:
+        frames = itertools.islice(iter_dump(args.dump), args.frames)
+    else:
+        frames = synthetic_frames(args.frames)
+    stages = run(frames, args.backend, args.inference, args.weights)
+
+    print(f"{'stage':<22}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'alloc kB':>11}")
+    for name, stage in stages.items():
+        print(
+            f"{name:<22}{stage['p50_ms']:9.2f}{stage['p95_ms']:9.2f}{stage['p99_ms']:9.2f}"
+            f"{stage['peak_alloc_kb']:11.0f}"
+        )
+    max_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"max RSS {max_rss_mb:.0f} MB")
+
+    result = dict(
+        meta=dict(
+            machine=platform.machine(),
+            python=platform.python_version(),
+            source=args.dump or "synthetic",
+            backend=args.backend,
+            inference=args.inference,
+            weights=args.weights,
+            max_rss_mb=max_rss_mb,
+        ),
+        stages=stages,
+    )
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(result, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(stages, baseline["stages"], args.threshold)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions over {args.threshold:.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""
+Accuracy versus speed of XFeat model variants on recorded flights.
+
+Every variant runs through VIO on the same frames. Reported per variant:
+backbone latency (detect_and_compute), keypoint agreement with the first
+(reference) variant on the same crop and trajectory drift against the reference VIO
+track and against the autopilot position when the dump has one. Run from
+the hp5 directory:
+
+    python -m tools.bench_xfeat_variants --dump /home/orangepi/dumps/<flight> \
+        weights/net.onnx weights/net.int8.onnx weights/net.fp16.onnx
+"""
+
+import argparse
+import itertools
+import json
+import time
+
+import numpy as np
+
+from modules.vio.vio_ort import METERS_DEG, VIO
+from utils.data_utils import iter_dump
+
+# keypoints closer than this to a reference keypoint count as agreeing, px
+AGREE_PX = 3.0
+
+
+def agreement(kpts, ref_kpts, radius=AGREE_PX):
+    """
+    Share of keypoints found by both variants on the same crop. This is not
+    repeatability, no viewpoint change is involved.
+    """
+    if len(kpts) == 0 or len(ref_kpts) == 0:
+        return 0.0
+    dist = np.linalg.norm(kpts[:, None, :] - ref_kpts[None, :, :], axis=-1)
+    return float(np.count_nonzero(dist.min(axis=1) <= radius) / min(len(kpts), len(ref_kpts)))
+
+
+def gps_offset(msg, lat0, lon0):
+    """Autopilot position relative to the start, metres north/east, or None."""
+    pos = msg.get("GLOBAL_POSITION_INT")
+    if not pos:
+        return None
+    lat, lon = pos["lat"] / 1e7, pos["lon"] / 1e7
+    return np.asarray([(lat - lat0) * METERS_DEG, (lon - lon0) * METERS_DEG * np.cos(lat0 / 180 * np.pi)])
+
+
+def run_flight(dump_dir, variants, top_k):
+    frames = iter_dump(dump_dir)
+    first = next(frames, None)
+    if first is None:
+        return None
+
+    pos = first[2].get("GLOBAL_POSITION_INT")
+    lat0, lon0 = (pos["lat"] / 1e7, pos["lon"] / 1e7) if pos else (0, 0)
+    vios = [VIO(lat0, lon0, top_k=top_k, backend="numpy", inference="onnx", weights=w) for w in variants]
+    stats = [dict(latency=[], agreement=[], track=[]) for _ in variants]
+    gps_track = []
+
+    for timestamp, frame, msg in itertools.chain([first], frames):
+        ref_kpts = None
+        for vio, stat in zip(vios, stats):
+            crop, angles, height, dpp = vio.warp(frame, msg)
+            t0 = time.perf_counter()
+            out = vio.detect_and_compute(crop)
+            stat["latency"].append(time.perf_counter() - t0)
+
+            kpts = np.asarray(out["keypoints"], dtype=np.float32)
+            if ref_kpts is None:
+                ref_kpts = kpts
+            stat["agreement"].append(agreement(kpts, ref_kpts))
+
+            trace_pt = dict(crop=None, out=out, angles=angles, height=height)
+            result = vio.update(trace_pt, dpp, timestamp)
+            stat["track"].append((result["to_north"], result["to_east"]))
+        gps_track.append(gps_offset(msg, lat0, lon0))
+
+    ref_track = np.asarray(stats[0]["track"])
+    has_gps = all(p is not None for p in gps_track)
+    report = []
+    for weights, stat in zip(variants, stats):
+        latency = np.asarray(stat["latency"]) * 1000
+        track = np.asarray(stat["track"])
+        drift_ref = np.linalg.norm(track - ref_track, axis=1)
+        item = dict(
+            weights=weights,
+            frames=len(latency),
+            latency_ms_mean=float(latency.mean()),
+            latency_ms_p95=float(np.percentile(latency, 95)),
+            agreement=float(np.mean(stat["agreement"])),
+            drift_vs_ref_m_final=float(drift_ref[-1]),
+            drift_vs_ref_m_max=float(drift_ref.max()),
+        )
+        if has_gps:
+            drift_gps = np.linalg.norm(track - np.asarray(gps_track), axis=1)
+            item.update(drift_vs_gps_m_final=float(drift_gps[-1]), drift_vs_gps_m_max=float(drift_gps.max()))
+        report.append(item)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("variants", nargs="+", help="ONNX models, the first one is the reference")
+    parser.add_argument("--dump", action="append", required=True, help="dump directory, may be repeated")
+    parser.add_argument("--top-k", type=int, default=512)
+    parser.add_argument("--json", help="write the full report to this file")
+    args = parser.parse_args()
+
+    reports = {}
+    for dump_dir in args.dump:
+        report = run_flight(dump_dir, args.variants, args.top_k)
+        if report is None:
+            print(f"{dump_dir}: no frames")
+            continue
+        reports[dump_dir] = report
+        print(dump_dir)
+        for item in report:
+            gps = f"{item['drift_vs_gps_m_final']:8.2f}" if "drift_vs_gps_m_final" in item else "     n/a"
+            print(
+                f"  {item['weights']:<40} {item['latency_ms_mean']:7.1f} ms (p95 {item['latency_ms_p95']:6.1f})"
+                f"  agree {item['agreement']:.3f}"
+                f"  drift ref {item['drift_vs_ref_m_final']:7.2f} m  gps {gps} m"
+            )
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(reports, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
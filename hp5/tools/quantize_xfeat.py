@@ -0,0 +1,108 @@
+"""
+Build INT8 and FP16 variants of the XFeat backbone.
+
+The static INT8 model is calibrated on VIO crops produced from recorded
+flights (dump directories of main.py), so activation ranges match what the
+model sees in flight. Run from the hp5 directory:
+
+    python -m tools.quantize_xfeat --dump /home/orangepi/dumps/<flight> [--dump ...]
+
+Produces weights/net.int8.onnx and weights/net.fp16.onnx next to the source model.
+"""
+
+import argparse
+import itertools
+import os
+
+import numpy as np
+
+from modules.vio.vio_ort import VIO
+from modules.xfeat.backends import DEFAULT_WEIGHTS
+from modules.xfeat.xfeat_np import XFeatNP
+from utils.data_utils import iter_dump
+
+CALIBRATION_FRAMES = 200
+# take every n-th frame so the calibration set covers the whole flight
+CALIBRATION_STRIDE = 5
+
+
+def calibration_inputs(dump_dirs, num_frames=CALIBRATION_FRAMES, stride=CALIBRATION_STRIDE):
+    """Backbone inputs (1, 3, H, W) float32 made from dumped frames."""
+    vio = VIO(backend="numpy", inference="mock", pose_workers=1)
+    xfeat = XFeatNP()
+    frames = itertools.chain.from_iterable(iter_dump(d) for d in dump_dirs)
+    for _, frame, msg in itertools.islice(frames, 0, num_frames * stride, stride):
+        crop, _, _, _ = vio.warp(frame, msg)
+        x, _, _ = xfeat.preprocess_tensor(xfeat.parse_input(crop))
+        yield x
+
+
+def quantize_int8(weights, output, dump_dirs, num_frames=CALIBRATION_FRAMES):
+    from onnxruntime.quantization import (
+        CalibrationDataReader,
+        CalibrationMethod,
+        QuantFormat,
+        QuantType,
+        quantize_static,
+    )
+    from onnxruntime.quantization.shape_inference import quant_pre_process
+
+    import onnxruntime as ort
+
+    input_name = ort.InferenceSession(weights, providers=["CPUExecutionProvider"]).get_inputs()[0].name
+
+    class DumpReader(CalibrationDataReader):
+        def __init__(self):
+            self.inputs = iter(calibration_inputs(dump_dirs, num_frames))
+
+        def get_next(self):
+            x = next(self.inputs, None)
+            return None if x is None else {input_name: x}
+
+    prepared = f"{os.path.splitext(output)[0]}.prep.onnx"
+    quant_pre_process(weights, prepared)
+    try:
+        quantize_static(
+            prepared,
+            output,
+            DumpReader(),
+            quant_format=QuantFormat.QDQ,
+            per_channel=True,
+            activation_type=QuantType.QUInt8,
+            weight_type=QuantType.QInt8,
+            calibrate_method=CalibrationMethod.MinMax,
+        )
+    finally:
+        os.remove(prepared)
+
+
+def convert_fp16(weights, output):
+    import onnx
+    from onnxconverter_common import float16
+
+    model = float16.convert_float_to_float16(onnx.load(weights), keep_io_types=True)
+    onnx.save(model, output)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dump", action="append", required=True, help="dump directory, may be repeated")
+    parser.add_argument("--weights", default=DEFAULT_WEIGHTS["onnx"], help="FP32 source model")
+    parser.add_argument("--frames", type=int, default=CALIBRATION_FRAMES, help="calibration frames")
+    parser.add_argument("--skip-int8", action="store_true")
+    parser.add_argument("--skip-fp16", action="store_true")
+    args = parser.parse_args()
+
+    base = os.path.splitext(args.weights)[0]
+    if not args.skip_int8:
+        output = f"{base}.int8.onnx"
+        quantize_int8(args.weights, output, args.dump, args.frames)
+        print(f"INT8 model saved to {output}")
+    if not args.skip_fp16:
+        output = f"{base}.fp16.onnx"
+        convert_fp16(args.weights, output)
+        print(f"FP16 model saved to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -8,11 +8,16 @@ import cv2
 import numpy as np
 
 from modules.logger import global_logger as logger
+from utils.recorder import is_recording, iter_recording
+from utils.recording_manager import FULL, LEVEL_NAMES, RecordingManager, session_name
 
 
 def serialize(data):
     if isinstance(data, dict):
         return {key: serialize(value) for key, value in data.items()}
+    elif hasattr(data, "_asdict"):
+        # NamedTuple records such as GPSFix keep their field names
+        return serialize(data._asdict())
     elif isinstance(data, (list, tuple)):
         return [serialize(element) for element in data]
     elif isinstance(data, (bool, int, float, str)):
@@ -37,28 +42,68 @@ def get_folder_size(folder_path: str) -> int:
     return total_size
 
 
-def setup_dumping(dump_dir: str, min_free_space: int) -> str:
+def setup_dumping(
+    dump_dir: str, min_free_space: int, budget: int | None = None
+) -> tuple[str, RecordingManager]:
+    """Create a new session folder, return it with the manager keeping its disk budget."""
     ipynb_dir = os.path.join(dump_dir, ".ipynb_checkpoints")
     if os.path.isdir(ipynb_dir):
         shutil.rmtree(ipynb_dir)
 
+    # old sessions are deleted to make room, recording degrades if that is not enough
+    manager = RecordingManager(dump_dir, min_free_space, budget)
+    level = manager.check(force=True)
     total, used, free = get_drive_space(dump_dir)
-    dump_size = get_folder_size(dump_dir)
-    logger.info(f"Size of dump folder is {dump_size}, space left is {free}")
-    assert free > min_free_space, f"Empty log dir {dump_dir} to have enough disk space"
-
-    ct = datetime.datetime.now()
-    count_files = len(os.listdir(dump_dir)) + 1
-    timestr = f"{ct.year}_{ct.month}_{ct.day}_{ct.hour}_{ct.minute}_{ct.second}_num_{count_files}"
-    data_dir = os.path.join(dump_dir, timestr)
+    logger.info(f"Size of dump folder is {manager.total_size()}, space left is {free}")
+    if level != FULL:
+        logger.warning(f"Not enough disk space in {dump_dir}, recording level: {LEVEL_NAMES[level]}")
+
+    data_dir = os.path.join(dump_dir, session_name(datetime.datetime.now(), len(manager.sizes) + 1))
     os.makedirs(data_dir)
-    return data_dir
+    manager.start_session(data_dir)
+    return data_dir, manager
+
 
+def dump_data(data_dir: str, frame: np.ndarray, msg: dict, manager: RecordingManager | None = None,
+              number: int = 0):
+    """
+    Write the frame and its telemetry of the ``number``-th dump call. With a
+    ``manager`` frames and then telemetry are skipped as the budget runs out.
+    """
+    write_frame = True
+    if manager is not None:
+        manager.check()
+        if not manager.telemetry_allowed():
+            return
+        write_frame = manager.frame_allowed(number)
 
-def dump_data(data_dir: str, frame: np.ndarray, msg: dict):
     name = str(int(time.monotonic() * 1000))
     msg_path = os.path.join(data_dir, f"{name}.json")
     img_path = os.path.join(data_dir, f"{name}.jpg")
-    cv2.imwrite(img_path, frame)
+    paths = [msg_path]
+    if write_frame:
+        cv2.imwrite(img_path, frame)
+        paths.append(img_path)
     with open(msg_path, "w") as f:
         json.dump(serialize(msg), f)
+    if manager is not None:
+        manager.add(sum(os.path.getsize(path) for path in paths))
+
+
+def iter_dump(data_dir: str):
+    """Yield ``(timestamp, frame, msg)`` of a dump directory in recording order."""
+    if is_recording(data_dir):
+        yield from iter_recording(data_dir)
+        return
+    names = sorted(
+        int(os.path.splitext(filename)[0])
+        for filename in os.listdir(data_dir)
+        if filename.endswith(".json") and os.path.splitext(filename)[0].isdigit()
+    )
+    for name in names:
+        frame = cv2.imread(os.path.join(data_dir, f"{name}.jpg"))
+        if frame is None:
+            continue
+        with open(os.path.join(data_dir, f"{name}.json")) as f:
+            msg = json.load(f)
+        yield name / 1000, frame, msg
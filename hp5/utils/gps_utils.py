@@ -7,6 +7,13 @@ from pymavlink import mavutil
 from pyubx2 import NMEA_PROTOCOL, SET, UBXMessage, UBXReader
 from serial import Serial
 
+from utils.nmea_parser import GPSFix, NMEAParser
+from utils.ublox_config import configure_ublox
+from utils.ubx_parser import NAV_PVT, UBXParser
+
+# Largest bulk read from the serial port, bytes
+READ_CHUNK = 4096
+
 
 def datetime2text(gps_data: dict) -> dict:
     if "time" in gps_data.__dict__.keys():
@@ -133,6 +140,8 @@ def calc_vels(msg: dict, flags: int) -> tuple[int, float, float, float]:
 
 
 def gps2pixhawk(msg: dict) -> list | None:
+    fix = msg.get("GPS_FIX")
+    fix_type, speed_acc, horiz_acc, vert_acc = 3, 0.6, 5.0, 3.0
     if "VIO" in msg:
         viom = msg["VIO"]
         timestamp = int(viom["timestamp"] * 10**6)
@@ -152,6 +161,20 @@ def gps2pixhawk(msg: dict) -> list | None:
         vele = viom["vele"]
         veld = viom["veld"]
         sat_num = 10
+    elif isinstance(fix, GPSFix):
+        timestamp = int(time() * 10**6)
+        flags = 0 if fix.vel_vert_valid else mavutil.mavlink.GPS_INPUT_IGNORE_FLAG_VEL_VERT
+        if not fix.vel_valid:
+            flags = flags | mavutil.mavlink.GPS_INPUT_IGNORE_FLAG_VEL_HORIZ
+        gps_week, gps_ms = fix.gps_week, fix.gps_ms
+        lat = int(fix.lat * 10**7)
+        lon = int(fix.lon * 10**7)
+        alt = 0
+        hdop = fix.hdop
+        vdop = fix.vdop
+        veln, vele, veld = fix.veln, fix.vele, fix.veld
+        sat_num = fix.num_sv
+        fix_type, speed_acc, horiz_acc, vert_acc = fix.fix_type, fix.s_acc, fix.h_acc, fix.v_acc
     else:
         msg = check_msg(msg)
         if msg is None:
@@ -181,7 +204,7 @@ def gps2pixhawk(msg: dict) -> list | None:
         # mavutil.mavlink.GPS_INPUT_IGNORE_FLAG_VERTICAL_ACCURACY,
         gps_ms,  # GPS time (milliseconds from start of GPS week)
         gps_week,  # GPS week number
-        3,  # 0-1: no fix, 2: 2D fix, 3: 3D fix. 4: 3D with DGPS. 5: 3D with RTK
+        fix_type,  # 0-1: no fix, 2: 2D fix, 3: 3D fix. 4: 3D with DGPS. 5: RTK float. 6: RTK fixed
         lat,  # Latitude (WGS84), in degrees * 1E7
         lon,  # Longitude (WGS84), in degrees * 1E7
         alt,  # data['GNGGA']['alt'], # Altitude (AMSL, not WGS84), in m (positive for up)
@@ -190,14 +213,14 @@ def gps2pixhawk(msg: dict) -> list | None:
         veln,  # GPS velocity in m/s in NORTH direction in earth-fixed NED frame
         vele,  # GPS velocity in m/s in EAST direction in earth-fixed NED frame
         veld,  # GPS velocity in m/s in DOWN direction in earth-fixed NED frame
-        0.6,  # GPS speed accuracy in m/s
-        5.0,  # GPS horizontal accuracy in m
-        3.0,  # GPS vertical accuracy in m
+        speed_acc,  # GPS speed accuracy in m/s
+        horiz_acc,  # GPS horizontal accuracy in m
+        vert_acc,  # GPS vertical accuracy in m
         sat_num,  # Number of satellites visible,
     ]
 
 
-def config_ublox(port: str, rate_ms: int, baudrate: int) -> None:
+def config_ublox(port: str, rate_ms: int, baudrate: int, binary: bool = False) -> None:
     baudrate_arr = (9600, 19200, 38400, 57600, 115200, 230400)
 
     for baud in baudrate_arr:
@@ -236,14 +259,26 @@ def config_ublox(port: str, rate_ms: int, baudrate: int) -> None:
                 baudRate=baudrate,
                 inUBX=1,
                 inNMEA=1,
-                outUBX=0,
-                outNMEA=1,
+                outUBX=int(binary),
+                outNMEA=int(not binary),
                 extendedTxTimeout=0,
             )
             stream.write(uart1set.serialize())  # updating...
 
     # Сохраняем конфигурацию в энергонезависимой памяти
     with Serial(port, baudrate, timeout=1) as stream:
+        if binary:
+            # UBX-NAV-PVT once per navigation epoch on UART1
+            msg_pvt = UBXMessage(
+                "CFG",
+                "CFG-MSG",
+                SET,
+                msgClass=NAV_PVT[0],
+                msgID=NAV_PVT[1],
+                rateUART1=1,
+            )
+            stream.write(msg_pvt.serialize())
+
         # send command CFG-CFG
         msg_cfg = UBXMessage(
             "CFG",
@@ -264,16 +299,45 @@ class GPSData:
         rate_ms: int = 100,
         baudrate: int = 115200,
         timeout: float = 3,
+        fast: bool = True,
+        binary: bool = False,
     ) -> None:
-        config_ublox(device, rate_ms=rate_ms, baudrate=baudrate)
+        if not configure_ublox(device, rate_ms, baudrate, binary):
+            # e.g. UBX input disabled, fall back to the blind configuration
+            config_ublox(device, rate_ms=rate_ms, baudrate=baudrate, binary=binary)
 
         self._stream = Serial(device, baudrate=baudrate, timeout=timeout)
         self._ublox_m8n = UBXReader(self._stream, protfilter=NMEA_PROTOCOL)
+        # NAV-PVT is always decoded by the bulk reader
+        self._parser = UBXParser() if binary else NMEAParser()
+        self.fast = fast or binary
 
         self.data = {}
 
-    def run(self, stop_event, outque):
-        print("start polling GPS sensor")
+    def read_fixes(self) -> list[GPSFix]:
+        """Read what the port has buffered in one call and parse it, blocks for at most the timeout."""
+        chunk = self._stream.read(min(max(self._stream.in_waiting, 1), READ_CHUNK))
+        return self._parser.feed(chunk)
+
+    def _run_fast(self, stop_event, outque):
+        while not stop_event.value:
+            try:
+                fixes = self.read_fixes()
+                if not fixes:
+                    continue
+                # a late reader only needs the newest fix
+                if outque.full():
+                    _ = outque.get(timeout=1)
+                outque.put({"GPS_FIX": fixes[-1]})
+
+            except queue.Empty:
+                continue
+            except KeyboardInterrupt:
+                break
+            except Exception as e:
+                print(f"GPS sensor error {e}")
+
+    def _run_nmea(self, stop_event, outque):
         while not stop_event.value:
             try:
                 # read GPS
@@ -297,6 +361,12 @@ class GPSData:
             except KeyboardInterrupt:
                 break
 
+    def run(self, stop_event, outque):
+        print("start polling GPS sensor")
+        if self.fast:
+            self._run_fast(stop_event, outque)
+        else:
+            self._run_nmea(stop_event, outque)
         self._stream.close()
         print("stop polling GPS sensor")
 
@@ -0,0 +1,174 @@
+"""
+Byte-level NMEA parser for the ublox GPS stream.
+
+Serial data is fed in bulk buffers, complete sentences are split out of the
+buffer and only the RMC, VTG, GGA and GSA fields used by ``gps2pixhawk`` are
+converted, straight from bytes to numbers. One ``GPSFix`` is emitted per
+navigation epoch once all four sentences of the epoch have arrived; time is
+kept as GPS week and milliseconds of week, no strings or datetime objects
+on the way.
+"""
+
+import math
+from functools import reduce
+from operator import xor
+from typing import NamedTuple
+
+# Sentences longer than this are line noise, NMEA allows 82 bytes
+MAX_SENTENCE = 128
+# Days from 0000-03-01 (proleptic Gregorian) to the GPS epoch 1980-01-06
+GPS_EPOCH_DAYS = 723125
+DAY_MS = 86400000
+REQUIRED = frozenset((b"RMC", b"VTG", b"GGA", b"GSA"))
+
+
+class GPSFix(NamedTuple):
+    gps_week: int
+    gps_ms: int
+    lat: float  # degrees
+    lon: float  # degrees
+    alt: float  # m above mean sea level
+    hdop: float
+    vdop: float
+    veln: float  # m/s
+    vele: float  # m/s
+    vel_valid: bool
+    num_sv: int
+    fix_quality: int  # GGA quality, 0 for no fix
+    # NMEA does not carry these, the defaults are what gps2pixhawk reports
+    veld: float = 0.0
+    vel_vert_valid: bool = False
+    h_acc: float = 5.0  # m
+    v_acc: float = 3.0  # m
+    s_acc: float = 0.6  # m/s
+    fix_type: int = 3  # GPS_INPUT fix type
+
+
+def days_from_civil(year: int, month: int, day: int) -> int:
+    """Days since 0000-03-01, integer arithmetic only."""
+    if month <= 2:
+        year -= 1
+    era, yoe = divmod(year, 400)
+    doy = (153 * (month + (-3 if month > 2 else 9)) + 2) // 5 + day - 1
+    doe = yoe * 365 + yoe // 4 - yoe // 100 + doy
+    return era * 146097 + doe
+
+
+def gps_week_time(days: int, ms_of_day: int) -> tuple[int, int]:
+    """
+    GPS week and ms of week for ``days`` since the GPS epoch, with the
+    Monday based weeks of ``calc_GPS_week_time`` so both sources agree.
+    """
+    # the epoch is a Sunday, its Monday is 6 days earlier
+    week, weekday = divmod(days + 6, 7)
+    return week, weekday * DAY_MS + ms_of_day
+
+
+def parse_time(field: bytes) -> int:
+    """hhmmss.ss to ms of day."""
+    return int(field[0:2]) * 3600000 + int(field[2:4]) * 60000 + round(float(field[4:]) * 1000)
+
+
+def parse_date(field: bytes) -> int:
+    """ddmmyy to days since the GPS epoch."""
+    return days_from_civil(2000 + int(field[4:6]), int(field[2:4]), int(field[0:2])) - GPS_EPOCH_DAYS
+
+
+def parse_coord(value: bytes, hemisphere: bytes) -> float:
+    """(d)ddmm.mmmm to signed degrees."""
+    value = float(value)
+    degrees = value // 100
+    coord = degrees + (value - degrees * 100) / 60
+    return -coord if hemisphere in (b"S", b"W") else coord
+
+
+def checksum_ok(sentence: bytes) -> bool:
+    star = sentence.rfind(b"*")
+    if star < 0:
+        return False
+    try:
+        return reduce(xor, sentence[1:star], 0) == int(sentence[star + 1:star + 3], 16)
+    except ValueError:
+        return False
+
+
+class NMEAParser:
+    """Incremental parser, ``feed`` returns the fixes completed by the new bytes."""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self._buffer = b""
+        self._epoch = {}
+        self._emitted = False
+
+    def feed(self, data: bytes) -> list[GPSFix]:
+        lines = (self._buffer + data).split(b"\n")
+        # the last piece is an incomplete sentence
+        self._buffer = lines.pop()
+        if len(self._buffer) > MAX_SENTENCE:
+            self._buffer = self._buffer[-MAX_SENTENCE:]
+
+        fixes = []
+        for line in lines:
+            start = line.rfind(b"$")
+            if start < 0:
+                continue
+            sentence = line[start:].rstrip(b"\r")
+            if not checksum_ok(sentence):
+                continue
+            fix = self._parse(sentence)
+            if fix is not None:
+                fixes.append(fix)
+        return fixes
+
+    def _parse(self, sentence: bytes) -> GPSFix | None:
+        kind = sentence[3:6]
+        if kind not in REQUIRED:
+            return None
+        fields = sentence[:sentence.rfind(b"*")].split(b",")
+        if kind == b"RMC":
+            # RMC opens a new epoch
+            self._epoch = {kind: fields}
+            self._emitted = False
+        elif self._epoch and kind not in self._epoch:
+            # multi-constellation receivers send a GSA per system, the first one is enough
+            self._epoch[kind] = fields
+
+        if self._emitted or len(self._epoch) < len(REQUIRED):
+            return None
+        self._emitted = True
+        try:
+            return self._fix()
+        except (ValueError, IndexError):
+            return None
+
+    def _fix(self) -> GPSFix | None:
+        rmc, vtg, gga, gsa = (self._epoch[kind] for kind in (b"RMC", b"VTG", b"GGA", b"GSA"))
+        if rmc[2] != b"A" or not rmc[9]:
+            return None
+        gps_week, gps_ms = gps_week_time(parse_date(rmc[9]), parse_time(rmc[1]))
+
+        cogt, sogk = vtg[1], vtg[7]
+        vel_valid = bool(cogt and sogk)
+        veln = vele = 0.0
+        if vel_valid:
+            cog = math.radians(float(cogt))
+            sog = float(sogk) / 3.6
+            veln, vele = sog * math.cos(cog), sog * math.sin(cog)
+
+        return GPSFix(
+            gps_week,
+            gps_ms,
+            parse_coord(rmc[3], rmc[4]),
+            parse_coord(rmc[5], rmc[6]),
+            float(gga[9]) if gga[9] else 0.0,
+            float(gsa[16]) if gsa[16] else 99.99,
+            float(gsa[17]) if gsa[17] else 99.99,
+            veln,
+            vele,
+            vel_valid,
+            int(gga[7]) if gga[7] else 0,
+            int(gga[6]) if gga[6] else 0,
+        )
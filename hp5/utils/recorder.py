@@ -0,0 +1,281 @@
+"""
+Asynchronous flight recorder.
+
+A writer process stores a session directory with
+    frames.mjpeg      - JPEG frames appended back to back
+    frames.idx        - one INDEX_DTYPE record per frame (offset and size in frames.mjpeg)
+    telemetry_*.npz   - telemetry rows in columnar chunks, one float64 column per
+                        numeric field and a JSON text column per string field
+Frames reach the writer through a shared-memory queue that drops the oldest
+frame when the writer falls behind, so recording never blocks the main loop.
+Files are written in batches and fsync'd periodically. With a
+RecordingManager the writer follows the disk budget: it may keep only every
+n-th frame or telemetry alone (rows with ``_frame`` -1).
+"""
+
+import glob
+import json
+import os
+import queue
+import time
+from multiprocessing import Process, Value
+
+import cv2
+import numpy as np
+
+from modules.frame_ring import ShmQueue
+from modules.logger import global_logger as logger
+
+VIDEO_FILE = "frames.mjpeg"
+INDEX_FILE = "frames.idx"
+CHUNK_PATTERN = "telemetry_{:05d}.npz"
+INDEX_DTYPE = np.dtype([("frame", "<i8"), ("timestamp", "<f8"), ("offset", "<i8"), ("size", "<i8")])
+
+JPEG_QUALITY = 90
+# Frames buffered between the main loop and the writer
+RECORDER_QUEUE_SIZE = 8
+# Telemetry rows per NPZ chunk, ~5 s at 30 fps
+CHUNK_ROWS = 150
+# Seconds between fsyncs of the frame stream and index
+FSYNC_INTERVAL = 2.0
+WRITE_BUFFER = 1 << 20
+POLL_TIMEOUT = 0.1
+
+
+def flatten(data, prefix=""):
+    """
+    Numeric and string leaves of a nested msg dict as ``{"ATTITUDE.roll": value}``,
+    mode and status strings are kept for replay (``check_mode``, ``check_msg``).
+    """
+    row = {}
+    for key, value in data.items():
+        name = f"{prefix}{key}"
+        if hasattr(value, "_asdict"):
+            value = value._asdict()
+        if isinstance(value, dict):
+            row.update(flatten(value, f"{name}."))
+        elif isinstance(value, (list, tuple)):
+            row.update(flatten(dict(enumerate(value)), f"{name}."))
+        elif isinstance(value, (bool, int, float, np.number)):
+            row[name] = float(value)
+        elif isinstance(value, str) and key != "mavpackettype":
+            # the packet type repeats the parent key
+            row[name] = value
+    return row
+
+
+def _column(values):
+    """NPZ column of a field: float64 with NaN for missing rows, or JSON text with "" if any value is a string."""
+    if any(isinstance(value, str) for value in values):
+        return np.array(["" if value is None else json.dumps(value) for value in values])
+    return np.array([np.nan if value is None else value for value in values])
+
+
+def _read_column(column):
+    """Values of a stored column, None for rows without the field."""
+    if column.dtype.kind == "U":
+        return [json.loads(value) if value else None for value in column.tolist()]
+    return [None if np.isnan(value) else value for value in column.tolist()]
+
+
+def _restore(node):
+    if isinstance(node, float):
+        return int(node) if node.is_integer() else node
+    if not isinstance(node, dict):
+        return node
+    node = {key: _restore(value) for key, value in node.items()}
+    if node and all(key.isdigit() for key in node):
+        return [node[key] for key in sorted(node, key=int)]
+    return node
+
+
+def unflatten(row):
+    """Inverse of ``flatten``, missing (None or NaN) fields are dropped."""
+    msg = {}
+    for name, value in row.items():
+        if value is None or (not isinstance(value, str) and np.isnan(value)):
+            continue
+        *parents, leaf = name.split(".")
+        node = msg
+        for parent in parents:
+            node = node.setdefault(parent, {})
+        node[leaf] = value if isinstance(value, str) else float(value)
+    return {key: _restore(value) for key, value in msg.items()}
+
+
+class RecordingWriter:
+    """Appends frames and telemetry to a session directory, single process only."""
+
+    def __init__(self, data_dir, quality=JPEG_QUALITY, chunk_rows=CHUNK_ROWS, fsync_interval=FSYNC_INTERVAL,
+                 manager=None):
+        os.makedirs(data_dir, exist_ok=True)
+        self.data_dir = data_dir
+        self.manager = manager
+        self.quality = quality
+        self.chunk_rows = chunk_rows
+        self.fsync_interval = fsync_interval
+
+        self._video = open(os.path.join(data_dir, VIDEO_FILE), "ab", buffering=WRITE_BUFFER)
+        self._index = open(os.path.join(data_dir, INDEX_FILE), "ab", buffering=WRITE_BUFFER)
+        # continue an existing session after a restart
+        self._frame = self._index.tell() // INDEX_DTYPE.itemsize
+        self._chunk = len(glob.glob(os.path.join(data_dir, CHUNK_PATTERN.replace("{:05d}", "*"))))
+        self._rows = []
+        self._last_sync = time.monotonic()
+        self._received = 0
+        self.bytes_written = 0
+
+    def _account(self, nbytes):
+        self.bytes_written += nbytes
+        if self.manager is not None:
+            self.manager.add(nbytes)
+
+    def write(self, frame, msg, timestamp):
+        write_frame = True
+        if self.manager is not None:
+            self.manager.check()
+            if not self.manager.telemetry_allowed():
+                return
+            write_frame = self.manager.frame_allowed(self._received)
+        self._received += 1
+
+        row = flatten(msg)
+        row["_timestamp"] = timestamp
+        # telemetry-only rows are not linked to a frame
+        row["_frame"] = -1
+        if write_frame:
+            ok, jpg = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+            if ok:
+                offset = self._video.tell()
+                self._video.write(jpg.data)
+                self._index.write(
+                    np.array([(self._frame, timestamp, offset, len(jpg))], dtype=INDEX_DTYPE).tobytes()
+                )
+                self._account(len(jpg) + INDEX_DTYPE.itemsize)
+                row["_frame"] = self._frame
+                self._frame += 1
+        self._rows.append(row)
+
+        if len(self._rows) >= self.chunk_rows:
+            self._flush_rows()
+        if time.monotonic() - self._last_sync > self.fsync_interval:
+            self.sync()
+
+    def _flush_rows(self):
+        if not self._rows:
+            return
+        keys = sorted(set().union(*self._rows))
+        columns = {key: _column([row.get(key) for row in self._rows]) for key in keys}
+        path = os.path.join(self.data_dir, CHUNK_PATTERN.format(self._chunk))
+        with open(path, "wb") as f:
+            np.savez(f, **columns)
+            f.flush()
+            os.fsync(f.fileno())
+        self._account(os.path.getsize(path))
+        self._chunk += 1
+        self._rows = []
+
+    def sync(self):
+        for f in (self._video, self._index):
+            f.flush()
+            os.fsync(f.fileno())
+        self._last_sync = time.monotonic()
+
+    def close(self):
+        self._flush_rows()
+        self.sync()
+        self._video.close()
+        self._index.close()
+        if self.manager is not None:
+            self.manager.save()
+
+
+def _writer(stop, frames, data_dir, quality, chunk_rows, fsync_interval, manager):
+    writer = RecordingWriter(data_dir, quality, chunk_rows, fsync_interval, manager)
+    while True:
+        try:
+            _, frame, meta = frames.get(timeout=POLL_TIMEOUT)
+        except queue.Empty:
+            # drain what is queued before stopping
+            if stop.value:
+                break
+            continue
+        except KeyboardInterrupt:
+            break
+        if frame is None:
+            continue
+        try:
+            timestamp, msg = meta
+            writer.write(frame, msg, timestamp)
+        except Exception as e:
+            logger.error(f"Flight recorder error {e}")
+    writer.close()
+
+
+class FlightRecorder:
+    """
+    Main loop side of the recorder: ``record`` copies the frame into shared
+    memory and returns, encoding and disk I/O happen in the writer process.
+    """
+
+    def __init__(self, data_dir, frame_shape, quality=JPEG_QUALITY, maxsize=RECORDER_QUEUE_SIZE,
+                 chunk_rows=CHUNK_ROWS, fsync_interval=FSYNC_INTERVAL, manager=None):
+        self.data_dir = data_dir
+        self.frames = ShmQueue(frame_shape, np.uint8, maxsize)
+        self.stop = Value("i", 0)
+        self.process = Process(
+            target=_writer,
+            args=(self.stop, self.frames, data_dir, quality, chunk_rows, fsync_interval, manager),
+            daemon=True,
+        )
+        self.process.start()
+
+    def record(self, frame, msg, timestamp=None):
+        msg = dict(msg)
+        if isinstance(msg.get("VIO"), dict):
+            # the crop is an image, it is not telemetry
+            msg["VIO"] = {key: value for key, value in msg["VIO"].items() if key != "crop"}
+        self.frames.put(frame, (time.time() if timestamp is None else timestamp, msg))
+
+    def close(self, timeout=5):
+        self.stop.value = 1
+        self.process.join(timeout)
+        if self.process.is_alive():
+            self.process.terminate()
+        self.frames.close()
+        self.frames.unlink()
+
+
+def is_recording(data_dir: str) -> bool:
+    return os.path.exists(os.path.join(data_dir, INDEX_FILE))
+
+
+def iter_recording(data_dir):
+    """Yield ``(timestamp, frame, msg)`` of a recorder session in recording order."""
+    with open(os.path.join(data_dir, INDEX_FILE), "rb") as f:
+        data = f.read()
+    # a crash may leave a partial record at the end
+    index = np.frombuffer(data[:len(data) - len(data) % INDEX_DTYPE.itemsize], dtype=INDEX_DTYPE)
+    if len(index) == 0:
+        return
+    rows = {}
+    for path in sorted(glob.glob(os.path.join(data_dir, CHUNK_PATTERN.replace("{:05d}", "*")))):
+        with np.load(path) as chunk:
+            columns = {key: _read_column(chunk[key]) for key in chunk.files}
+        for ii, frame_no in enumerate(columns.pop("_frame")):
+            if frame_no < 0:
+                # telemetry recorded without its frame
+                continue
+            rows[int(frame_no)] = {key: column[ii] for key, column in columns.items() if key != "_timestamp"}
+
+    video = np.memmap(os.path.join(data_dir, VIDEO_FILE), dtype=np.uint8, mode="r")
+    for entry in index:
+        end = entry["offset"] + entry["size"]
+        if end > len(video):
+            # frame cut off by a crash
+            break
+        frame = cv2.imdecode(np.asarray(video[entry["offset"]:end]), cv2.IMREAD_COLOR)
+        if frame is None:
+            continue
+        msg = unflatten(rows.get(int(entry["frame"]), {}))
+        yield float(entry["timestamp"]), frame, msg
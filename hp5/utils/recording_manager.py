@@ -0,0 +1,166 @@
+"""
+Disk budget for dump sessions.
+
+Session sizes are kept in an index file in the dump folder and updated
+incrementally while recording, so the folder is walked only for sessions
+the index does not know yet. Free space is checked continuously; when the
+budget runs out the oldest finished sessions are deleted and, if that is
+not enough, recording degrades step by step instead of failing mid-flight.
+"""
+
+import json
+import os
+import re
+import shutil
+import time
+
+from modules.logger import global_logger as logger
+
+INDEX_NAME = ".recording_index.json"
+# Seconds between free space checks
+CHECK_INTERVAL = 5.0
+# Every n-th frame is kept in the reduced level
+REDUCED_STRIDE = 3
+
+# Recording levels, from full to nothing
+FULL = 0
+REDUCED = 1
+TELEMETRY_ONLY = 2
+OFF = 3
+LEVEL_NAMES = ("full", "reduced frame rate", "telemetry only", "off")
+
+# Session folders as named by session_name, e.g. 2024_9_18_14_5_3_num_7;
+# anything else in the dump folder is never accounted or deleted
+SESSION_RE = re.compile(r"\d{4}(_\d{1,2}){5}_num_\d+")
+
+
+def session_name(ct, number: int) -> str:
+    return f"{ct.year}_{ct.month}_{ct.day}_{ct.hour}_{ct.minute}_{ct.second}_num_{number}"
+
+
+def folder_size(path: str) -> int:
+    total = 0
+    with os.scandir(path) as entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                total += folder_size(entry.path)
+            elif entry.is_file(follow_symlinks=False):
+                total += entry.stat(follow_symlinks=False).st_size
+    return total
+
+
+class RecordingManager:
+    """
+    ``min_free_space`` is the free space to keep on the drive and ``budget``
+    (optional) caps the total size of the dump folder, both in bytes. The
+    current ``session`` is never evicted.
+    """
+
+    def __init__(self, dump_dir, min_free_space, budget=None, session=None, check_interval=CHECK_INTERVAL):
+        self.dump_dir = dump_dir
+        self.min_free_space = min_free_space
+        self.budget = budget
+        self.session = os.path.basename(session) if session else None
+        self.check_interval = check_interval
+        self.level = FULL
+        self._last_check = 0.0
+        self._index_path = os.path.join(dump_dir, INDEX_NAME)
+        self.sizes = self._load_index()
+
+    def _load_index(self):
+        try:
+            with open(self._index_path) as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            index = {}
+
+        sizes = {}
+        for entry in os.scandir(self.dump_dir):
+            if not entry.is_dir(follow_symlinks=False):
+                continue
+            if entry.name != self.session and not SESSION_RE.fullmatch(entry.name):
+                continue
+            known = index.get(entry.name)
+            if known is None:
+                # only sessions recorded without the manager are walked
+                known = dict(size=folder_size(entry.path), created=entry.stat().st_mtime)
+            sizes[entry.name] = known
+        return sizes
+
+    def save(self):
+        tmp = f"{self._index_path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.sizes, f)
+        os.replace(tmp, self._index_path)
+
+    def start_session(self, session):
+        self.session = os.path.basename(session)
+        self.sizes.setdefault(self.session, dict(size=0, created=time.time()))
+        self.save()
+
+    def add(self, nbytes: int):
+        """Account bytes written to the current session."""
+        if self.session is not None:
+            self.sizes.setdefault(self.session, dict(size=0, created=time.time()))["size"] += nbytes
+
+    def total_size(self) -> int:
+        return sum(item["size"] for item in self.sizes.values())
+
+    def _short(self) -> tuple[int, int]:
+        """
+        Bytes missing to satisfy the free space and the budget, and the limit
+        (free space or budget) the larger shortfall is measured against.
+        """
+        free = shutil.disk_usage(self.dump_dir).free
+        short, limit = self.min_free_space - free, self.min_free_space
+        if self.budget is not None and self.total_size() - self.budget > short:
+            short, limit = self.total_size() - self.budget, self.budget
+        return short, limit
+
+    def evict(self, needed: int) -> int:
+        """Delete the oldest finished sessions until ``needed`` bytes are freed."""
+        freed = 0
+        oldest = sorted((item["created"], name) for name, item in self.sizes.items() if name != self.session)
+        for _, name in oldest:
+            if freed >= needed:
+                break
+            size = self.sizes.pop(name)["size"]
+            shutil.rmtree(os.path.join(self.dump_dir, name), ignore_errors=True)
+            logger.warning(f"Recording budget: deleted session {name} ({size} bytes)")
+            freed += size
+        return freed
+
+    def check(self, force=False) -> int:
+        """Make room if needed and return the recording level, throttled to check_interval."""
+        now = time.monotonic()
+        if not force and now - self._last_check < self.check_interval:
+            return self.level
+        self._last_check = now
+
+        short, limit = self._short()
+        if short > 0:
+            self.evict(short)
+            short, limit = self._short()
+
+        # without more sessions to delete, degrade by how far over the limit we are
+        if short <= 0:
+            level = FULL
+        elif short <= limit / 2:
+            level = REDUCED
+        elif short <= limit * 3 / 4:
+            level = TELEMETRY_ONLY
+        else:
+            level = OFF
+        if level != self.level:
+            logger.warning(f"Recording level: {LEVEL_NAMES[level]}")
+            self.level = level
+        self.save()
+        return level
+
+    def frame_allowed(self, number: int) -> bool:
+        if self.level == FULL:
+            return True
+        return self.level == REDUCED and number % REDUCED_STRIDE == 0
+
+    def telemetry_allowed(self) -> bool:
+        return self.level < OFF
@@ -0,0 +1,188 @@
+"""
+Offline replay of recorded flights.
+
+Streams a dump directory written by ``dump_data`` as (frame, msg) pairs in
+timestamp order, paced to real time, to an accelerated clock or as fast as
+possible. ``ReplaySource.video``, ``.telemetry`` and ``.gps`` mimic the
+queues ``main_loop`` reads, so the loop runs unchanged on a workstation.
+The command line drives VIO directly and reports throughput:
+
+    python -m utils.replay /home/orangepi/dumps/<flight> --speed 0
+"""
+
+import argparse
+import queue
+import threading
+import time
+
+import numpy as np
+
+from modules.logger import global_logger as logger
+from utils.data_utils import iter_dump
+
+# Decoded records buffered ahead of the consumer
+PREFETCH = 8
+
+
+class ReplayFinished(KeyboardInterrupt):
+    """Raised by the video channel at the end of the recording, main_loop stops on it like on Ctrl+C."""
+
+
+class _VideoChannel:
+    def __init__(self, source):
+        self._source = source
+
+    def get(self, block=True, timeout=None):
+        timestamp, frame, _ = self._source.advance()
+        return frame, timestamp
+
+    def empty(self):
+        return False
+
+    def full(self):
+        return False
+
+
+class _TelemetryChannel:
+    def __init__(self, source):
+        self._source = source
+
+    def get(self, block=True, timeout=None):
+        # the msg recorded with the current frame, no IMU time in dumps
+        return self._source.msg, -1
+
+    def empty(self):
+        return self._source.msg is None
+
+    def full(self):
+        return False
+
+
+class _IdleChannel:
+    """Channel that never has data, e.g. the ublox GPS queue."""
+
+    def get(self, block=True, timeout=None):
+        raise queue.Empty
+
+    def empty(self):
+        return True
+
+    def full(self):
+        return False
+
+
+class ReplaySource:
+    """
+    Replays a dump directory. ``speed`` is the time factor: 1 for real time,
+    10 for ten times faster, 0 (or None) for no pacing at all. Records are
+    decoded ahead by a background thread so JPEG decoding overlaps with the
+    consumer.
+    """
+
+    def __init__(self, dump_dir, speed=1.0, prefetch=PREFETCH, strip=("VIO",)):
+        self.dump_dir = dump_dir
+        self.speed = speed
+        self.strip = strip
+        self.msg = None
+        self.frames = 0
+        self._records = queue.Queue(prefetch)
+        self._stop = threading.Event()
+        self._clock = None
+        self._reader = threading.Thread(target=self._read, daemon=True)
+        self._reader.start()
+
+        self.video = _VideoChannel(self)
+        self.telemetry = _TelemetryChannel(self)
+        self.gps = _IdleChannel()
+
+    def _read(self):
+        try:
+            for record in iter_dump(self.dump_dir):
+                while not self._stop.is_set():
+                    try:
+                        self._records.put(record, timeout=0.1)
+                        break
+                    except queue.Full:
+                        continue
+                if self._stop.is_set():
+                    return
+        except Exception as e:
+            logger.error(f"Replay reader error {e}")
+        self._records.put(None)
+
+    def _pace(self, timestamp):
+        if not self.speed:
+            return
+        now = time.monotonic()
+        if self._clock is None:
+            self._clock = (now, timestamp)
+            return
+        wall0, ts0 = self._clock
+        delay = wall0 + (timestamp - ts0) / self.speed - now
+        if delay > 0:
+            time.sleep(delay)
+
+    def advance(self):
+        """Move to the next record and return ``(timestamp, frame, msg)``."""
+        record = self._records.get()
+        if record is None:
+            # keep the sentinel for further calls
+            self._records.put(None)
+            raise ReplayFinished
+        timestamp, frame, msg = record
+        for key in self.strip:
+            # results of the recorded run are recomputed by the replay
+            msg.pop(key, None)
+        self._pace(timestamp)
+        self.msg = msg
+        self.frames += 1
+        return timestamp, frame, msg
+
+    def __iter__(self):
+        while True:
+            try:
+                yield self.advance()
+            except ReplayFinished:
+                return
+
+    def close(self):
+        self._stop.set()
+
+
+def main():
+    from modules.vio.vio_ort import VIO, XFEAT_BACKEND, XFEAT_INFERENCE
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("dump_dir")
+    parser.add_argument("--speed", type=float, default=0, help="time factor, 0 for as fast as possible")
+    parser.add_argument("--backend", default=XFEAT_BACKEND, help="XFeat post-processing, torch or numpy")
+    parser.add_argument("--inference", default=XFEAT_INFERENCE, help="XFeat runtime, onnx, rknn or mock")
+    parser.add_argument("--weights", default=None)
+    args = parser.parse_args()
+
+    source = ReplaySource(args.dump_dir, speed=args.speed)
+    vio = None
+    latency = []
+    start = time.monotonic()
+    for _, frame, msg in source:
+        if vio is None:
+            pos = msg.get("GLOBAL_POSITION_INT")
+            lat0, lon0 = (pos["lat"] / 1e7, pos["lon"] / 1e7) if pos else (0, 0)
+            vio = VIO(lat0, lon0, backend=args.backend, inference=args.inference, weights=args.weights)
+        tic = time.perf_counter()
+        result = vio.add_trace_pt(frame, msg)
+        latency.append(time.perf_counter() - tic)
+    elapsed = time.monotonic() - start
+    source.close()
+
+    if not latency:
+        print("No frames")
+        return
+    latency = np.asarray(latency) * 1000
+    print(f"Frames: {len(latency)}, {len(latency) / elapsed:.1f} fps")
+    print(f"add_trace_pt: mean {latency.mean():.1f} ms, p95 {np.percentile(latency, 95):.1f} ms")
+    print(f"Final offset: {result['to_north']:.2f} m north, {result['to_east']:.2f} m east")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,223 @@
+"""
+ublox configuration handshake.
+
+The receiver is found by polling UBX-MON-VER at the cached baud rate first
+and only then at the other rates. Its port, rate and message settings are
+polled back and commands are sent only for what differs, each one checked
+with ACK-ACK; the configuration is saved to flash only when something was
+changed. The known good settings are cached on disk once they are saved,
+so a receiver that already matches comes up after a single CFG-PRT round
+trip that checks the baud rate and output protocol.
+"""
+
+import json
+import os
+import struct
+import time
+
+from pyubx2 import POLL, SET, UBXMessage
+from serial import Serial
+
+from modules.logger import global_logger as logger
+from utils.ubx_parser import NAV_PVT, split_frames
+
+UBLOX_CACHE = os.path.expanduser("~/.cache/hp5/ublox.json")
+BAUDRATES = (9600, 19200, 38400, 57600, 115200, 230400)
+# Seconds to wait for a reply, MON-VER is ~160 bytes (0.17 s at 9600 baud)
+PROBE_TIMEOUT = 0.3
+ACK_TIMEOUT = 0.5
+
+ACK = 0x05
+ACK_ACK = 0x01
+MON_VER = (0x0A, 0x04)
+CFG_PRT = (0x06, 0x00)
+CFG_MSG = (0x06, 0x01)
+CFG_RATE = (0x06, 0x08)
+UART1 = 1
+# CFG-PRT protocol mask bits
+PROTO_UBX = 0x01
+PROTO_NMEA = 0x02
+
+
+def read_reply(stream, match, timeout) -> tuple[int, int, bytes] | None:
+    """First UBX frame ``(class, id, payload)`` for which ``match(class, id, payload)`` holds, or None."""
+    buffer = bytearray()
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        data = stream.read(max(stream.in_waiting, 1))
+        if not data:
+            continue
+        buffer += data
+        frames, consumed = split_frames(buffer)
+        for msg_class, msg_id, offset, length in frames:
+            payload = bytes(buffer[offset:offset + length])
+            if match(msg_class, msg_id, payload):
+                return msg_class, msg_id, payload
+        del buffer[:consumed]
+    return None
+
+
+def poll(stream, msg: UBXMessage, ident: tuple[int, int], timeout=PROBE_TIMEOUT) -> bytes | None:
+    stream.reset_input_buffer()
+    stream.write(msg.serialize())
+    reply = read_reply(stream, lambda msg_class, msg_id, payload: (msg_class, msg_id) == ident, timeout)
+    return None if reply is None else reply[2]
+
+
+def send_acked(stream, msg: UBXMessage, timeout=ACK_TIMEOUT) -> bool:
+    """Send a CFG message and wait for its ACK-ACK, False on ACK-NAK or timeout."""
+    raw = msg.serialize()
+    # ACK payload is the class and id of the acknowledged message
+    ident = raw[2:4]
+    stream.reset_input_buffer()
+    stream.write(raw)
+    reply = read_reply(stream, lambda msg_class, msg_id, payload: msg_class == ACK and payload == ident, timeout)
+    return reply is not None and reply[1] == ACK_ACK
+
+
+def probe(port: str, baud: int) -> bool:
+    """True if a receiver answers MON-VER at this baud rate."""
+    try:
+        with Serial(port, baud, timeout=PROBE_TIMEOUT) as stream:
+            return poll(stream, UBXMessage("MON", "MON-VER", POLL), MON_VER) is not None
+    except OSError:
+        return False
+
+
+def detect_baudrate(port: str, preferred=()) -> int | None:
+    for baud in dict.fromkeys((*preferred, *BAUDRATES)):
+        if baud and probe(port, baud):
+            return baud
+    return None
+
+
+def load_cache(path=UBLOX_CACHE) -> dict:
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_cache(config: dict, path=UBLOX_CACHE):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(config, f)
+    os.replace(tmp, path)
+
+
+def poll_port(stream) -> tuple[int, int] | None:
+    """UART1 ``(baudRate, outProtoMask)`` or None if the receiver did not answer."""
+    prt = poll(stream, UBXMessage("CFG", "CFG-PRT", POLL, portID=UART1), CFG_PRT)
+    if prt is None or len(prt) < 20:
+        return None
+    return struct.unpack_from("<IxxH", prt, 8)
+
+
+def out_mask(binary: bool) -> int:
+    return PROTO_UBX if binary else PROTO_NMEA
+
+
+def port_matches(port: str, baudrate: int, binary: bool) -> bool:
+    """True if the receiver answers at ``baudrate`` with the wanted output protocol."""
+    try:
+        with Serial(port, baudrate, timeout=PROBE_TIMEOUT) as stream:
+            return poll_port(stream) == (baudrate, out_mask(binary))
+    except OSError:
+        return False
+
+
+def port_message(baudrate: int, binary: bool) -> UBXMessage:
+    return UBXMessage(
+        "CFG",
+        "CFG-PRT",
+        SET,
+        portID=UART1,
+        enable=0,
+        pol=0,
+        pin=0,
+        thres=0,
+        charLen=3,
+        parity=4,
+        nStopBits=0,
+        baudRate=baudrate,
+        inUBX=1,
+        inNMEA=1,
+        outUBX=int(binary),
+        outNMEA=int(not binary),
+        extendedTxTimeout=0,
+    )
+
+
+def configure(stream, rate_ms: int, baudrate: int, binary: bool) -> tuple[bool, bool]:
+    """
+    Bring rate, NAV-PVT output and UART1 in line at the current baud rate.
+    Returns ``(ok, changed)``; the port settings go last since the receiver
+    switches to the new baud rate right after acknowledging them.
+    """
+    changed = False
+
+    rate = poll(stream, UBXMessage("CFG", "CFG-RATE", POLL), CFG_RATE)
+    if rate is None or len(rate) < 6 or struct.unpack_from("<HHH", rate) != (rate_ms, 1, 1):
+        msg_rate = UBXMessage("CFG", "CFG-RATE", SET, measRate=rate_ms, navRate=1, timeRef=1)
+        if not send_acked(stream, msg_rate):
+            return False, changed
+        changed = True
+
+    pvt = poll(stream, UBXMessage("CFG", "CFG-MSG", POLL, msgClass=NAV_PVT[0], msgID=NAV_PVT[1]), CFG_MSG)
+    if pvt is None or len(pvt) < 8 or pvt[2 + UART1] != int(binary):
+        msg_pvt = UBXMessage("CFG", "CFG-MSG", SET, msgClass=NAV_PVT[0], msgID=NAV_PVT[1], rateUART1=int(binary))
+        if not send_acked(stream, msg_pvt):
+            return False, changed
+        changed = True
+
+    if poll_port(stream) != (baudrate, out_mask(binary)):
+        # the ACK may already come at the new baud rate, the caller verifies with a probe
+        stream.reset_input_buffer()
+        stream.write(port_message(baudrate, binary).serialize())
+        stream.flush()
+        changed = True
+    return True, changed
+
+
+def configure_ublox(port: str, rate_ms: int, baudrate: int, binary: bool = False, cache=UBLOX_CACHE) -> bool:
+    """Configure the receiver with as little traffic as possible, False if it did not answer."""
+    wanted = dict(port=port, rate_ms=rate_ms, baudrate=baudrate, binary=binary)
+    cached = load_cache(cache)
+    # rate and NAV-PVT were saved together with the port settings
+    if cached == wanted and port_matches(port, baudrate, binary):
+        return True
+
+    tic = time.monotonic()
+    baud = detect_baudrate(port, (cached.get("baudrate"), baudrate))
+    if baud is None:
+        logger.warning(f"ublox: no answer on {port}")
+        return False
+
+    with Serial(port, baud, timeout=PROBE_TIMEOUT) as stream:
+        ok, changed = configure(stream, rate_ms, baudrate, binary)
+    if not ok or not probe(port, baudrate):
+        logger.warning(f"ublox: configuration of {port} was not acknowledged")
+        return False
+
+    if changed:
+        with Serial(port, baudrate, timeout=PROBE_TIMEOUT) as stream:
+            msg_cfg = UBXMessage(
+                "CFG",
+                "CFG-CFG",
+                SET,
+                saveMask=b"\x1f\x1f\x00\x00",
+                devBBR=1,
+                devFlash=1,
+                devEEPROM=1,
+            )
+            saved = send_acked(stream, msg_cfg)
+        if not saved:
+            # runs from RAM now, the next start has to check everything again
+            logger.warning("ublox: saving the configuration was not acknowledged")
+            save_cache({}, cache)
+            return True
+    save_cache(wanted, cache)
+    logger.info(f"ublox: configured on {port} at {baudrate} baud in {time.monotonic() - tic:.2f} s")
+    return True
@@ -0,0 +1,153 @@
+"""
+UBX-NAV-PVT decoder for the ublox GPS stream.
+
+NAV-PVT carries position, velocity, accuracies, fix type and time of one
+navigation epoch in a single 92-byte message, so every message is one
+``GPSFix``. Frames are located in the bulk read buffer, checked with the
+UBX Fletcher checksum (vectorized) and unpacked in place with
+``struct.unpack_from`` at their offset; other UBX messages (ACKs etc.)
+and NMEA text are skipped.
+"""
+
+import struct
+
+import numpy as np
+
+from utils.nmea_parser import GPS_EPOCH_DAYS, GPSFix, days_from_civil, gps_week_time
+
+SYNC = b"\xb5\x62"
+NAV_PVT = (0x01, 0x07)
+NAV_PVT_STRUCT = struct.Struct("<IHBBBBBBIiBBBBiiiiIIiiiiiIIHB5xihH")
+# sync, class, id, length
+HEADER_SIZE = 6
+MAX_PAYLOAD = 1024
+
+# NAV-PVT valid and flags bits
+VALID_DATE = 0x01
+VALID_TIME = 0x02
+GNSS_FIX_OK = 0x01
+DIFF_SOLN = 0x02
+CARR_SOLN_SHIFT = 6
+# NAV-PVT fixType: 2 is 2D, 3 is 3D, 4 is GNSS + dead reckoning
+FIX_TYPES = (2, 3, 4)
+# GPS_INPUT fix_type for carrSoln 1 (float) and 2 (fixed)
+RTK_FIX_TYPES = {1: 5, 2: 6}
+
+
+def checksum(buffer, offset, count) -> bytes:
+    """UBX Fletcher-8 over ``count`` bytes of class, id, length and payload."""
+    data = np.frombuffer(buffer, dtype=np.uint8, count=count, offset=offset).astype(np.int64)
+    ck_a = data.sum()
+    # ck_b accumulates ck_a after every byte
+    ck_b = np.dot(data, np.arange(len(data), 0, -1))
+    return bytes((int(ck_a) & 0xFF, int(ck_b) & 0xFF))
+
+
+def gps_input_fix_type(fix_type: int, flags: int) -> int:
+    """
+    GPS_INPUT fix type for a NAV-PVT fix. NAV-PVT 4 (with dead reckoning)
+    is a 3D fix there, DGPS and RTK come from the diffSoln and carrSoln flags.
+    """
+    if fix_type == 2:
+        return 2
+    carr_soln = (flags >> CARR_SOLN_SHIFT) & 0x03
+    if carr_soln in RTK_FIX_TYPES:
+        return RTK_FIX_TYPES[carr_soln]
+    return 4 if flags & DIFF_SOLN else 3
+
+
+def decode_nav_pvt(buffer, offset=0) -> GPSFix | None:
+    (
+        itow, year, month, day, hour, minute, sec, valid, t_acc, nano,
+        fix_type, flags, flags2, num_sv, lon, lat, height, h_msl, h_acc, v_acc,
+        vel_n, vel_e, vel_d, g_speed, head_mot, s_acc, head_acc, p_dop, flags3,
+        head_veh, mag_dec, mag_acc,
+    ) = NAV_PVT_STRUCT.unpack_from(buffer, offset)
+    if fix_type not in FIX_TYPES or not flags & GNSS_FIX_OK:
+        return None
+    if valid & (VALID_DATE | VALID_TIME) != VALID_DATE | VALID_TIME:
+        return None
+
+    # UTC fields give the same time base as the NMEA path and VIO
+    ms_of_day = ((hour * 60 + minute) * 60 + sec) * 1000 + nano // 1000000
+    gps_week, gps_ms = gps_week_time(days_from_civil(year, month, day) - GPS_EPOCH_DAYS, ms_of_day)
+    dop = p_dop * 0.01
+    return GPSFix(
+        gps_week,
+        gps_ms,
+        lat * 1e-7,
+        lon * 1e-7,
+        h_msl * 1e-3,
+        # NAV-PVT has the position DOP only
+        dop,
+        dop,
+        vel_n * 1e-3,
+        vel_e * 1e-3,
+        True,
+        num_sv,
+        # GGA quality equivalent, GNSS fix
+        1,
+        veld=vel_d * 1e-3,
+        vel_vert_valid=fix_type != 2,
+        h_acc=h_acc * 1e-3,
+        v_acc=v_acc * 1e-3,
+        s_acc=s_acc * 1e-3,
+        fix_type=gps_input_fix_type(fix_type, flags),
+    )
+
+
+def split_frames(buffer) -> tuple[list[tuple[int, int, int, int]], int]:
+    """
+    Valid UBX frames in ``buffer`` as ``(class, id, payload offset, payload
+    length)`` and the number of bytes consumed; an incomplete frame at the
+    end is left for the next read.
+    """
+    frames = []
+    pos = 0
+    while True:
+        start = buffer.find(SYNC, pos)
+        if start < 0:
+            # keep a possible first sync byte
+            pos = len(buffer) - 1 if buffer.endswith(SYNC[:1]) else len(buffer)
+            break
+        if start + HEADER_SIZE > len(buffer):
+            pos = start
+            break
+        msg_class, msg_id, length = struct.unpack_from("<BBH", buffer, start + 2)
+        if length > MAX_PAYLOAD:
+            # false sync inside other data
+            pos = start + 1
+            continue
+        end = start + HEADER_SIZE + length + 2
+        if end > len(buffer):
+            pos = start
+            break
+        if buffer[end - 2:end] != checksum(buffer, start + 2, length + 4):
+            pos = start + 1
+            continue
+        frames.append((msg_class, msg_id, start + HEADER_SIZE, length))
+        pos = end
+    return frames, pos
+
+
+class UBXParser:
+    """Incremental parser with the ``NMEAParser`` interface."""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self._buffer = bytearray()
+
+    def feed(self, data: bytes) -> list[GPSFix]:
+        buffer = self._buffer
+        buffer += data
+        frames, consumed = split_frames(buffer)
+        fixes = []
+        for msg_class, msg_id, offset, length in frames:
+            if (msg_class, msg_id) == NAV_PVT and length == NAV_PVT_STRUCT.size:
+                fix = decode_nav_pvt(buffer, offset)
+                if fix is not None:
+                    fixes.append(fix)
+        del buffer[:consumed]
+        return fixes